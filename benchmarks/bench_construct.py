@@ -0,0 +1,51 @@
+"""
+Construction throughput for a table of 100k cells.
+
+Compares building the table with the general purpose `tag` constructor, which
+is what the `kemmering.html` factories used to delegate to, against the
+precomputed factories in `kemmering.html`.
+
+Run with::
+
+    $ python benchmarks/bench_construct.py
+"""
+import timeit
+
+from kemmering import tag
+from kemmering import html as h
+
+ROWS = 10000
+COLS = 10
+
+
+def generic():
+    table = tag('table')
+    for i in range(ROWS):
+        row = tag('tr', class_='row')
+        for j in range(COLS):
+            row(tag('td', class_=None)(tag('span')('x')))
+        table(row)
+    return table
+
+
+def factories():
+    table = h.table()
+    for i in range(ROWS):
+        row = h.tr(class_='row')
+        for j in range(COLS):
+            row(h.td(class_=None)(h.span()('x')))
+        table(row)
+    return table
+
+
+def main(number=3):
+    assert str(generic()) == str(factories())
+    cells = ROWS * COLS
+    for name, f in (('tag()', generic), ('html factories', factories)):
+        best = min(timeit.repeat(f, number=1, repeat=number))
+        print('{:<16} {:8.3f}s  {:10.0f} cells/s'.format(
+            name, best, cells / best))
+
+
+if __name__ == '__main__':
+    main()
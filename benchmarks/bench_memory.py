@@ -0,0 +1,81 @@
+"""
+Memory used by a table of 100k cells.
+
+Compares wrapping every string child in `kemmering.text`, which is what adding
+a string child used to do, against keeping plain strings as children.  Then
+compares a table of identical cells with and without `kemmering.freeze`, which
+shares identical subtrees.
+
+Run with::
+
+    $ python benchmarks/bench_memory.py
+"""
+import gc
+import timeit
+import tracemalloc
+
+from kemmering import freeze, text
+from kemmering import html as h
+
+ROWS = 10000
+COLS = 10
+
+
+def wrapped():
+    table = h.table()
+    for i in range(ROWS):
+        row = h.tr()
+        for j in range(COLS):
+            row(h.td()(text('cell {} {}'.format(i, j))))
+        table(row)
+    return table
+
+
+def plain():
+    table = h.table()
+    for i in range(ROWS):
+        row = h.tr()
+        for j in range(COLS):
+            row(h.td()('cell {} {}'.format(i, j)))
+        table(row)
+    return table
+
+
+def icons():
+    table = h.table()
+    for i in range(ROWS):
+        row = h.tr()
+        for j in range(COLS):
+            row(h.td(class_='status')(h.i(class_='icon icon-ok'), h.br()))
+        table(row)
+    return table
+
+
+def frozen_icons():
+    return freeze(icons())
+
+
+def measure(f):
+    gc.collect()
+    tracemalloc.start()
+    table = f()
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del table
+    return size
+
+
+def main(number=3):
+    assert str(wrapped()) == str(plain())
+    assert str(icons()) == str(frozen_icons())
+    for name, f in (('text() children', wrapped), ('str children', plain),
+                    ('icons', icons), ('frozen icons', frozen_icons)):
+        size = measure(f)
+        best = min(timeit.repeat(f, number=1, repeat=number))
+        print('{:<16} {:8.1f} MiB  {:8.3f}s'.format(
+            name, size / 2.0 ** 20, best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Minifying a typical, indented, listing page.
+
+Compares the size of the output, and the time to render it, for the page as
+it is written, the page minified with `kemmering.minify.minify`, and the page
+minified for HTML5.
+
+Run with::
+
+    $ python benchmarks/bench_minify.py
+"""
+import timeit
+
+from kemmering import in_context, loop, render
+from kemmering import html as h
+from kemmering.minify import minify
+
+ITEMS = 200
+ROUNDS = 200
+
+
+def page():
+    return h.doc(h.html(lang='en')(
+        '\n  ',
+        h.head()(
+            '\n    ', h.title()('\n      Products\n    '),
+            '\n    ', h.style(
+                ('body', {'font-family': 'sans-serif', 'margin': '0'}),
+                ('.product', {'padding': '1em', 'border-bottom': '1px solid'}),
+                ('.price', {'font-weight': 'bold'})),
+            '\n  '),
+        '\n  ',
+        h.body()(
+            '\n    ', h.h1()('\n      Our products\n    '),
+            '\n    ', h.ul(class_='products')(loop('item', 'items', h.li(
+                class_='product')(
+                    '\n        ', h.h2()(in_context(['item', 'name'])),
+                    '\n        ', h.p(class_='price')(
+                        '\n          Price: ', in_context(['item', 'price']),
+                        '\n        '),
+                    '\n        ', h.p()(in_context(['item', 'description'])),
+                    '\n      '))),
+            '\n  '),
+        '\n'))
+
+
+def context():
+    return {'items': [{
+        'name': 'Product {}'.format(i),
+        'price': '{:.2f}'.format(i * 1.25),
+        'description': 'A  fine product,\n  number {}.'.format(i),
+    } for i in range(ITEMS)]}
+
+
+def main(number=5):
+    data = context()
+    full = page()
+    for name, template in (('as written', full),
+                           ('minify', minify(full)),
+                           ('minify html5', minify(full, html5=True))):
+        size = len(render(template, data).encode('utf-8'))
+        best = min(timeit.repeat(lambda: render(template, data),
+                                 number=ROUNDS, repeat=number))
+        print('{:<14} {:8d} bytes  {:8.3f}s  {:8.0f} renders/s'.format(
+            name, size, best, ROUNDS / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Choosing one of 20 variants of a snippet.
+
+Compares a chain of 20 nested `cond` elements, which tests each condition in
+turn, against a single `switch`, which looks up the variant in a dictionary.
+Each template is rendered once for each variant.
+
+Run with::
+
+    $ python benchmarks/bench_switch.py
+"""
+import timeit
+
+from kemmering import cond, render, switch
+from kemmering import html as h
+
+BRANCHES = 20
+ROUNDS = 1000
+
+
+def variants():
+    return [(i, h.span(class_='badge-{}'.format(i))('Status {}'.format(i)))
+            for i in range(BRANCHES)]
+
+
+def cond_chain():
+    template = h.span(class_='badge')('Unknown')
+    for i, variant in reversed(variants()):
+        template = cond(lambda context, i=i: context['status'] == i,
+                        variant, template)
+    return h.div()(template)
+
+
+def switched():
+    return h.div()(switch('status', variants(), h.span(class_='badge')(
+        'Unknown')))
+
+
+def run(template):
+    contexts = [{'status': i} for i in range(BRANCHES + 1)]
+
+    def f():
+        for context in contexts:
+            render(template, context)
+    return f
+
+
+def main(number=5):
+    chain, table = cond_chain(), switched()
+    for i in range(BRANCHES + 1):
+        context = {'status': i}
+        assert render(chain, context) == render(table, context)
+    renders = ROUNDS * (BRANCHES + 1)
+    for name, template in (('cond chain', chain), ('switch', table)):
+        best = min(timeit.repeat(run(template), number=ROUNDS, repeat=number))
+        print('{:<12} {:8.3f}s  {:10.0f} renders/s'.format(
+            name, best, renders / best))
+
+
+if __name__ == '__main__':
+    main()
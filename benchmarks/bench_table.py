@@ -0,0 +1,61 @@
+"""
+Rendering a report table of 50k rows by 12 columns.
+
+Compares a `loop` over the rows containing a `loop` over the cells of each
+row, against `kemmering.html.tablerows` with the same data arranged in
+columns.  If NumPy is installed, `tablerows` is also timed with the columns as
+NumPy arrays.
+
+Run with::
+
+    $ python benchmarks/bench_table.py
+"""
+import timeit
+
+from kemmering import from_context, loop, render
+from kemmering import html as h
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+ROWS = 50000
+COLS = 12
+
+
+def columns():
+    return [[(i * COLS + j) * 0.25 for i in range(ROWS)]
+            for j in range(COLS)]
+
+
+def loops():
+    def cells(context):
+        return ['{:.2f}'.format(value) for value in context['row']]
+
+    return h.table()(loop('row', lambda c: zip(*c['columns']), h.tr()(
+        loop('cell', cells, h.td(class_='n')(from_context('cell'))))))
+
+
+def table():
+    return h.table()(h.tablerows(
+        'columns', formats=['{:.2f}'] * COLS, attrs=[{'class_': 'n'}] * COLS))
+
+
+def main(number=3):
+    data = {'columns': columns()}
+    cases = [('nested loops', loops(), data), ('tablerows', table(), data)]
+    if numpy is not None:
+        cases.append(('tablerows numpy', table(),
+                      {'columns': [numpy.array(c) for c in data['columns']]}))
+    expected = render(loops(), data)
+    for name, template, context in cases:
+        assert render(template, context) == expected
+        best = min(timeit.repeat(lambda: render(template, context),
+                                 number=1, repeat=number))
+        print('{:<16} {:8.3f}s  {:10.0f} cells/s'.format(
+            name, best, ROWS * COLS / best))
+
+
+if __name__ == '__main__':
+    main()
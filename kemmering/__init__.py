@@ -1,11 +1,46 @@
+import re
+import string
 import sys
+import threading
+import time
+import weakref
 from xml.sax.saxutils import escape
 
+try:
+    from types import MappingProxyType as _frozendict
+except ImportError:  # pragma: no cover
+    _frozendict = dict
+
 
 PY2 = sys.version_info[0] == 2
 strbase = basestring if PY2 else str  # nopep8
 strclass = unicode if PY2 else str    # nopep8
 
+_unbound = object()
+_formatter = string.Formatter()
+_clock = getattr(time, 'monotonic', time.time)
+_plaintext = frozenset((str, strclass))
+
+
+class _markup(strclass):
+    """
+    A chunk of serialized static markup, as produced when streaming a
+    template.  Remembers its encoded forms, so static markup is only encoded
+    once per encoding.
+    """
+
+    _encoded = None
+
+    def _bytes(self, encoding, encode):
+        # `encode` encodes a chunk in `encoding`, without a byte order mark.
+        encoded = self._encoded
+        if encoded is None:
+            encoded = self._encoded = {}
+        data = encoded.get(encoding)
+        if data is None:
+            data = encoded[encoding] = encode(self)
+        return data
+
 
 class tag(object):
     """
@@ -25,6 +60,7 @@ class tag(object):
 
     """
     self_closing = False
+    _key = None
 
     def __init__(self, tag, **attrs):
         self._init(tag, attrs, ())
@@ -40,19 +76,34 @@ class tag(object):
         self._extend(*children)
 
     def _extend(self, *children):
-        def mkchild(x):
-            if isinstance(x, strbase) and not isinstance(x, text):
-                x = text(x)
-            x.parent = self
-            return x
-        self.children += tuple(mkchild(x) for x in children)
+        if self._key is not None:
+            raise TypeError("Frozen tag, unable to add children.")
+        # Plain strings are kept as they are and escaped when serialized.
+        added = []
+        for x in children:
+            if x.__class__ not in _plaintext:
+                if isinstance(x, strbase) and not isinstance(x, text):
+                    x = text(x)
+                parent = getattr(x, 'parent', None)
+                if parent is not None and parent is not self and (
+                        isinstance(x, tag)):
+                    x._adopt(parent)
+                x.parent = self
+            added.append(x)
+        self.children += tuple(added)
+        self._invalidate()
         return self
 
     __call__ = _extend
 
     def _bind(self, context):
-        attrs = {k: bind(v, context) for k, v in self.attrs.items()}
-        children = tuple(bind(child, context) for child in self.children)
+        try:
+            attrs = {k: _realize(v, context) for k, v in self.attrs.items()}
+            children = tuple(
+                _realize(child, context) for child in self.children)
+        except BudgetExceeded as e:
+            e._enter(self)
+            raise
         return self._copy(attrs, children)
 
     def _copy(self, attrs, children):
@@ -62,6 +113,24 @@ class tag(object):
         obj.self_closing = self.self_closing
         return obj
 
+    def __eq__(self, other):
+        # Frozen tags compare by structure, others by identity.
+        if self is other:
+            return True
+        if self._key is None or not isinstance(other, tag) or (
+                other._key is None):
+            return NotImplemented
+        return self._hash == other._hash and self._key == other._key
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        if self._key is None:
+            return object.__hash__(self)
+        return self._hash
+
     def __str__(self):
         return ''.join(self._stream())
 
@@ -85,8 +154,9 @@ class tag(object):
         else:
             return 'notag{}'.format(children)
 
-    def _stream(self):
-        attrs = {k: v for k, v in self.attrs.items()}
+    def _open(self, attrs):
+        if not self.tag:
+            return ''
         if attrs:
             attrs = ' ' + ' '.join(
                 ('%s="%s"' % (k.rstrip('_'), v) for k, v in attrs.items())
@@ -95,16 +165,149 @@ class tag(object):
             attrs = ''
 
         if self.self_closing and not self.children:
-            yield '<%s%s/>' % (self.tag, attrs)
-            return
+            return '<%s%s/>' % (self.tag, attrs)
+        return '<%s%s>' % (self.tag, attrs)
+
+    def _close(self):
+        if not self.tag or (self.self_closing and not self.children):
+            return ''
+        return '</%s>' % self.tag
+
+    def _stream(self, context=_unbound):
+        if context is not _unbound:
+            return self._render(context)
+        return self._serialize()
 
+    def _serialize(self):
         if self.tag:
-            yield '<%s%s>' % (self.tag, attrs)
+            yield self._open(self.attrs)
+            if self.self_closing and not self.children:
+                return
         for child in self.children:
-            for x in child._stream():
-                yield x
+            if child.__class__ in _plaintext:
+                yield escape(child)
+            else:
+                for x in child._stream():
+                    yield x
         if self.tag:
-            yield '</%s>' % self.tag
+            yield self._close()
+
+    def _render(self, context):
+        # Streams the tag as a template.  Static markup is compiled once into
+        # `_markup` chunks and reused by every subsequent render.
+        try:
+            for part in self._parts():
+                if part.__class__ is _markup:
+                    yield part
+                elif part is None:
+                    attrs = {k: _realize(v, context)
+                             for k, v in self.attrs.items()}
+                    yield self._open({k: v for k, v in attrs.items()
+                                      if v is not None})
+                else:
+                    for x in _render(part, context):
+                        yield x
+        except BudgetExceeded as e:
+            e._enter(self)
+            raise
+
+    def _parts(self):
+        # The compiled form of the tag, a sequence of `_markup` chunks, `None`
+        # for a start tag with deferred attributes, and dynamic children.
+        plan = self.__dict__.get('_plan')
+        if plan is None:
+            self._watch()
+            plan = self._plan = self._compile()
+        return plan
+
+    def _compile(self):
+        parts = []
+        markup = []
+        if all(_is_static(v) for v in self.attrs.values()):
+            markup.append(self._open(self.attrs))
+        else:
+            parts.append(None)
+        for child in self.children:
+            if _is_static(child):
+                markup.extend(_render(child, _unbound))
+            else:
+                markup = ''.join(markup)
+                if markup:
+                    parts.append(_markup(markup))
+                markup = []
+                parts.append(child)
+        markup.append(self._close())
+        markup = ''.join(markup)
+        if markup:
+            parts.append(_markup(markup))
+        return tuple(parts)
+
+    def _is_static(self):
+        static = self.__dict__.get('_static')
+        if static is None:
+            self._watch()
+            static = self._static = (
+                all(_is_static(v) for v in self.attrs.values()) and
+                all(_is_static(child) for child in self.children))
+        return static
+
+    def _invalidate(self):
+        # Discards compiled markup for this tag and any of its ancestors
+        # which might have incorporated it.
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            cached = node.__dict__
+            if '_static' not in cached and '_plan' not in cached and (
+                    '_indexed' not in cached):
+                continue
+            cached.pop('_static', None)
+            cached.pop('_plan', None)
+            cached.pop('_indexed', None)
+            cached.pop('_index', None)
+            parent = cached.get('parent')
+            if parent is not None:
+                nodes.append(parent)
+            nodes.extend(cached.get('_parents', ()))
+
+    def _adopt(self, parent):
+        # Remembers a previous parent, as a tag may be the child of more than
+        # one tag, all of which are invalidated when it changes.
+        parents = self.__dict__.get('_parents')
+        if parents is None:
+            parents = self._parents = weakref.WeakSet()
+        parents.add(parent)
+
+    def _watch(self):
+        # Makes changes to the attributes discard anything cached for the tag.
+        # Called before anything is cached.
+        if self.attrs.__class__ is dict:
+            self.attrs = _attrs(self, self.attrs)
+
+
+class _attrs(dict):
+    # The attributes of a tag which has cached something derived from them.
+
+    def __init__(self, owner, attrs):
+        super(_attrs, self).__init__(attrs)
+        self.owner = owner
+
+    def _changed(method):
+        def changed(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self.owner._invalidate()
+            return result
+        changed.__name__ = method.__name__
+        return changed
+
+    __setitem__ = _changed(dict.__setitem__)
+    __delitem__ = _changed(dict.__delitem__)
+    clear = _changed(dict.clear)
+    pop = _changed(dict.pop)
+    popitem = _changed(dict.popitem)
+    setdefault = _changed(dict.setdefault)
+    update = _changed(dict.update)
+    del _changed
 
 
 class notag(tag):
@@ -140,13 +343,13 @@ _nothing = notag()
 
 class text(strclass):
 
-    def _stream(self):
+    def _stream(self, context=_unbound):
         yield escape(self)
 
 
 class cdata(text):
 
-    def _stream(self):
+    def _stream(self, context=_unbound):
         yield '<![CDATA['
         yield self
         yield ']]>'
@@ -164,24 +367,598 @@ class cdata(text):
         )
 
 
-def bind(template, context):
+class _flushmark(strclass):
+    # The type of `FLUSH`, so it can't be confused with an empty string.
+    pass
+
+
+FLUSH = _flushmark('')
+
+
+class flush(object):
+    """
+    Mark a point in a template at which output should be sent to the client.
+
+    When a template is streamed, the output so far is passed on as soon as it
+    is produced, but the sinks which consume the output, such as
+    :func:`kemmering.output.stream_compressed` or
+    :class:`kemmering.writer.writer`, usually buffer it, so that it can be
+    sent efficiently.  Where a `flush` element is in a template, a streaming
+    sink sends on everything it has buffered before asking for more output.
+    Since deferred elements are only realized as the output reaches them, none
+    of the deferred elements after the `flush` are realized until the output
+    before it has been handed to the sink.  This is useful to send the `head`
+    of a page, which tells the browser what stylesheets and scripts to fetch,
+    before rendering a slow body.
+
+    When streamed, a `flush` element yields `FLUSH`, which is an empty
+    string, so it has no effect on consumers which don't look for it.
+
+    .. doctest:: api-flush
+
+       >>> from kemmering import FLUSH, flush, from_context, stream, tag
+       >>> template = tag('html')(
+       ...     tag('head')(tag('title')('Hello')), flush(),
+       ...     tag('body')(from_context('body')))
+       >>> chunks = list(stream(template, {'body': 'World'}))
+       >>> chunks[:3]
+       ['<html><head><title>Hello</title></head>', '', '<body>']
+       >>> chunks[1] is FLUSH
+       True
+    """
+
+    def _bind(self, context):
+        return self
+
+    def _stream(self, context=_unbound):
+        yield FLUSH
+
+    def _is_static(self):
+        return False
+
+    def __repr__(self):
+        return 'flush()'
+
+
+def bind(template, context, lazy=False, timeout=None):
     """
     Realize a template by binding it to a context.
 
     `template` is a `tag` instance which should contain some instances of
     `defer` in its structure.  `context` is the context object that is passed
-    to deferred functions in the template.  Most template helpers assume the
-    context is a dictionary.
+    to deferred functions in the template.  The template helpers look up
+    values in the context using its accessor: dictionaries and other objects
+    with a `get` method are looked up by key, and any other object, such as a
+    named tuple or a dataclass, by attribute.  See `register_accessor`.
 
     Returns new `tag` instance that is a copy of the template with any
     deferred elements replaced by the return values of their deferred
     functions.
+
+    If `lazy` is `True`, the returned `tag` is instead a view of the template
+    which is bound on demand.  The `attrs` and `children` of each tag in the
+    view are bound the first time they are accessed, and then remembered.  This
+    is useful when only part of a bound template will be looked at.
+
+    .. doctest:: api-bind
+
+       >>> from kemmering import bind, defer, tag
+       >>> def title(context):
+       ...     print('title')
+       ...     return context['title']
+       >>> def body(context):
+       ...     print('body')
+       ...     return context['body']
+       >>> template = tag('html')(
+       ...     tag('head')(tag('title')(defer(title))),
+       ...     tag('body')(defer(body)))
+       >>> bound = bind(template, {'title': 'a', 'body': 'b'}, lazy=True)
+       >>> head = bound.children[0]
+       >>> str(head)
+       title
+       '<head><title>a</title></head>'
+       >>> str(bound)
+       body
+       '<html><head><title>a</title></head><body>b</body></html>'
+
+    If `timeout` is given, binding is aborted with `BudgetExceeded` if it
+    takes longer than `timeout` seconds.  The time is checked as each deferred
+    element is realized and on each iteration of a `loop`.
     """
+    if timeout is None and getattr(_local, 'scope', None) is not None:
+        return _realize(template, context, lazy)
+    previous = _enter(_scope(timeout))
+    try:
+        return _realize(template, context, lazy)
+    finally:
+        _local.scope = previous
+
+
+def _realize(template, context, lazy=False):
+    if lazy and isinstance(template, tag):
+        return _viewclass(type(template))(template, context)
     if hasattr(template, '_bind'):
         template = template._bind(context)
     return template
 
 
+_local = threading.local()
+
+
+class _scope(object):
+    # State shared by everything realized during a single call to `bind` or
+    # `stream`.  The scope for the current thread is `_local.scope`.
+
+    limited = False
+    placeholders = False
+    # Set when output depends on state kept for the rest of the render, such
+    # as the rules collected by `shared_style`, so can't be reused by
+    # `incremental` in a later render.
+    shared = False
+
+    def __init__(self, timeout=None, max_size=None):
+        self.memo = {}
+        self.lazy = {}
+        if timeout is not None or max_size is not None:
+            self.limited = True
+            self.timeout = timeout
+            self.deadline = None if timeout is None else _clock() + timeout
+            self.max_size = max_size
+            self.size = 0
+
+    def check(self):
+        # Called as deferred elements are realized, and on each iteration of a
+        # loop, if the scope is limited.
+        if self.max_size is not None and self.size > self.max_size:
+            raise BudgetExceeded(
+                'Output is larger than {} characters'.format(self.max_size))
+        if self.deadline is not None and _clock() > self.deadline:
+            raise BudgetExceeded(
+                'Took longer than {} seconds'.format(self.timeout))
+
+
+def _check():
+    scope = getattr(_local, 'scope', None)
+    if scope is not None and scope.limited:
+        scope.check()
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised when realizing a template takes longer, or produces more output,
+    than is allowed by the `timeout` or `max_size` passed to `bind`, `stream`
+    or `render`.
+
+    `path` is the list of the names of the tags, from the outermost to the
+    innermost, which were being realized when the limit was found to be
+    exceeded.
+    """
+
+    def __init__(self, message):
+        super(BudgetExceeded, self).__init__(message)
+        self.message = message
+        self.path = []
+
+    def _enter(self, node):
+        if node.tag:
+            self.path.insert(0, node.tag)
+
+    def __str__(self):
+        if not self.path:
+            return self.message
+        return '{} at {}'.format(self.message, '/'.join(self.path))
+
+
+def _enter(scope):
+    # Makes `scope` current, returning the previously current scope, which
+    # the caller must restore.
+    previous = getattr(_local, 'scope', None)
+    _local.scope = scope
+    return previous
+
+
+class _placeholder(strclass):
+    # A chunk of output which can't be produced until the rest of the output
+    # has been, such as a summary of things found in the rest of the output.
+    # The chunk itself is empty.  Calling `resolve` returns the output.
+
+    def __new__(cls, resolve):
+        chunk = strclass.__new__(cls, '')
+        chunk.resolve = resolve
+        return chunk
+
+
+def _placeheld(resolve):
+    # Returns a placeholder chunk, for output which is produced by calling
+    # `resolve` once the rest of the output has been produced.  When
+    # streaming, the output following the placeholder is buffered until then.
+    _local.scope.placeholders = True
+    return _placeholder(resolve)
+
+
+def _counted(chunks, scope):
+    # Counts the size of the output.  The size is checked where deferred
+    # elements are realized and on each iteration of a loop, so the path to
+    # where the limit was exceeded can be reported, and once more at the end.
+    for chunk in chunks:
+        scope.size += len(chunk)
+        yield chunk
+    if scope.max_size is not None:
+        scope.check()
+
+
+def _scoped(chunks, scope):
+    # Iterates `chunks`, a generator, with `scope` current while the generator
+    # runs.  Generators may be interleaved, so the scope can't simply be set
+    # for the lifetime of the generator.
+    local = _local
+    chunks = iter(chunks)
+    while True:
+        previous = getattr(local, 'scope', None)
+        local.scope = scope
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            local.scope = previous
+        if chunk.__class__ is _placeholder:
+            rest = list(_scoped(chunks, scope))
+            previous = getattr(local, 'scope', None)
+            local.scope = scope
+            try:
+                yield chunk.resolve()
+            finally:
+                local.scope = previous
+            for chunk in rest:
+                yield chunk
+            return
+        yield chunk
+
+
+_interned = weakref.WeakValueDictionary()
+
+
+def freeze(snippet):
+    """
+    Make a snippet immutable.
+
+    Returns a frozen copy of `snippet`, a `tag` or `notag`.  Children can't be
+    added to a frozen tag and its attributes can't be changed.  Frozen tags
+    are hashable and compare equal to frozen tags with the same structure.
+
+    Frozen tags are interned: freezing a snippet which is identical to one that
+    has already been frozen, and is still in use, returns the existing frozen
+    snippet.  This is done for each tag in the snippet, so identical subtrees,
+    across any number of frozen snippets, share a single instance.  Because
+    they can't change, frozen snippets can be safely shared between threads,
+    along with any markup cached for them by `stream` and `render`.
+
+    Attribute values in a frozen snippet must be hashable.
+
+    .. doctest:: api-freeze
+
+       >>> from kemmering import freeze, tag
+       >>> a = freeze(tag('a')(tag('b', c='d')('e')))
+       >>> b = freeze(tag('f')(tag('b', c='d')('e')))
+       >>> a.children[0] is b.children[0]
+       True
+       >>> a == freeze(tag('a')(tag('b', c='d')('e')))
+       True
+       >>> a(tag('g'))
+       Traceback (most recent call last):
+       ...
+       TypeError: Frozen tag, unable to add children.
+    """
+    if not isinstance(snippet, tag) or snippet._key is not None:
+        return snippet
+
+    cls = type(snippet)
+    if isinstance(snippet, _view):
+        cls = type(snippet._template)
+    attrs = tuple(snippet.attrs.items())
+    children = tuple(freeze(child) for child in snippet.children)
+    key = (cls, snippet.tag, snippet.self_closing, attrs, tuple(
+        child if isinstance(child, tag) else (child.__class__, child)
+        for child in children))
+    frozen = _interned.get(key)
+    if frozen is None:
+        frozen = cls.__new__(cls)
+        frozen.tag = snippet.tag
+        frozen.self_closing = snippet.self_closing
+        frozen.attrs = _frozendict(dict(attrs))
+        frozen.children = children
+        frozen._hash = hash(key)
+        frozen._key = key
+        frozen = _interned.setdefault(key, frozen)
+    return frozen
+
+
+class _view(object):
+    # Mixin for a view of a template which is bound on demand.  See
+    # `_viewclass`.
+
+    def __init__(self, template, context):
+        self._template = template
+        self._context = context
+        self._scope = _local.scope
+
+    @property
+    def tag(self):
+        return self._template.tag
+
+    @property
+    def self_closing(self):
+        return self._template.self_closing
+
+    @property
+    def attrs(self):
+        attrs = self.__dict__.get('_attrs')
+        if attrs is None:
+            context = self._context
+            previous = _enter(self._scope)
+            try:
+                attrs = {k: _realize(v, context)
+                         for k, v in self._template.attrs.items()}
+            finally:
+                _local.scope = previous
+            attrs = self._attrs = {k: v for k, v in attrs.items()
+                                   if v is not None}
+        return attrs
+
+    @property
+    def children(self):
+        children = self.__dict__.get('_children')
+        if children is None:
+            context = self._context
+            previous = _enter(self._scope)
+            try:
+                children = self._children = tuple(
+                    _realize(child, context, lazy=True)
+                    for child in self._template.children)
+            finally:
+                _local.scope = previous
+        return children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+    def _copy(self, attrs, children):
+        return self._template._copy(attrs, children)
+
+    def _watch(self):
+        # Views are bound, so never change.
+        pass
+
+    def _is_static(self):
+        # Bound children are static, unless they act as they are streamed,
+        # like `flush`.
+        return all(_is_static(child) for child in self.children)
+
+
+_viewclasses = {}
+
+
+def _viewclass(cls):
+    # Views are instances of a subclass of the template's own class, so they
+    # behave like the template, with `_view` overriding attribute access.
+    viewclass = _viewclasses.get(cls)
+    if viewclass is None:
+        viewclass = _viewclasses[cls] = type(cls.__name__, (_view, cls), {})
+    return viewclass
+
+
+def stream(template, context, timeout=None, max_size=None, select=None):
+    """
+    Realize a template incrementally.
+
+    Binds `template` to `context` while serializing it, returning an iterator
+    over chunks of the output.  Unlike `bind`, no bound copy of the template
+    is made: deferred elements are realized as the output reaches them.
+    Static parts of the template are serialized once, on first use, and the
+    serialized markup is reused by later renders of the same template.
+
+    .. doctest:: api-stream
+
+       >>> from kemmering import from_context, stream, tag
+       >>> template = tag('a')(tag('b')('c'), from_context('d'))
+       >>> list(stream(template, {'d': 'e'}))
+       ['<a><b>c</b>', 'e', '</a>']
+
+    If `timeout` is given, streaming is aborted with `BudgetExceeded` if it
+    takes longer than `timeout` seconds, measured from the call to `stream`.
+    If `max_size` is given, streaming is aborted with `BudgetExceeded` once the
+    output is larger than `max_size` characters.  The limits are checked as
+    each deferred element is realized, on each iteration of a `loop`, and at
+    the end of the output, so the output may exceed `max_size` by up to the
+    size of the static markup between two such points.
+
+    .. doctest:: api-stream
+
+       >>> from kemmering import loop
+       >>> items = loop('i', 'items', tag('li')(from_context('i')))
+       >>> template = tag('ul')(items)
+       >>> ''.join(stream(template, {'items': 'abcdef'}, max_size=20))
+       Traceback (most recent call last):
+       ...
+       kemmering.BudgetExceeded: Output is larger than 20 characters at ul
+
+    If `select` is given, only the element it selects is realized, as for
+    `find`.
+    """
+    if select is not None:
+        template = _select(template, select)
+    if timeout is None and max_size is None:
+        scope = getattr(_local, 'scope', None) or _scope()
+        return _scoped(_render(template, context), scope)
+    scope = _scope(timeout, max_size)
+    return _scoped(_counted(_render(template, context), scope), scope)
+
+
+def render(template, context, timeout=None, max_size=None, select=None):
+    """
+    Realize a template as a string.
+
+    Equivalent to `str(bind(template, context))`, but implemented using
+    `stream`.
+
+    .. doctest:: api-render
+
+       >>> from kemmering import from_context, render, tag
+       >>> render(tag('a')(from_context('b')), {'b': 'c'})
+       '<a>c</a>'
+
+    `timeout`, `max_size` and `select` are as for `stream`.  With `select`,
+    a single region of a page can be rendered, for a partial update, without
+    realizing any of the deferred elements in the rest of the page.
+
+    .. doctest:: api-render
+
+       >>> from kemmering import defer
+       >>> def slow(context):
+       ...     raise AssertionError('not rendered')
+       >>> template = tag('body')(defer(slow), tag('div', id='cart')(
+       ...     from_context('items')))
+       >>> render(template, {'items': '3 items'}, select='#cart')
+       '<div id="cart">3 items</div>'
+    """
+    if select is not None:
+        template = _select(template, select)
+    if timeout is None and max_size is None:
+        scope = getattr(_local, 'scope', None) or _scope()
+        previous = _enter(scope)
+        chunks = _render(template, context)
+    else:
+        scope = _scope(timeout, max_size)
+        previous = _enter(scope)
+        chunks = _counted(_render(template, context), scope)
+    try:
+        chunks = list(chunks)
+        if scope.placeholders:
+            chunks = [chunk.resolve() if chunk.__class__ is _placeholder
+                      else chunk for chunk in chunks]
+        return ''.join(chunks)
+    finally:
+        _local.scope = previous
+
+
+def find(template, selector):
+    """
+    Find an element in a template.
+
+    `selector` is a simple CSS selector: a tag name, an id, such as
+    `'#cart'`, one or more class names, such as `'.item'`, or a combination
+    of these, such as `'div#cart.wide'`.  Returns the first `tag` in the
+    template which matches, in document order, which can then be passed to
+    `bind`, `stream` or `render`.  Raises `KeyError` if there isn't one.
+
+    Only elements whose ancestors are all tags can be found, not elements in
+    the snippets of deferred elements, such as `cond` or `loop`, and only
+    static `id` and `class` attributes are matched.  Finding them is cheap:
+    the first time a template is searched, an index of its elements is made,
+    which is used until the template is changed.
+
+    .. doctest:: api-find
+
+       >>> from kemmering import find, tag
+       >>> template = tag('body')(tag('div', id='a', class_='b c')('d'))
+       >>> find(template, 'div.c')
+       tag('div', id='a', class_='b c')('d')
+    """
+    return _select(template, selector)
+
+
+_selector = re.compile(r'^([A-Za-z][\w-]*)?((?:[#.][\w-]+)*)$')
+_selectorpart = re.compile(r'([#.])([\w-]+)')
+
+
+def _select(template, selector):
+    match = _selector.match(selector)
+    if match is None or not selector:
+        raise ValueError('Unsupported selector: {}'.format(selector))
+    name, rest = match.groups()
+    ids = []
+    classes = []
+    for kind, value in _selectorpart.findall(rest):
+        (ids if kind == '#' else classes).append(value)
+    index = _index(template)
+    if ids:
+        candidates = index.ids.get(ids[0], ())
+    elif classes:
+        candidates = index.classes.get(classes[0], ())
+    else:
+        candidates = index.tags.get(name, ())
+    for node, node_id, node_classes in candidates:
+        if (name is None or node.tag == name) and all(
+                node_id == i for i in ids) and node_classes.issuperset(
+                classes):
+            return node
+    raise KeyError(selector)
+
+
+class _tagindex(object):
+    # The elements of a template, by tag name, id and class.  Each maps to a
+    # list, in document order, of tuples of an element, its id and its set of
+    # classes.
+
+    def __init__(self):
+        self.tags = {}
+        self.ids = {}
+        self.classes = {}
+
+
+def _index(template):
+    # Returns the index for a template, making it if need be.  Every tag
+    # which is indexed is marked, so that changing it discards the index.
+    index = template.__dict__.get('_index') if isinstance(
+        template, tag) else None
+    if index is None:
+        index = _tagindex()
+        _indexed(template, index)
+        if isinstance(template, tag):
+            template._index = index
+    return index
+
+
+def _indexed(node, index):
+    if not isinstance(node, tag):
+        return
+    node._watch()
+    node._indexed = True
+    if node.tag:
+        attrs = node.attrs
+        node_id = attrs.get('id')
+        if not isinstance(node_id, strbase):
+            node_id = None
+        node_classes = attrs.get('class_', attrs.get('class'))
+        node_classes = frozenset(node_classes.split() if isinstance(
+            node_classes, strbase) else ())
+        entry = (node, node_id, node_classes)
+        index.tags.setdefault(node.tag, []).append(entry)
+        if node_id is not None:
+            index.ids.setdefault(node_id, []).append(entry)
+        for name in node_classes:
+            index.classes.setdefault(name, []).append(entry)
+    for child in node.children:
+        _indexed(child, index)
+
+
+def _render(value, context):
+    if isinstance(value, strbase) and not isinstance(value, text):
+        return iter((escape(value),))
+    return value._stream(context)
+
+
+def _is_static(value):
+    if isinstance(value, strbase):
+        return True
+    is_static = getattr(value, '_is_static', None)
+    if is_static is not None:
+        return is_static()
+    return not hasattr(value, '_bind')
+
+
 class defer(object):
     """
     Defer the realization of a part of a template until a later time.
@@ -199,8 +976,9 @@ class defer(object):
            "Return a `tag`, `notag`, or string."
 
     The function will be called at realization time when `bind` is called on
-    the containing snippet and passed the context object.  Most template
-    helpers assume the context is a dictionary.
+    the containing snippet and passed the context object.  Inside a `loop`
+    over a context which isn't a dictionary, the context object passed is a
+    chained context which supports `get`, item access and attribute access.
 
     Instances of `defer` may be used as children of `tag` objects or as values
     of tag atrributes.  When used as a child of a tag, the return value should
@@ -209,18 +987,33 @@ class defer(object):
     Setting an attribute to `None` causes it to be omitted from the realized
     template.
 
+    `cache_key` is an optional function which accepts a single argument,
+    `context`, and returns a value which determines the output of `f`: if two
+    contexts give the same `cache_key`, `f` returns the same thing for both.
+    It is used by :func:`kemmering.etag.etag`.
+
     Most use cases for `defer` are actually covered by more specific helpers
     based on `defer`, described below.
     """
+    cache_key = None
 
-    def __init__(self, f):
+    def __init__(self, f, cache_key=None):
         self.f = f
+        self.cache_key = cache_key
+
+    def _resolve(self, context):
+        return self.f(context)
 
     def _bind(self, context):
-        return bind(self.f(context), context)
+        _check()
+        return _realize(self._resolve(context), context)
 
-    def _stream(self):
-        raise ValueError("Unbound defer, unable to stream.")
+    def _stream(self, context=_unbound):
+        if context is _unbound:
+            raise ValueError("Unbound defer, unable to stream.")
+        _check()
+        for x in _render(self._resolve(context), context):
+            yield x
 
     def __repr__(self):
         return '{}({})'.format(
@@ -228,12 +1021,242 @@ class defer(object):
             getattr(self.f, '__name__', repr(self.f)))
 
 
+class memo(defer):
+    """
+    This specialization of `defer` remembers the return value of its deferred
+    function for the remainder of a single call to `bind` or `stream`.
+
+    `f` is the deferred function, as for `defer`.  `keys` is a sequence of
+    names of keys in the bind context whose values the deferred function
+    depends on.  The deferred function is called the first time the `memo` is
+    realized.  Later, for the rest of the same `bind` or `stream`, any `memo`
+    with the same deferred function and `keys`, realized with the same values
+    for `keys` in the bind context, reuses that return value rather than
+    calling the function again.  This includes a `memo` used inside of a
+    `loop`, if it doesn't depend on the loop's key.
+
+    The values for `keys` must be hashable.  If they aren't, the return value
+    isn't remembered.
+
+    .. doctest:: api-memo
+
+       >>> from kemmering import bind, loop, memo, tag
+       >>> def user(context):
+       ...     print('Looking up user')
+       ...     return context['users'][context['user_id']]
+       >>> user = memo(user, ['users', 'user_id'])
+       >>> template = tag('p')(user, loop('i', 'items', tag('br/')), user)
+       >>> context = {'users': ('fred', 'barney'), 'user_id': 1,
+       ...            'items': (1, 2)}
+       >>> str(bind(template, context))
+       Looking up user
+       '<p>barney<br/><br/>barney</p>'
+    """
+
+    def __init__(self, f, keys=()):
+        self.f = f
+        self.keys = tuple(keys)
+
+    def _resolve(self, context):
+        scope = getattr(_local, 'scope', None)
+        if scope is None:
+            return self.f(context)
+        key = (self.f, self.keys) + tuple(
+            _get(context, k, _unbound) for k in self.keys)
+        try:
+            return scope.memo[key]
+        except KeyError:
+            value = scope.memo[key] = self.f(context)
+            return value
+        except TypeError:
+            return self.f(context)
+
+
+class lazy(object):
+    """
+    A value in a bind context which is computed the first time it is used.
+
+    `f` is a function which accepts no arguments and returns the value.  The
+    template helpers, `from_context`, `in_context`, `format_context`, `cond`,
+    `switch` and `loop`, call `f` the first time they look up the value, and
+    the return value is then reused for the remainder of the same call to
+    `bind` or `stream`, including in the contexts of any loops.  If a render
+    doesn't look up the value, `f` is never called.
+
+    Functions passed to `defer` see the `lazy` instance itself.  Calling it
+    returns the value, in the same way.
+
+    .. doctest:: api-lazy
+
+       >>> from kemmering import bind, cond, from_context, lazy, tag
+       >>> def fetch_user():
+       ...     print('Fetching user')
+       ...     return 'fred'
+       >>> template = tag('p')(
+       ...     cond('logged_in', tag('b')(from_context('user'))),
+       ...     cond('logged_in', from_context('user')))
+       >>> str(bind(template, {'logged_in': False, 'user': lazy(fetch_user)}))
+       '<p></p>'
+       >>> str(bind(template, {'logged_in': True, 'user': lazy(fetch_user)}))
+       Fetching user
+       '<p><b>fred</b>fred</p>'
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def __call__(self):
+        scope = getattr(_local, 'scope', None)
+        if scope is None:
+            return self.f()
+        values = scope.lazy
+        try:
+            return values[self]
+        except KeyError:
+            value = values[self] = self.f()
+            return value
+
+    def __repr__(self):
+        return '{}({})'.format(
+            type(self).__name__,
+            getattr(self.f, '__name__', repr(self.f)))
+
+
+def register_accessor(cls, get):
+    """
+    Register the function used to look up values in bind contexts of type
+    `cls`, or a subclass of it.
+
+    `get` is a function with the signature:
+
+    .. code-block:: python
+
+       def get(context, key, default):
+           "Return the value for `key` in `context`, or else `default`."
+
+    By default, values are looked up with the context's `get` method, if it
+    is a mapping, with `get` and `__getitem__` methods, and otherwise as
+    attributes, so dictionaries, named tuples, dataclasses, classes with
+    `__slots__` and most other objects may be used as contexts without
+    registering an accessor.
+
+    .. doctest:: api-register_accessor
+
+       >>> from kemmering import bind, from_context, register_accessor, tag
+       >>> class Row(object):
+       ...     def __init__(self, **values):
+       ...         self.values = values
+       >>> def get_column(row, key, default):
+       ...     return row.values.get(key, default)
+       >>> register_accessor(Row, get_column)
+       >>> str(bind(tag('a')(from_context('b')), Row(b='c')))
+       '<a>c</a>'
+    """
+    _accessors[cls] = get
+    _resolved.clear()
+
+
+def _getitem(context, key, default):
+    return context.get(key, default)
+
+
+def _getattr(context, key, default):
+    return getattr(context, key, default)
+
+
+_accessors = {}
+_resolved = {}
+
+
+def _accessor(cls):
+    get = _resolved.get(cls)
+    if get is None:
+        for base in getattr(cls, '__mro__', (cls,)):
+            get = _accessors.get(base)
+            if get is not None:
+                break
+        else:
+            # Objects which merely have a `get` method, such as some models,
+            # aren't mappings.
+            get = _getitem if hasattr(cls, 'get') and hasattr(
+                cls, '__getitem__') else _getattr
+        _resolved[cls] = get
+    return get
+
+
+def _get(context, key, default):
+    # Looks up `key` in the bind context.
+    if context.__class__ is dict:
+        return context.get(key, default)
+    return _accessor(type(context))(context, key, default)
+
+
+def _lookup(context, key, default):
+    # Looks up `key` in the bind context, computing `lazy` values.
+    if context.__class__ is dict:
+        value = context.get(key, default)
+    else:
+        value = _accessor(type(context))(context, key, default)
+    if isinstance(value, lazy):
+        return value()
+    return value
+
+
+class _chained(object):
+    # The context for an iteration of a `loop` over a context which isn't a
+    # dictionary.  Values set by the loop are looked up first, and then the
+    # enclosing context.
+
+    def __init__(self, parent):
+        self._parent = parent
+        self._values = {}
+
+    def get(self, key, default=None):
+        value = self._values.get(key, _unbound)
+        if value is _unbound:
+            return _get(self._parent, key, default)
+        return value
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def update(self, values):
+        self._values.update(values)
+
+    def __getitem__(self, key):
+        value = self.get(key, _unbound)
+        if value is _unbound:
+            raise KeyError(key)
+        return value
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = self.get(name, _unbound)
+        if value is _unbound:
+            raise AttributeError(name)
+        return value
+
+
+class _formatcontext(object):
+    # Adapts a bind context for `str.format_map`.
+
+    def __init__(self, context):
+        self.context = context
+
+    def __getitem__(self, key):
+        value = _lookup(self.context, key, _nothing)
+        if value is _nothing:
+            raise KeyError(key)
+        return value
+
+
 class from_context(defer):
     """
     This specialization of `defer` simply returns a value from the bind
     context.
 
-    `key` is the name to look up in the bind context dictionary.  Whatever is
+    `key` is the name to look up in the bind context.  Whatever is
     the value in the bind context is returned.  If `default` is specified and
     `key` is not found in the bind context, `default` is returned instead.
 
@@ -251,11 +1274,11 @@ class from_context(defer):
         self.key = key
         self.default = default
 
-    def _bind(self, context):
-        value = context.get(self.key, self.default)
+    def _resolve(self, context):
+        value = _lookup(context, self.key, self.default)
         if value is _nothing:
             raise KeyError(self.key)
-        return bind(value, context)
+        return value
 
     def __repr__(self):
         return '{}({})'.format(type(self).__name__, repr(self.key))
@@ -265,7 +1288,10 @@ class in_context(defer):
     """
     This specialization of `defer` looks up a value in the bind context by
     traversing the context using a sequence of keys where the bind context is
-    presumed to be a structure of nested dictionaries.
+    presumed to be a structure of nested dictionaries or objects.  Each key is
+    looked up using the accessor for the value it is looked up in, so
+    attributes of objects in the bind context can be reached without
+    converting them to dictionaries.
 
     `keys` is a sequence of names to look up, in order, in the bind context.
     If `default` is specified and a value is not found in the bind context for
@@ -285,18 +1311,18 @@ class in_context(defer):
         self.keys = keys
         self.default = default
 
-    def _bind(self, context):
+    def _resolve(self, context):
         value = context
         keys = self.keys
         while keys:
             key = keys[0]
             keys = keys[1:]
-            value = value.get(key, _nothing)
+            value = _lookup(value, key, _nothing)
             if value is _nothing:
                 if self.default is _nothing:
                     raise KeyError(self.keys)
                 return self.default
-        return bind(value, context)
+        return value
 
     def __repr__(self):
         return '{}({})'.format(type(self).__name__, repr(self.keys))
@@ -308,7 +1334,7 @@ class format_context(defer):
     string formatting on a format string.
 
     `s` is the format string.  The return value is the equivalent of
-    `s.format(**context)`.
+    `s.format(**context)`, except that the context need not be a dictionary.
 
     .. doctest:: api-format_context
 
@@ -321,8 +1347,10 @@ class format_context(defer):
     def __init__(self, s):
         self.s = s
 
-    def _bind(self, context):
-        return self.s.format(**context)
+    def _resolve(self, context):
+        if PY2:  # pragma: no cover
+            return _formatter.vformat(self.s, (), _formatcontext(context))
+        return self.s.format_map(_formatcontext(context))
 
     def __repr__(self):
         return '{}({})'.format(type(self).__name__, repr(self.s))
@@ -335,8 +1363,8 @@ class cond(defer):
 
     `condition` is a function which accepts a single argument, `context` and
     returns a boolean.  `condition` may optionally be a string, in which case
-    it is used as a key for performing a dictionary lookup in the bind context,
-    the value of which will be treated as a boolean.
+    it is used as a key for looking up a value in the bind context, the value
+    of which will be treated as a boolean.
 
     `affirmative` is the return value if the condition is `True`.  `negative`
     is the return value of the condition is `False`.  If the condition is
@@ -365,10 +1393,11 @@ class cond(defer):
         self.yes = affirmative
         self.no = negative
 
-    def _bind(self, context):
+    def _resolve(self, context):
         cond = self.cond
-        cond = cond(context) if callable(cond) else context.get(cond, False)
-        return bind(self.yes, context) if cond else bind(self.no, context)
+        cond = cond(context) if callable(cond) else _lookup(
+            context, cond, False)
+        return self.yes if cond else self.no
 
     def __repr__(self):
         return '{}({}, {}{})'.format(
@@ -380,6 +1409,56 @@ class cond(defer):
         )
 
 
+class switch(defer):
+    """
+    This specialization of `defer` chooses one of several elements based on
+    the bind context.
+
+    `key` is a function which accepts a single argument, `context`, and
+    returns a value.  `key` may optionally be a string, in which case it is
+    used as a key for looking up the value in the bind context.  `cases` is a
+    dictionary, or a sequence of pairs, which maps values to elements.  The
+    element for the value is looked up in `cases` with a single dictionary
+    lookup, however many cases there are, rather than by testing each case in
+    turn as a chain of `cond` elements would.
+
+    If the value isn't in `cases`, or `key` is a string which isn't in the
+    bind context, `default` is returned.  If no `default` is given, this
+    element is elided from the realized snippet.  Values must be hashable.
+
+    .. doctest:: api-switch
+
+       >>> from kemmering import bind, switch, tag
+       >>> template = tag('a')(switch('status', {
+       ...     'ok': tag('b')('OK'),
+       ...     'error': tag('i')('Error')}, 'Unknown'))
+       >>> str(bind(template, {'status': 'ok'}))
+       '<a><b>OK</b></a>'
+       >>> str(bind(template, {'status': 'pending'}))
+       '<a>Unknown</a>'
+    """
+
+    def __init__(self, key, cases, default=_nothing):
+        self.key = key
+        self.cases = dict(cases)
+        self.default = default
+
+    def _resolve(self, context):
+        key = self.key
+        value = key(context) if callable(key) else _lookup(
+            context, key, _unbound)
+        return self.cases.get(value, self.default)
+
+    def __repr__(self):
+        return '{}({}, {}{})'.format(
+            type(self).__name__,
+            getattr(self.key, '__name__', repr(self.key)),
+            repr(sorted(self.cases, key=repr)),
+            '' if self.default is _nothing else
+            ', {}'.format(repr(self.default))
+        )
+
+
 class loop(defer):
     """
     This specialization of `defer` repeats a snippet while iterating over a
@@ -398,6 +1477,19 @@ class loop(defer):
 
     `template` is the snippet to be repeated.
 
+    If the bind context is a dictionary, each iteration binds `template` to a
+    copy of the context with `key` added.  Otherwise, the context isn't copied:
+    each iteration binds to a chained context, which looks up `key` and then
+    falls back to the enclosing context.
+
+    If `stream` is `True`, `bind` does not realize the repeated snippets.
+    Instead, each item in the sequence is bound and serialized in turn as the
+    bound template is serialized, so memory use doesn't grow with the length of
+    the sequence.  This is useful when `seq` is a generator or a database
+    cursor.  The sequence is not retrieved until the bound template is
+    serialized.  `stream` and `render` always iterate this way, regardless of
+    `stream`.
+
     .. doctest:: api-loop
 
        >>> from kemmering import bind, from_context, loop, tag
@@ -435,27 +1527,88 @@ class loop(defer):
        <BLANKLINE>
     """
 
-    def __init__(self, key, seq, template):
+    def __init__(self, key, seq, template, stream=False):
         self.key = key
         self.seq = seq
         self.template = template
+        self.stream = stream
 
     def _bind(self, context):
-        def subcontext(value):
-            sub = context.copy()
-            if isinstance(self.key, (list, tuple)):
-                _check_unpack(len(self.key), len(value))
-                sub.update({k: v for k, v in zip(self.key, value)})
-            else:
-                sub[self.key] = value
-            return sub
-
-        seq = self.seq(context) if callable(self.seq) else context[self.seq]
+        if self.stream:
+            return _streamedloop(self, context)
         return notag(*(
-            bind(self.template, subcontext(value))
-            for value in seq
+            _realize(self.template, self._subcontext(context, value))
+            for value in self._checked(self._seq(context))
         ))
 
+    def _stream(self, context=_unbound):
+        if context is _unbound:
+            raise ValueError("Unbound defer, unable to stream.")
+        template = self.template
+        for value in self._checked(self._seq(context)):
+            for x in _render(template, self._subcontext(context, value)):
+                yield x
+
+    def _checked(self, seq):
+        scope = getattr(_local, 'scope', None)
+        if scope is None or not scope.limited:
+            return seq
+        return _checkeach(seq, scope)
+
+    def _seq(self, context):
+        if callable(self.seq):
+            return self.seq(context)
+        seq = _lookup(context, self.seq, _nothing)
+        if seq is _nothing:
+            raise KeyError(self.seq)
+        return seq
+
+    def _subcontext(self, context, value):
+        if isinstance(context, dict):
+            sub = context.copy()
+        else:
+            sub = _chained(context)
+        if isinstance(self.key, (list, tuple)):
+            _check_unpack(len(self.key), len(value))
+            sub.update({k: v for k, v in zip(self.key, value)})
+        else:
+            sub[self.key] = value
+        return sub
+
+    def __repr__(self):
+        return '{}({}, {}, {})'.format(
+            type(self).__name__,
+            repr(self.key),
+            getattr(self.seq, '__name__', repr(self.seq)),
+            repr(self.template))
+
+
+class _streamedloop(object):
+    # A `loop`, bound with `stream=True`, which is realized as it is streamed.
+
+    def __init__(self, loop, context):
+        self.loop = loop
+        self.context = context
+        self.scope = _local.scope
+
+    def _stream(self, context=_unbound):
+        return _scoped(self.loop._stream(self.context), self.scope)
+
+    def _is_static(self):
+        return False
+
+    def __repr__(self):
+        return '{}({}, {})'.format(
+            type(self.loop).__name__, repr(self.loop.key),
+            getattr(self.loop.seq, '__name__', repr(self.loop.seq)))
+
+
+def _checkeach(seq, scope):
+    check = scope.check
+    for value in seq:
+        check()
+        yield value
+
 
 def _check_unpack(expected, got):
     if got < expected:
@@ -0,0 +1,152 @@
+"""
+Rendering for asyncio.
+
+Realizes templates incrementally without blocking the event loop for the whole
+render: control is returned to the event loop periodically, so other tasks can
+run while a large page is being rendered.  Requires Python 3.5 or later.
+"""
+from . import _clock, stream as _stream
+from .output import FLUSH_BYTES, stream_bytes
+
+__all__ = ['stream', 'write']
+
+
+class stream(object):
+    """
+    Realize a template incrementally as an asynchronous iterator.
+
+    Works like :func:`kemmering.stream`, but is iterated with `async for`.
+    After every `every` chunks, or once `interval` seconds have passed since
+    the event loop last had control, control is returned to the event loop
+    before the next chunk is produced.
+
+    .. code-block:: python
+
+       from kemmering import aio
+
+       async def handle(request):
+           async for chunk in aio.stream(template, context):
+               await response.write(chunk)
+    """
+
+    def __init__(self, template, context, every=64, interval=0.005):
+        self._chunks = _stream(template, context)
+        self._pause = _pauser(every, interval)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration  # nopep8
+        return _ready(chunk, self._pause())
+
+
+def write(writer, template, context, encoding='utf-8', every=64,
+          interval=0.005):
+    """
+    Render a template to an `asyncio.StreamWriter`.
+
+    Returns an awaitable which writes the output of the template, encoded as
+    for :func:`kemmering.output.stream_bytes`, to `writer`.  After every
+    `every` chunks, or once `interval` seconds have passed since the event
+    loop last had control, it awaits `writer.drain()`, so that rendering waits
+    while the client is slower than the server, and returns control to the
+    event loop.  It also awaits `writer.drain()` where a
+    :class:`kemmering.flush` element is streamed.  The result of the awaitable
+    is the number of bytes written.
+
+    .. code-block:: python
+
+       from kemmering import aio
+
+       async def handle(reader, writer):
+           await aio.write(writer, template, context)
+           writer.close()
+    """
+    return _writing(writer, stream_bytes(template, context, encoding),
+                    _pauser(every, interval))
+
+
+def _pauser(every, interval):
+    # Returns a function, called after each chunk, which returns whether it
+    # is time to return control to the event loop.
+    state = {'count': 0, 'since': _clock()}
+
+    def pause():
+        state['count'] += 1
+        now = _clock()
+        if state['count'] >= every or now - state['since'] >= interval:
+            state['count'] = 0
+            state['since'] = now
+            return True
+        return False
+    return pause
+
+
+class _ready(object):
+    # An awaitable for a value which is already available.  If `pause` is
+    # true, control is returned to the event loop once before the value is
+    # returned.
+
+    def __init__(self, value, pause):
+        self.value = value
+        self.pause = pause
+
+    def __await__(self):
+        return self
+
+    __iter__ = __await__
+
+    def __next__(self):
+        if self.pause:
+            self.pause = False
+            return None
+        raise StopIteration(self.value)
+
+    next = __next__
+
+    def send(self, value):
+        return next(self)
+
+
+class _writing(object):
+    # The awaitable returned by `write`.  Written without `async def`, so the
+    # package can still be imported on versions of Python which don't have it.
+
+    def __init__(self, writer, chunks, pause):
+        self.writer = writer
+        self.chunks = chunks
+        self.pause = pause
+        self.total = 0
+        self._draining = None
+
+    def __await__(self):
+        return self
+
+    __iter__ = __await__
+
+    def __next__(self):
+        return self.send(None)
+
+    next = __next__
+
+    def send(self, value):
+        draining = self._draining
+        if draining is not None:
+            try:
+                return draining.send(value)
+            except StopIteration:
+                # Drained.  Return control to the event loop before going on.
+                self._draining = None
+                return None
+        writer = self.writer
+        for chunk in self.chunks:
+            writer.write(chunk)
+            self.total += len(chunk)
+            if self.pause() or chunk is FLUSH_BYTES:
+                self._draining = writer.drain().__await__()
+                return self.send(None)
+        raise StopIteration(self.total)
@@ -0,0 +1,220 @@
+"""
+Template analysis.
+
+Reports on the structure of a template, to help estimate what it will cost
+to render before it is used.  Can also be run from the command line::
+
+    $ python -m kemmering.analyze mypackage.templates:page
+"""
+import importlib
+import sys
+
+from . import _is_static, _nothing, _render, _unbound, cond, switch, tag
+
+__all__ = ['analyze', 'report']
+
+
+class report(object):
+    """
+    The result of analyzing a template with `analyze`.
+
+    `nodes` is the total number of nodes in the template: tags, strings and
+    deferred elements, including the sub-templates of `cond`, `switch` and
+    `loop` elements.  `tags` is the number of tags.  `depth` is the deepest
+    nesting of tags.  `loop_depth` is the deepest nesting of `loop` elements.
+    `deferred` is a dictionary which maps the names of the types of deferred
+    elements, such as `'from_context'` or `'loop'`, to the number of them in
+    the template.
+
+    `static_nodes` is the number of nodes which are static, and so are
+    serialized once and then reused by `stream` and `render`, and
+    `static_node_ratio` is the proportion of nodes that are static.
+    `static_size` is the size, in bytes encoded as UTF-8, of the static
+    markup in the template, counting the contents of each `loop` once.
+    `dynamic_slots` is the number of deferred elements which produce output
+    themselves, rather than choosing or repeating parts of the template.
+
+    `static_ratio` is an estimate of the proportion of the output, in bytes,
+    which is static: `static_size` against the sum of `static_size` and
+    `slot_size` bytes for each dynamic slot.  The actual proportion depends
+    on the values in the context and on the lengths of the sequences of
+    loops, which can't be known from the template.
+
+    `warnings` is a list of descriptions of possible problems with the
+    template.
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.tags = 0
+        self.depth = 0
+        self.loop_depth = 0
+        self.deferred = {}
+        self.static_nodes = 0
+        self.static_size = 0
+        self.dynamic_slots = 0
+        self.warnings = []
+
+    # The estimated size, in bytes, of the output of a dynamic slot.
+    slot_size = 32
+
+    @property
+    def static_node_ratio(self):
+        return float(self.static_nodes) / self.nodes if self.nodes else 1.0
+
+    @property
+    def static_ratio(self):
+        total = self.static_size + self.dynamic_slots * self.slot_size
+        return float(self.static_size) / total if total else 1.0
+
+    def __str__(self):
+        lines = [
+            'nodes:         {}'.format(self.nodes),
+            'tags:          {}'.format(self.tags),
+            'depth:         {}'.format(self.depth),
+            'loop depth:    {}'.format(self.loop_depth),
+            'static nodes:  {} ({:.0%})'.format(
+                self.static_nodes, self.static_node_ratio),
+            'static size:   {} bytes'.format(self.static_size),
+            'dynamic slots: {}'.format(self.dynamic_slots),
+            'static output: {:.0%} (estimated)'.format(self.static_ratio),
+            'deferred:      {}'.format(', '.join(
+                '{} {}'.format(name, count)
+                for name, count in sorted(self.deferred.items())) or 'none'),
+        ]
+        lines.extend('warning: {}'.format(warning)
+                     for warning in self.warnings)
+        return '\n'.join(lines)
+
+
+def analyze(template):
+    """
+    Analyze a template, returning a `report`.
+
+    .. doctest:: api-analyze
+
+       >>> from kemmering import cond, from_context, loop, tag
+       >>> from kemmering.analyze import analyze
+       >>> template = tag('ul', id='a')(loop('i', 'items', tag('li')(
+       ...     cond('b', 'c', from_context('i')))))
+       >>> print(analyze(template))
+       nodes:         6
+       tags:          2
+       depth:         2
+       loop depth:    1
+       static nodes:  1 (17%)
+       static size:   26 bytes
+       dynamic slots: 1
+       static output: 45% (estimated)
+       deferred:      cond 1, from_context 1, loop 1
+    """
+    result = report()
+    _walk(template, 1, 0, result)
+    if result.loop_depth > 1:
+        result.warnings.append(
+            'loops are nested {} deep, so the size of the output grows with '
+            'the product of the lengths of their sequences'.format(
+                result.loop_depth))
+    return result
+
+
+def _walk(node, depth, loops, result):
+    result.nodes += 1
+    if isinstance(node, tag):
+        if node.tag:
+            result.tags += 1
+            result.depth = max(result.depth, depth)
+        else:
+            depth -= 1
+        if _is_static(node):
+            result.static_nodes += 1
+            result.static_size += _size(node)
+            for child in node.children:
+                _walk_static(child, depth + 1, result)
+            return
+        if node.tag:
+            if all(_is_static(v) for v in node.attrs.values()):
+                result.static_size += _length(node._open(node.attrs))
+            result.static_size += _length(node._close())
+        for value in node.attrs.values():
+            if not _is_static(value):
+                _walk(value, depth, loops, result)
+        for child in node.children:
+            _walk(child, depth + 1, loops, result)
+    elif _is_static(node):
+        result.static_nodes += 1
+        result.static_size += _size(node)
+    else:
+        name = type(node).__name__
+        result.deferred[name] = result.deferred.get(name, 0) + 1
+        templates = _templates(node)
+        if not templates:
+            result.dynamic_slots += 1
+        if templates and hasattr(node, 'seq'):
+            loops += 1
+            result.loop_depth = max(result.loop_depth, loops)
+        for template in templates:
+            _walk(template, depth, loops, result)
+
+
+def _walk_static(node, depth, result):
+    # Counts the nodes in a static subtree, whose size is already counted.
+    result.nodes += 1
+    result.static_nodes += 1
+    if isinstance(node, tag):
+        if node.tag:
+            result.tags += 1
+            result.depth = max(result.depth, depth)
+        else:
+            depth -= 1
+        for child in node.children:
+            _walk_static(child, depth + 1, result)
+
+
+def _templates(node):
+    # The sub-templates of a deferred element.
+    if isinstance(node, cond):
+        templates = [node.yes, node.no]
+    elif isinstance(node, switch):
+        templates = list(node.cases.values()) + [node.default]
+    else:
+        templates = [getattr(node, 'template', _nothing)]
+    return [template for template in templates if template is not _nothing]
+
+
+def _size(node):
+    # The size of a static node, serialized.
+    return _length(''.join(_render(node, _unbound)))
+
+
+def _length(markup):
+    return len(markup.encode('utf-8'))
+
+
+def main(argv=None):
+    """
+    Print reports for templates named on the command line.
+
+    Each argument is the name of a template in the form `module:name`, where
+    `name` may be a dotted path to an attribute of the module.
+    """
+    args = sys.argv[1:] if argv is None else argv
+    if not args:
+        sys.stderr.write('usage: python -m kemmering.analyze '
+                         'module:template [module:template ...]\n')
+        return 2
+    for i, arg in enumerate(args):
+        module, _, path = arg.partition(':')
+        template = importlib.import_module(module)
+        for name in path.split('.') if path else ():
+            template = getattr(template, name)
+        if i:
+            print('')
+        if len(args) > 1:
+            print('{}:'.format(arg))
+        print(analyze(template))
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
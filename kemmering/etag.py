@@ -0,0 +1,303 @@
+"""
+Entity tags for conditional requests.
+
+`etag` computes an entity tag for a template and a context without rendering
+the template, from the values of the context keys that the template reads.
+Where that isn't possible, `hashing` computes one from the output while it is
+streamed.
+"""
+import hashlib
+import string
+
+from . import (
+    PY2,
+    _enter,
+    _local,
+    _lookup,
+    _is_static,
+    _markup,
+    _render,
+    _scope,
+    _unbound,
+    cond,
+    flush,
+    format_context,
+    from_context,
+    in_context,
+    loop,
+    memo,
+    switch,
+    tag,
+)
+from .html import collected_styles, json_script, shared_style, tablerows
+from .metrics import named
+
+__all__ = ['etag', 'hashing']
+
+_missing = object()
+_formatter = string.Formatter()
+
+
+def etag(template, context, version=''):
+    """
+    Compute an entity tag for the output of a template, without rendering it.
+
+    The entity tag is a hash of the structure of the template, including the
+    arguments of each of its elements, `version` and the values of the keys
+    in `context` which are read by the template's deferred elements.
+    Functions in the template are identified by their names, so `version`
+    should be changed whenever the output of the template might change for
+    the same context, such as when the deferred functions in the template
+    change.  The template is looked at afresh each time, so it may be
+    changed between calls.
+
+    The context keys read by `from_context`, `in_context`, `format_context`,
+    `cond`, `switch`, `loop` and `memo` elements can be found by looking at the
+    template.  A `defer`, or any deferred element, which has a `cache_key` is
+    represented by the value of its `cache_key`.  If the template has any
+    other deferred elements, including `cond`, `switch` and `loop` elements
+    which use functions rather than context keys, its output can't be
+    predicted and `None` is returned.
+
+    Strings, numbers, `None` and lists, tuples, dictionaries and sets of them
+    are hashed by value.  Other values are hashed by their `repr`, so should
+    have a `repr` which reflects their value.
+
+    .. doctest:: api-etag
+
+       >>> from kemmering import from_context, tag
+       >>> from kemmering.etag import etag
+       >>> template = tag('p')(from_context('name'))
+       >>> a = etag(template, {'name': 'fred', 'unused': 1})
+       >>> a == etag(template, {'name': 'fred', 'unused': 2})
+       True
+       >>> a == etag(template, {'name': 'barney', 'unused': 1})
+       False
+    """
+    analyzed = _analyze(template)
+    if analyzed is None:
+        return None
+    identity, dependencies = analyzed
+    digest = hashlib.sha1(identity)
+    digest.update(_encode(version))
+    previous = _enter(getattr(_local, 'scope', None) or _scope())
+    try:
+        for dependency in dependencies:
+            digest.update(_encode(dependency(context)))
+    finally:
+        _local.scope = previous
+    return '"{}"'.format(digest.hexdigest())
+
+
+class hashing(object):
+    """
+    Compute an entity tag for output while it is streamed.
+
+    `chunks` is an iterable of strings or `bytes`, such as is returned by
+    :func:`kemmering.stream` or :func:`kemmering.output.stream_bytes`.
+    Iterating over the `hashing` object yields the chunks, unchanged, and
+    once all of them have been yielded, `etag` is the entity tag for the
+    output.
+
+    .. doctest:: api-hashing
+
+       >>> from kemmering import from_context, stream, tag
+       >>> from kemmering.etag import hashing
+       >>> chunks = hashing(stream(tag('p')(from_context('a')), {'a': 'b'}))
+       >>> ''.join(chunks)
+       '<p>b</p>'
+       >>> chunks.etag
+       '"192d2eb881a7dbb904a65ff74ce9b89312bd8fea"'
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._digest = hashlib.sha1()
+        self._done = False
+
+    def __iter__(self):
+        update = self._digest.update
+        for chunk in self.chunks:
+            update(chunk if isinstance(chunk, bytes) else
+                   chunk.encode('utf-8'))
+            yield chunk
+        self._done = True
+
+    @property
+    def etag(self):
+        """
+        The entity tag for the output.  Raises `ValueError` if the output
+        hasn't all been iterated over.
+        """
+        if not self._done:
+            raise ValueError('Output not finished, unable to compute etag.')
+        return '"{}"'.format(self._digest.hexdigest())
+
+
+class _Opaque(Exception):
+    # Raised when a template reads something other than context keys.
+    pass
+
+
+def _analyze(template):
+    # Returns a hash of the structure of the template and a list of functions
+    # which return the values that the template depends on, or `None`.  The
+    # template is analyzed afresh each time, so it may be changed between
+    # calls: the static markup of tags is compiled once, so this mostly
+    # visits the deferred elements.
+    dependencies = []
+    try:
+        key = _walk(template, frozenset(), dependencies)
+    except _Opaque:
+        return None
+    return _encode(key), dependencies
+
+
+def _walk(node, bound, dependencies):
+    # Returns a key for the structure of `node`, made from the arguments of
+    # each element, and finds the values which its output depends on.
+    # `bound` is the set of keys which are set by enclosing loops, whose
+    # values are determined by the loops' sequences.
+    if isinstance(node, tag):
+        key = [_name(type(node))]
+        for part in node._parts():
+            if part.__class__ is _markup:
+                key.append(part)
+            elif part is None:
+                key.append([node.tag, node.self_closing, bool(node.children),
+                            {k: _walk(v, bound, dependencies)
+                             for k, v in node.attrs.items()}])
+            else:
+                key.append(_walk(part, bound, dependencies))
+        return key
+    if not hasattr(node, '_stream'):
+        return _arg(node)
+    name = _name(type(node))
+    if isinstance(node, flush):
+        return [name]
+    if isinstance(node, shared_style):
+        return [name, list(node.styles.items())]
+    if isinstance(node, collected_styles):
+        return [name, node.minify]
+    if _is_static(node):
+        return [name, ''.join(_render(node, _unbound))]
+    if getattr(node, 'cache_key', None) is not None:
+        dependencies.append(node.cache_key)
+        return [name, _arg(getattr(node, 'f', None))]
+    if isinstance(node, from_context):
+        _depend(node.key, bound, dependencies)
+        return [name, node.key, _walk(node.default, bound, dependencies)]
+    if isinstance(node, in_context):
+        keys = tuple(node.keys)
+        if keys and keys[0] not in bound:
+            dependencies.append(lambda context: _path(context, keys))
+        return [name, keys, _walk(node.default, bound, dependencies)]
+    if isinstance(node, format_context):
+        for _, field, _, _ in _formatter.parse(node.s):
+            if field:
+                _depend(field.split('.')[0].split('[')[0], bound,
+                        dependencies)
+        return [name, node.s]
+    if isinstance(node, memo):
+        for key in node.keys:
+            _depend(key, bound, dependencies)
+        return [name, _name(node.f), node.keys]
+    if isinstance(node, cond):
+        _key(node.cond, bound, dependencies)
+        return [name, node.cond, _walk(node.yes, bound, dependencies),
+                _walk(node.no, bound, dependencies)]
+    if isinstance(node, switch):
+        _key(node.key, bound, dependencies)
+        return [name, node.key,
+                {value: _walk(case, bound, dependencies)
+                 for value, case in node.cases.items()},
+                _walk(node.default, bound, dependencies)]
+    if isinstance(node, loop):
+        _key(node.seq, bound, dependencies)
+        keys = node.key if isinstance(node.key, (list, tuple)) else (
+            node.key,)
+        return [name, node.key, node.seq,
+                _walk(node.template, bound.union(keys), dependencies)]
+    if isinstance(node, tablerows):
+        columns = node.columns
+        if isinstance(columns, (str, type(u''))) or callable(columns):
+            _key(columns, bound, dependencies)
+        else:
+            columns = [list(column) for column in columns]
+        return [name, _arg(columns), _arg(node.formats), _arg(node.attrs),
+                _arg(node.row_attrs)]
+    if isinstance(node, json_script):
+        return [name, _walk(node.data, bound, dependencies),
+                _arg(node.encoder), _arg(node.attrs)]
+    if isinstance(node, named):
+        return [name, node.name, _walk(node.template, bound, dependencies)]
+    raise _Opaque()
+
+
+def _arg(value):
+    # A key for the argument of an element: data is used as it is,
+    # functions and classes are named, and other objects are represented by
+    # their class and attributes, as their `repr` may differ between
+    # processes.
+    if isinstance(value, (list, tuple)):
+        return [_arg(item) for item in value]
+    if isinstance(value, dict):
+        return {k: _arg(v) for k, v in value.items()}
+    if callable(value) and hasattr(value, '__name__'):
+        return _name(value)
+    if hasattr(value, '__dict__'):
+        return [_name(type(value)), _arg(vars(value))]
+    return value
+
+
+def _name(obj):
+    # Names a function or class the same way in every process.  Functions are
+    # also told apart by where they are defined, as lambdas have no name.
+    name = '{}.{}'.format(getattr(obj, '__module__', None), getattr(
+        obj, '__qualname__', obj.__name__))
+    code = getattr(obj, '__code__', None)
+    if code is not None:
+        name += ':{}'.format(code.co_firstlineno)
+    return name
+
+
+def _key(key, bound, dependencies):
+    # A key, or a function, used by a deferred element.
+    if callable(key):
+        raise _Opaque()
+    _depend(key, bound, dependencies)
+
+
+def _depend(key, bound, dependencies):
+    if key not in bound:
+        dependencies.append(lambda context: _lookup(context, key, _missing))
+
+
+def _path(context, keys):
+    value = context
+    for key in keys:
+        value = _lookup(value, key, _missing)
+        if value is _missing:
+            break
+    return value
+
+
+def _encode(value):
+    # Encodes a value as bytes, such that equal values have the same
+    # encoding, regardless of the order of items in dictionaries and sets.
+    if value is _missing:
+        return b'-'
+    if isinstance(value, bytes) and not PY2:
+        return b'b' + str(len(value)).encode('ascii') + b':' + value
+    if isinstance(value, (str, type(u''))):
+        value = value.encode('utf-8')
+        return b's' + str(len(value)).encode('ascii') + b':' + value
+    if isinstance(value, (list, tuple)):
+        return b'[' + b''.join(_encode(item) for item in value) + b']'
+    if isinstance(value, dict):
+        return b'{' + b''.join(sorted(
+            _encode(k) + _encode(v) for k, v in value.items())) + b'}'
+    if isinstance(value, (set, frozenset)):
+        return b'<' + b''.join(sorted(
+            _encode(item) for item in value)) + b'>'
+    return _encode(type(value).__name__ + ':' + repr(value))
@@ -3,17 +3,33 @@ HTML tags
 
 Reference: http://www.html-5-tutorial.com/all-html-tags.htm
 """
+import json
 import sys
 
 from collections import OrderedDict
 from xml.dom import minidom
+from xml.sax.saxutils import escape
 
-from . import tag
+from . import (
+    _check,
+    _local,
+    _lookup,
+    _markup,
+    _nothing,
+    _placeheld,
+    _realize,
+    _unbound,
+    tag,
+)
 
 PY2 = sys.version_info[0] == 2
 strclass = unicode if PY2 else str    # nopep8
 
-__all__ = ['doc', 'style', 'pretty']
+__all__ = ['doc', 'style', 'shared_style', 'collected_styles', 'tablerows',
+           'json_script', 'pretty']
+
+
+_doctype = _markup('<!DOCTYPE html>\n\n')
 
 
 class doc(tag):
@@ -33,11 +49,14 @@ class doc(tag):
         super(doc, self).__init__(None)
         self(*children)
 
-    def _stream(self):
-        yield '<!DOCTYPE html>\n\n'
-        for child in super(doc, self)._stream():
+    def _serialize(self):
+        yield _doctype
+        for child in super(doc, self)._serialize():
             yield child
 
+    def _compile(self):
+        return (_doctype,) + super(doc, self)._compile()
+
 
 class style(object):
     """
@@ -70,7 +89,7 @@ class style(object):
         self.styles = OrderedDict()
         self(*args)
 
-    def _stream(self):
+    def _stream(self, context=_unbound):
         yield '\n<style>\n'
         for selector, style in self.styles.items():
             yield '  {} {{\n'.format(selector)
@@ -89,6 +108,403 @@ class style(object):
     __unicode__ = __str__
 
 
+class shared_style(style):
+    """
+    CSS rules which are shared by every use of a component.
+
+    Takes the same arguments as `style`.  Where a template includes a
+    `collected_styles` element, the rules of every `shared_style` realized
+    after it in the same call to `bind`, `stream` or `render` are collected,
+    keyed by selector, and written once, by the `collected_styles` element.
+    The `shared_style` elements themselves produce no output.  If more than
+    one `shared_style` has rules for the same selector, the rules of the first
+    one are used.
+
+    Without a `collected_styles` element, each `shared_style` is written as a
+    `style` tag, leaving out any selectors which have already been written.
+
+    .. doctest:: api-shared_style
+
+       >>> from kemmering import loop, render
+       >>> from kemmering.html import body, collected_styles, div, head, html
+       >>> from kemmering.html import shared_style
+       >>> card = div(class_='card')(shared_style(
+       ...     ('.card', {'padding': '1em'})))
+       >>> template = html()(
+       ...     head()(collected_styles(minify=True)),
+       ...     body()(loop('i', 'cards', card)))
+       >>> print(render(template, {'cards': range(3)}))
+       <html><head><style>.card{padding:1em}</style></head><body>\
+<div class="card"></div><div class="card"></div><div class="card"></div>\
+</body></html>
+    """
+
+    # The class of the element written in place of this one, without a
+    # `collected_styles` element.
+    _inline = style
+
+    def _bind(self, context):
+        return self._share()
+
+    def _stream(self, context=_unbound):
+        if context is _unbound:
+            return super(shared_style, self)._stream()
+        return self._share()._stream()
+
+    def _is_static(self):
+        return False
+
+    def _share(self):
+        # Adds the rules to the rules collected for the current render, and
+        # returns what should be written in place of this element.
+        registry = _registry.current()
+        if registry is None:
+            return self
+        seen = registry.seen
+        added = []
+        for selector, declarations in self.styles.items():
+            if selector not in seen:
+                seen.add(selector)
+                added.append((selector, declarations))
+        if not added:
+            return _nothing
+        if registry.inline:
+            return self._inline(*added)
+        registry.rules.update(added)
+        return _nothing
+
+    def __repr__(self):
+        return '{}({})'.format(
+            type(self).__name__,
+            ', '.join(repr(rule) for rule in self.styles.items()))
+
+
+class collected_styles(object):
+    """
+    HTML tag <style></style> containing the rules of the `shared_style`
+    elements in a template.
+
+    Belongs in the <head></head> of a page.  The rules are written in the
+    order in which their selectors were first seen, once all of the rest of
+    the template has been realized.  When the template is streamed, the output
+    following this element is buffered until then, so nothing after this
+    element is sent to the client until the whole page has been rendered.
+    If there are no rules, nothing is written.  If `minify` is `True`, the
+    rules are written without any whitespace.
+    """
+
+    def __init__(self, minify=False):
+        self.minify = minify
+
+    def _bind(self, context):
+        return _collected(self._start(), self.minify)
+
+    def _stream(self, context=_unbound):
+        if context is _unbound:
+            raise ValueError("Unbound collected_styles, unable to stream.")
+        collected = _collected(self._start(), self.minify)
+        yield _placeheld(collected.__str__)
+
+    def _is_static(self):
+        return False
+
+    def _start(self):
+        # Starts collecting rules for the current render.  Selectors which
+        # have already been written inline aren't collected again.
+        registry = _registry.current()
+        if registry is None:
+            raise ValueError("collected_styles used outside of a render.")
+        registry.inline = False
+        return registry
+
+    def __repr__(self):
+        return '{}()'.format(type(self).__name__)
+
+
+class _registry(object):
+    # The rules collected by `shared_style` elements during a single render,
+    # kept in the render's scope.
+
+    def __init__(self):
+        self.rules = OrderedDict()
+        self.seen = set()
+        self.inline = True
+
+    @classmethod
+    def current(cls):
+        scope = getattr(_local, 'scope', None)
+        if scope is None:
+            return None
+        scope.shared = True
+        registry = scope.memo.get(cls)
+        if registry is None:
+            registry = scope.memo[cls] = cls()
+        return registry
+
+
+class _collected(object):
+    # A bound `collected_styles` element.  The rules are looked up when it is
+    # serialized, after the rest of the template has been bound.
+
+    def __init__(self, registry, minify):
+        self.registry = registry
+        self.minify = minify
+
+    def _stream(self, context=_unbound):
+        rules = self.registry.rules
+        if not rules:
+            return
+        if self.minify:
+            for chunk in _compact(rules):
+                yield chunk
+        else:
+            collected = style()
+            collected.styles = rules
+            for chunk in collected._stream():
+                yield chunk
+
+    def _is_static(self):
+        return False
+
+    def __str__(self):
+        return ''.join(self._stream())
+
+    __unicode__ = __str__
+
+
+def _compact(rules):
+    # Serializes a <style></style> tag for `rules`, an ordered mapping of
+    # selectors to declarations, without whitespace.
+    yield '<style>'
+    for selector, declarations in rules.items():
+        yield '{}{{{}}}'.format(selector, ';'.join(
+            '{}:{}'.format(k, v) for k, v in declarations.items()))
+    yield '</style>'
+
+
+class tablerows(object):
+    """
+    Table rows, <tr></tr>, for data arranged in columns.
+
+    `columns` is a sequence of columns, each of which is a sequence of cell
+    values, with one value for each row.  Columns may be lists, tuples or any
+    other sequences that support slicing, including NumPy arrays.
+    Alternatively, `columns` may be a function which accepts a single
+    argument, `context`, and returns the columns, or the name of a key in the
+    bind context whose value is the columns.
+
+    `formats` is an optional sequence with an item for each column which is
+    used to convert the values in that column to strings.  Each item may be a
+    function of a single value, a format string, such as `'{:.2f}'`, or `None`
+    to use `str`.  The formatted values are escaped.  `attrs` is an optional
+    sequence with an item for each column of attributes for its <td></td>
+    tags, as a dictionary, or `None`.  `row_attrs` is an optional dictionary
+    of attributes for the <tr></tr> tags.
+
+    The markup is the same as for a `loop` of <tr></tr> tags containing
+    <td></td> tags, but no tags are created for the rows and cells.  Instead,
+    cells are formatted and escaped a column at a time, for `batch` rows at a
+    time, and the markup for each batch of rows is streamed as a single chunk.
+
+    .. doctest:: api-tablerows
+
+       >>> from kemmering import bind
+       >>> from kemmering.html import pretty, table, tablerows
+       >>> template = table()(tablerows(
+       ...     'columns', formats=[None, '{:.2f}'],
+       ...     attrs=[None, {'class_': 'price'}]))
+       >>> print(pretty(bind(template, {'columns': [['a', 'b&c'], [1, 2.5]]})))
+       <table>
+         <tr>
+           <td>a</td>
+           <td class="price">1.00</td>
+         </tr>
+         <tr>
+           <td>b&amp;c</td>
+           <td class="price">2.50</td>
+         </tr>
+       </table>
+       <BLANKLINE>
+    """
+
+    def __init__(self, columns, formats=None, attrs=None, row_attrs=None,
+                 batch=1000):
+        self.columns = columns
+        self.formats = formats
+        self.attrs = attrs
+        self.row_attrs = row_attrs
+        self.batch = batch
+
+    def _bind(self, context):
+        return tablerows(self._columns(context), self.formats, self.attrs,
+                         self.row_attrs, self.batch)
+
+    def _is_static(self):
+        return False
+
+    def _columns(self, context):
+        columns = self.columns
+        if callable(columns):
+            return columns(context)
+        if isinstance(columns, (str, strclass)):
+            value = _lookup(context, columns, _nothing)
+            if value is _nothing:
+                raise KeyError(columns)
+            return value
+        return columns
+
+    def _stream(self, context=_unbound):
+        if context is _unbound:
+            if callable(self.columns) or isinstance(
+                    self.columns, (str, strclass)):
+                raise ValueError("Unbound defer, unable to stream.")
+        columns = self._columns(context)
+        if not len(columns):
+            return
+        rows = len(columns[0])
+        for column in columns:
+            if len(column) != rows:
+                raise ValueError('columns must all be the same length')
+        formats = self.formats or (None,) * len(columns)
+        attrs = self.attrs or (None,) * len(columns)
+        if len(formats) != len(columns) or len(attrs) != len(columns):
+            raise ValueError(
+                'formats and attrs must have an item for each column')
+
+        cells = []
+        for format, attrs in zip(formats, attrs):
+            if format is None:
+                format = strclass
+            elif isinstance(format, (str, strclass)):
+                format = format.format
+            cell = td(**(attrs or {}))
+            cells.append((format, cell._open(cell.attrs)))
+        row = tr(**(self.row_attrs or {}))
+        start = row._open(row.attrs)
+        between = '</tr>' + start
+
+        batch = self.batch
+        for i in range(0, rows, batch):
+            _check()
+            formatted = []
+            for column, (format, open) in zip(columns, cells):
+                values = column[i:i + batch]
+                if hasattr(values, 'tolist'):
+                    values = values.tolist()
+                formatted.append([open + escape(format(value)) + '</td>'
+                                  for value in values])
+            yield start + between.join(
+                [''.join(row) for row in zip(*formatted)]) + '</tr>'
+
+    def __str__(self):
+        return ''.join(self._stream())
+
+    __unicode__ = __str__
+
+    def __repr__(self):
+        columns = self.columns
+        return '{}({})'.format(type(self).__name__, (
+            repr(columns) if isinstance(columns, (str, strclass)) else
+            getattr(columns, '__name__', '...')))
+
+
+_json_escapes = (
+    ('<', '\\u003c'),
+    ('>', '\\u003e'),
+    ('&', '\\u0026'),
+    (u'\u2028', '\\u2028'),
+    (u'\u2029', '\\u2029'),
+)
+
+
+class json_script(object):
+    """
+    HTML tag <script></script> containing data encoded as JSON.
+
+    `data` is the data to encode.  It may be an instance of `defer`, such as
+    `from_context`, in which case the data is taken from the bind context.
+    The data is encoded incrementally, using `encoder.iterencode`, directly
+    into the output stream, so the encoded data is never held in memory all at
+    once.  `encoder` is a `json.JSONEncoder`, by default one with the same
+    settings as `json.dumps`.
+
+    The characters `<`, `>` and `&` and the line and paragraph separators,
+    U+2028 and U+2029, can only occur within strings in JSON.  They are
+    written as escape sequences, so the script can't be closed early by a
+    `</script>` in the data, and is valid JavaScript as well as JSON.
+
+    `attrs` are the attributes for the <script></script> tag.  By default,
+    `type` is `application/json`.
+
+    `batch` is the number of characters of JSON, approximately, in each chunk
+    of output.
+
+    .. doctest:: api-json_script
+
+       >>> from kemmering import bind, from_context
+       >>> from kemmering.html import json_script
+       >>> template = json_script(from_context('state'))
+       >>> print(bind(template, {'state': {'a': '</script>'}}))
+       <script type="application/json">{"a": "\\u003c/script\\u003e"}</script>
+    """
+
+    def __init__(self, data, encoder=None, batch=8192, **attrs):
+        attrs.setdefault('type', 'application/json')
+        self.data = data
+        self.encoder = encoder
+        self.batch = batch
+        self.attrs = attrs
+
+    def _bind(self, context):
+        return json_script(_realize(self.data, context), self.encoder,
+                           self.batch, **self.attrs)
+
+    def _is_static(self):
+        return False
+
+    def _stream(self, context=_unbound):
+        data = self.data
+        if hasattr(data, '_bind'):
+            if context is _unbound:
+                raise ValueError("Unbound defer, unable to stream.")
+            data = _realize(data, context)
+        encoder = self.encoder or _json_encoder
+        start = script(**self.attrs)
+        yield start._open(start.attrs)
+        batch = self.batch
+        chunks = []
+        size = 0
+        for chunk in encoder.iterencode(data):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= batch:
+                _check()
+                yield _json_escape(''.join(chunks))
+                chunks = []
+                size = 0
+        if chunks:
+            yield _json_escape(''.join(chunks))
+        yield '</script>'
+
+    def __str__(self):
+        return ''.join(self._stream())
+
+    __unicode__ = __str__
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, repr(self.data))
+
+
+_json_encoder = json.JSONEncoder()
+
+
+def _json_escape(s):
+    for char, escaped in _json_escapes:
+        if char in s:
+            s = s.replace(char, escaped)
+    return s
+
+
 def pretty(snippet):
     """
     Render a snippet of HTML as a string with line breaks and indentation.
@@ -112,10 +528,26 @@ def pretty(snippet):
 
 
 def _htmltag(_tag, name=None):
-    def _inner(**attrs):
-        return tag(_tag, **attrs)
+    # The tag name and self-closing flag are resolved once, here, rather than
+    # by `tag.__init__` on every construction.  HTML factories are by far the
+    # most common way of building snippets, so it is worth bypassing the
+    # general purpose constructor.
     closing = _tag.endswith('/')
-    __all__.append(name if name else _tag.rstrip('/'))
+    tagname = _tag.rstrip('/')
+    new = tag.__new__
+
+    def _inner(**attrs):
+        obj = new(tag)
+        obj.tag = tagname
+        if closing:
+            obj.self_closing = True
+        if attrs and None in attrs.values():
+            attrs = {k: v for k, v in attrs.items() if v is not None}
+        obj.attrs = attrs
+        obj.children = ()
+        return obj
+
+    __all__.append(name if name else tagname)
     _inner.__name__ = _tag
     _inner.__doc__ = (
         "HTML tag <{0}>".format(_tag)
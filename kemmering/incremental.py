@@ -0,0 +1,233 @@
+"""
+Incremental rendering.
+
+For templates which are rendered over and over with contexts that differ only
+a little from one render to the next.
+"""
+from . import (
+    _enter,
+    _local,
+    _markup,
+    _placeholder,
+    _realize,
+    _render,
+    _scope,
+    tag,
+)
+
+__all__ = ['incremental']
+
+_missing = object()
+_everything = object()
+
+
+class incremental(object):
+    """
+    Renders a template repeatedly, recomputing only the parts of the output
+    whose inputs have changed.
+
+    The template is divided into static markup and dynamic slots: deferred
+    elements and start tags with deferred attributes.  When a slot is
+    rendered, the keys that it reads from the context are recorded, along with
+    its output.  On later renders, a slot is only rendered again if the value
+    of one of those keys has changed, otherwise its previous output is reused.
+    Slots which contain `kemmering.html.shared_style` or `collected_styles`
+    elements are rendered every time.
+
+    Context values are compared by identity and then equality, so a value
+    which is modified in place won't be noticed: put a new value in the
+    context instead.  Deferred functions must not depend on anything other
+    than the context.  The context is presumed to be a dictionary.  The
+    template must not be modified once it has been rendered.  Instances of
+    `incremental` are not safe to share between threads.
+
+    .. doctest:: api-incremental
+
+       >>> from kemmering import defer, from_context, tag
+       >>> from kemmering.incremental import incremental
+       >>> def count(context):
+       ...     print('counting')
+       ...     return str(len(context['items']))
+       >>> page = incremental(tag('p')(
+       ...     from_context('user'), ': ', defer(count), ' items'))
+       >>> items = ['a', 'b']
+       >>> page.render({'user': 'fred', 'items': items})
+       counting
+       '<p>fred: 2 items</p>'
+       >>> page.render({'user': 'barney', 'items': items})
+       '<p>barney: 2 items</p>'
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all previously rendered output.
+        """
+        self._slots = None
+        self._compiled = None
+
+    def render(self, context):
+        """
+        Render the template against `context`, returning a string.
+        """
+        return ''.join(self.stream(context))
+
+    def stream(self, context):
+        """
+        Render the template against `context`, returning an iterator over
+        chunks of the output.  The output is computed before the first chunk
+        is returned.
+        """
+        if self._slots is None or self._stale():
+            self._compile()
+        tracked = _tracked(context, None)
+        output = []
+        placeholders = False
+        previous = _enter(_scope())
+        try:
+            for part in self._slots:
+                if part.__class__ is _markup:
+                    output.append(part)
+                    continue
+                rendered = part.render(context, tracked)
+                if rendered.__class__ is list:
+                    # Output with placeholders, resolved once the rest of the
+                    # output has been rendered.
+                    output.extend(rendered)
+                    placeholders = True
+                else:
+                    output.append(rendered)
+            if placeholders:
+                output = [chunk.resolve() if chunk.__class__ is _placeholder
+                          else chunk for chunk in output]
+        finally:
+            _local.scope = previous
+        return iter(output)
+
+    def _stale(self):
+        template = self.template
+        return (isinstance(template, tag) and
+                template.__dict__.get('_plan') is not self._compiled)
+
+    def _compile(self):
+        parts = []
+        _flatten(self.template, parts)
+        slots = []
+        markup = []
+        for part in parts:
+            if part.__class__ is _markup:
+                markup.append(part)
+                continue
+            if markup:
+                slots.append(_markup(''.join(markup)))
+                markup = []
+            slots.append(part)
+        if markup:
+            slots.append(_markup(''.join(markup)))
+        self._slots = slots
+        if isinstance(self.template, tag):
+            self._compiled = self.template._parts()
+
+
+def _flatten(node, parts):
+    if isinstance(node, tag) and type(node)._stream == tag._stream:
+        for part in node._parts():
+            if part.__class__ is _markup:
+                parts.append(part)
+            elif part is None:
+                parts.append(_starttag(node))
+            else:
+                _flatten(part, parts)
+    else:
+        parts.append(_slot(node))
+
+
+class _slot(object):
+    # A dynamic part of the template, and its most recent output.
+
+    def __init__(self, node):
+        self.node = node
+        self.deps = None
+        self.output = None
+
+    def render(self, context, tracked):
+        deps = self.deps
+        if deps is not None:
+            for key, value in deps.items():
+                current = context.get(key, _missing)
+                if current is not value and current != value:
+                    break
+            else:
+                return self.output
+
+        scope = _local.scope
+        scope.shared = False
+        reads = tracked._reads = set()
+        output = self.output = self._render(tracked)
+        if scope.shared or _everything in reads:
+            self.deps = None
+        else:
+            self.deps = {key: context.get(key, _missing) for key in reads}
+        return output
+
+    def _render(self, context):
+        # Returns the output as a string or, if it contains placeholders, as a
+        # list of chunks.
+        scope = _local.scope
+        scope.placeholders = False
+        chunks = list(_render(self.node, context))
+        if scope.placeholders:
+            return chunks
+        return ''.join(chunks)
+
+
+class _starttag(_slot):
+    # The start tag of a tag with deferred attributes.
+
+    def _render(self, context):
+        node = self.node
+        attrs = {k: _realize(v, context) for k, v in node.attrs.items()}
+        return node._open({k: v for k, v in attrs.items() if v is not None})
+
+
+class _tracked(dict):
+    # A copy of the context which records the keys which are read from it.
+
+    def __init__(self, context, reads):
+        super(_tracked, self).__init__(context)
+        self._reads = reads
+
+    def __getitem__(self, key):
+        self._reads.add(key)
+        return super(_tracked, self).__getitem__(key)
+
+    def __contains__(self, key):
+        self._reads.add(key)
+        return super(_tracked, self).__contains__(key)
+
+    def get(self, key, default=None):
+        self._reads.add(key)
+        return super(_tracked, self).get(key, default)
+
+    def copy(self):
+        # Copied without reading it, which would record every key.
+        return _tracked(dict(dict.items(self)), self._reads)
+
+    def __iter__(self):
+        self._reads.add(_everything)
+        return super(_tracked, self).__iter__()
+
+    def keys(self):
+        self._reads.add(_everything)
+        return super(_tracked, self).keys()
+
+    def values(self):
+        self._reads.add(_everything)
+        return super(_tracked, self).values()
+
+    def items(self):
+        self._reads.add(_everything)
+        return super(_tracked, self).items()
@@ -0,0 +1,258 @@
+"""
+Operational metrics for templates.
+
+Templates which are wrapped with `named` record, each time they are bound or
+streamed, how long it took, how much output was produced and whether an
+exception was raised.  Measurements are passed to a sink, which is set with
+`enable`.  Until then, `named` templates record nothing, and cost very little
+more than the templates they wrap.
+"""
+import threading
+
+from . import _clock, _realize, _render, _unbound
+
+__all__ = ['named', 'registry', 'enable', 'disable']
+
+_sink = None
+
+
+def enable(sink=None):
+    """
+    Start recording metrics for `named` templates.
+
+    `sink` is an object with a method, `observe`, with the signature:
+
+    .. code-block:: python
+
+       def observe(name, mode, seconds, size, error):
+           "Record a single realization of a named template."
+
+    `name` is the name of the template.  `mode` is `'bind'` or `'stream'`.
+    `seconds` is the time spent realizing the template.  `size` is the number
+    of characters of output, or `None` for `'bind'`.  `error` is `True` if an
+    exception was raised.
+
+    If `sink` isn't given, a new `registry` is used.  Returns the sink.
+    """
+    global _sink
+    if sink is None:
+        sink = registry()
+    _sink = sink
+    return sink
+
+
+def disable():
+    """
+    Stop recording metrics.
+    """
+    global _sink
+    _sink = None
+
+
+class named(object):
+    """
+    Give a template a name, for metrics.
+
+    `name` is the name under which metrics are recorded.  `template` is the
+    template.  A named template can be used anywhere the template itself
+    could be: passed to `bind`, `stream` or `render`, or included in another
+    template.  The time recorded for a named template includes the time for
+    any named templates inside of it.  When streaming, only the time spent
+    producing the output is counted, not the time spent by the consumer of the
+    output.
+
+    .. doctest:: api-named
+
+       >>> from kemmering import from_context, render, tag
+       >>> from kemmering import metrics
+       >>> template = metrics.named('greeting', tag('p')(from_context('name')))
+       >>> sink = metrics.enable()
+       >>> render(template, {'name': 'fred'})
+       '<p>fred</p>'
+       >>> sink.count('greeting', 'stream')
+       1
+       >>> metrics.disable()
+    """
+
+    def __init__(self, name, template):
+        self.name = name
+        self.template = template
+
+    def _bind(self, context):
+        sink = _sink
+        if sink is None:
+            return _realize(self.template, context)
+        start = _clock()
+        try:
+            bound = _realize(self.template, context)
+        except Exception:
+            sink.observe(self.name, 'bind', _clock() - start, None, True)
+            raise
+        sink.observe(self.name, 'bind', _clock() - start, None, False)
+        return bound
+
+    def _stream(self, context=_unbound):
+        chunks = _render(self.template, context)
+        sink = _sink
+        if sink is None or context is _unbound:
+            return chunks
+        return self._measured(chunks, sink)
+
+    def _measured(self, chunks, sink):
+        seconds = 0.0
+        size = 0
+        try:
+            while True:
+                start = _clock()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += _clock() - start
+                size += len(chunk)
+                yield chunk
+        except Exception:
+            sink.observe(self.name, 'stream', seconds, size, True)
+            raise
+        sink.observe(self.name, 'stream', seconds, size, False)
+
+    def _is_static(self):
+        return False
+
+    def __repr__(self):
+        return '{}({}, {})'.format(
+            type(self).__name__, repr(self.name), repr(self.template))
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class registry(object):
+    """
+    A metrics sink which keeps metrics in memory.
+
+    For each template name and mode, counts the number of realizations and
+    the number which raised an exception, and totals the size of the output.
+    Durations are counted in a histogram with the given `buckets`, which are
+    the upper bounds, in seconds, of the buckets.  Safe to use from multiple
+    threads.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def observe(self, name, mode, seconds, size, error):
+        """
+        Record a single realization of a named template.
+        """
+        with self._lock:
+            metric = self._metrics.get((name, mode))
+            if metric is None:
+                metric = self._metrics[(name, mode)] = _metric(
+                    len(self.buckets))
+            metric.count += 1
+            if error:
+                metric.errors += 1
+            metric.seconds += seconds
+            if size is not None:
+                metric.size += size
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    metric.histogram[i] += 1
+                    break
+
+    def count(self, name, mode):
+        """
+        Returns the number of times the named template has been realized in
+        the given mode.
+        """
+        metric = self._metrics.get((name, mode))
+        return metric.count if metric else 0
+
+    def errors(self, name, mode):
+        """
+        Returns the number of times realizing the named template, in the given
+        mode, has raised an exception.
+        """
+        metric = self._metrics.get((name, mode))
+        return metric.errors if metric else 0
+
+    def size(self, name, mode):
+        """
+        Returns the total number of characters of output produced by the named
+        template in the given mode.
+        """
+        metric = self._metrics.get((name, mode))
+        return metric.size if metric else 0
+
+    def dump(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = sorted(
+                (key, metric.copy()) for key, metric in self._metrics.items())
+        lines = []
+        for name, kind, description, value in (
+                ('kemmering_renders_total', 'counter',
+                 'Number of times a named template was realized.',
+                 lambda metric: metric.count),
+                ('kemmering_render_errors_total', 'counter',
+                 'Number of times realizing a named template raised an '
+                 'exception.',
+                 lambda metric: metric.errors),
+                ('kemmering_render_output_characters_total', 'counter',
+                 'Characters of output produced by a named template.',
+                 lambda metric: metric.size)):
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for key, metric in metrics:
+                lines.append('{}{{{}}} {}'.format(
+                    name, _labels(key), value(metric)))
+
+        name = 'kemmering_render_seconds'
+        lines.append('# HELP {} Time spent realizing a named template.'.format(
+            name))
+        lines.append('# TYPE {} histogram'.format(name))
+        for key, metric in metrics:
+            labels = _labels(key)
+            total = 0
+            for bound, count in zip(self.buckets, metric.histogram):
+                total += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    name, labels, repr(bound), total))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(
+                name, labels, metric.count))
+            lines.append('{}_sum{{{}}} {}'.format(
+                name, labels, repr(metric.seconds)))
+            lines.append('{}_count{{{}}} {}'.format(
+                name, labels, metric.count))
+        return '\n'.join(lines) + '\n'
+
+
+class _metric(object):
+    # The metrics for a single template name and mode.
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.size = 0
+        self.histogram = [0] * buckets
+
+    def copy(self):
+        metric = _metric(0)
+        metric.__dict__.update(self.__dict__)
+        metric.histogram = list(self.histogram)
+        return metric
+
+
+def _labels(key):
+    name, mode = key
+    return 'template="{}",mode="{}"'.format(
+        name.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'),
+        mode)
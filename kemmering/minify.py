@@ -0,0 +1,327 @@
+"""
+Minification.
+
+`minify` makes a copy of a template which produces smaller output, by leaving
+out whitespace and, for HTML5, markup which browsers don't need.  The copy is
+made once, when the template is loaded, so only the deferred parts of the
+template have to be minified as it is rendered.
+"""
+import copy
+import re
+from xml.sax.saxutils import escape
+
+from . import (
+    _check,
+    _plaintext,
+    _realize,
+    _render,
+    _unbound,
+    cdata,
+    cond,
+    defer,
+    loop,
+    strbase,
+    switch,
+    tag,
+    text,
+)
+from .html import _compact, collected_styles, shared_style, style
+from .metrics import named
+
+__all__ = ['minify']
+
+_whitespace = re.compile(r'\s+')
+_unquoted = re.compile(r'^[^\s"\'=<>`]+$')
+
+# Elements whose contents are left exactly as they are.
+_preserved = frozenset(('pre', 'textarea', 'script', 'style'))
+
+# Elements which never have contents, so are written as just a start tag.
+_void = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr'))
+
+# For each element whose end tag may be left out in HTML5, the elements which
+# may follow it when it is.  `None` stands for the end of the parent element.
+# See https://html.spec.whatwg.org/multipage/syntax.html#optional-tags
+_blocks = frozenset((
+    'address', 'article', 'aside', 'blockquote', 'details', 'div', 'dl',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'header', 'hgroup', 'hr', 'main', 'menu', 'nav', 'ol',
+    'p', 'pre', 'section', 'table', 'ul'))
+_optional = {
+    'html': frozenset((None,)),
+    'head': frozenset(('body',)),
+    'body': frozenset((None,)),
+    'li': frozenset(('li', None)),
+    'dt': frozenset(('dt', 'dd')),
+    'dd': frozenset(('dt', 'dd', None)),
+    'p': _blocks.union((None,)),
+    'optgroup': frozenset(('optgroup', None)),
+    'option': frozenset(('option', 'optgroup', None)),
+    'thead': frozenset(('tbody', 'tfoot')),
+    'tbody': frozenset(('tbody', 'tfoot', None)),
+    'tfoot': frozenset((None,)),
+    'tr': frozenset(('tr', None)),
+    'td': frozenset(('td', 'th', None)),
+    'th': frozenset(('td', 'th', None)),
+}
+
+# Parents at whose end the end tag of a `p` may not be left out.
+_transparent = frozenset(('a', 'audio', 'del', 'ins', 'map', 'noscript',
+                          'video'))
+
+# Stands for output which can't be known until the template is rendered.
+_unknown = object()
+
+
+def minify(template, html5=False):
+    """
+    Make a copy of a template which produces smaller output.
+
+    In text, each run of whitespace is replaced by a single space, except in
+    <pre></pre>, <textarea></textarea>, <script></script> and
+    <style></style> tags, and in `cdata`.  This is done once for text in the
+    template, and as the template is rendered for text produced by deferred
+    elements, such as `from_context`.  The rules of `kemmering.html.style`
+    and `shared_style` elements, and of `collected_styles`, are written
+    without whitespace.
+
+    If `html5` is `True`, the output is further reduced in ways that are
+    allowed by HTML5, but not by XML: end tags are left out where HTML5 says
+    they are optional and it can be told from the template that the elements
+    which follow allow it, quotes are left out of attribute values which
+    don't need them, and void elements, such as <br>, are written without
+    a closing slash.
+
+    .. doctest:: api-minify
+
+       >>> from kemmering import from_context, render
+       >>> from kemmering.html import li, p, ul
+       >>> from kemmering.minify import minify
+       >>> template = ul(class_='menu')(li()('  Home  '), li()(
+       ...     p()(from_context('text'))))
+       >>> render(minify(template), {'text': ' a \\n b '})
+       '<ul class="menu"><li> Home </li><li><p> a b </p></li></ul>'
+       >>> render(minify(template, html5=True), {'text': ' a \\n b '})
+       '<ul class=menu><li> Home <li><p> a b </ul>'
+    """
+    return _minify(template, html5, frozenset((_unknown,)), None)
+
+
+def _minify(node, html5, after, parent):
+    # Returns a minified copy of `node`.  `after` is the set of the names of
+    # the elements which may follow it, and `parent` is the name of the
+    # element it is in.
+    if isinstance(node, tag):
+        return _copytag(node, html5, after, parent)
+    if isinstance(node, strbase):
+        if isinstance(node, cdata):
+            return node
+        minified = _whitespace.sub(' ', node)
+        return text(minified) if isinstance(node, text) else minified
+    if isinstance(node, shared_style):
+        minified = _sharedstyle()
+        minified.styles = node.styles
+        return minified
+    if isinstance(node, style):
+        minified = _style()
+        minified.styles = node.styles
+        return minified
+    if isinstance(node, collected_styles):
+        return collected_styles(minify=True)
+    if isinstance(node, cond):
+        minified = copy.copy(node)
+        minified.yes = _minify(node.yes, html5, after, parent)
+        minified.no = _minify(node.no, html5, after, parent)
+        return minified
+    if isinstance(node, switch):
+        minified = copy.copy(node)
+        minified.cases = {value: _minify(case, html5, after, parent)
+                          for value, case in node.cases.items()}
+        minified.default = _minify(node.default, html5, after, parent)
+        return minified
+    if isinstance(node, loop):
+        minified = copy.copy(node)
+        following = _leading(node.template).union(after)
+        if None not in after:
+            following = following.difference((None,))
+        minified.template = _minify(node.template, html5, following, parent)
+        return minified
+    if isinstance(node, named):
+        minified = copy.copy(node)
+        minified.template = _minify(node.template, html5, after, parent)
+        return minified
+    if isinstance(node, defer):
+        return _minifying(node, html5, after, parent)
+    return node
+
+
+def _copy(node):
+    # Copies a tree of tags, so the copy belongs to the minified template.
+    if not isinstance(node, tag):
+        return node
+    return node._copy(node.attrs, tuple(_copy(child)
+                                        for child in node.children))
+
+
+def _copytag(node, html5, after, parent):
+    if node.tag:
+        name = node.tag
+        end = frozenset((None,))
+    else:
+        name = parent
+        end = after
+    children = node.children
+    if name in _preserved:
+        minified = tuple(_copy(child) for child in children)
+    else:
+        minified = tuple(
+            _minify(child, html5, _following(children[i + 1:], end), name)
+            for i, child in enumerate(children))
+    if not html5 or not node.tag:
+        return node._copy(node.attrs, minified)
+    cls = _html5class(type(node))
+    obj = cls.__new__(cls)
+    obj._init(node.tag, node.attrs, minified)
+    obj.self_closing = node.self_closing
+    optional = _optional.get(node.tag)
+    if optional is not None and not (node.tag == 'p' and (
+            parent in _transparent)):
+        obj.omit = after.issubset(optional)
+    return obj
+
+
+def _following(siblings, end):
+    # The set of names of the elements which may follow a node, given the
+    # siblings which follow it and the set for the end of its parent.
+    following = set()
+    for sibling in siblings:
+        leading = _leading(sibling)
+        following.update(leading)
+        if None not in leading:
+            following.discard(None)
+            return frozenset(following)
+        following.discard(None)
+    return frozenset(following.union(end))
+
+
+def _leading(node):
+    # The set of names of the elements which output of `node` may start with.
+    # `None` if it may be empty, and `_unknown` if it may start with text or
+    # with output that can't be known from the template.
+    if isinstance(node, tag):
+        if node.tag:
+            return frozenset((node.tag,))
+        return _following(node.children, frozenset((None,)))
+    if isinstance(node, strbase):
+        return frozenset((_unknown,)) if node else frozenset((None,))
+    if isinstance(node, cond):
+        return _leading(node.yes).union(_leading(node.no))
+    if isinstance(node, switch):
+        leading = set(_leading(node.default))
+        for case in node.cases.values():
+            leading.update(_leading(case))
+        return frozenset(leading)
+    if isinstance(node, loop):
+        return _leading(node.template).union((None,))
+    if isinstance(node, (style, collected_styles)):
+        return frozenset(('style', None))
+    return frozenset((_unknown, None))
+
+
+class _style(style):
+    # A `style` which is written without whitespace.
+
+    def _stream(self, context=_unbound):
+        return _compact(self.styles)
+
+
+class _sharedstyle(shared_style):
+    # A `shared_style` which, when written as a `style` tag, is written
+    # without whitespace.
+    _inline = _style
+
+    def _stream(self, context=_unbound):
+        if context is _unbound:
+            return _compact(self.styles)
+        return self._share()._stream()
+
+
+class _minifying(object):
+    # A deferred element whose output is minified as it is realized.
+
+    def __init__(self, node, html5, after, within):
+        self.node = node
+        self.html5 = html5
+        self.after = after
+        self.within = within
+
+    def _bind(self, context):
+        return _minify(_realize(self.node, context), self.html5, self.after,
+                       self.within)
+
+    def _stream(self, context=_unbound):
+        if context is _unbound:
+            raise ValueError("Unbound defer, unable to stream.")
+        _check()
+        value = self.node._resolve(context)
+        if value.__class__ in _plaintext:
+            # The common case, text from the context.
+            return iter((escape(_whitespace.sub(' ', value)),))
+        return _render(_minify(value, self.html5, self.after, self.within),
+                       context)
+
+    def _is_static(self):
+        return False
+
+    def __repr__(self):
+        return 'minify({})'.format(repr(self.node))
+
+
+class _html5(object):
+    # Mixin for tags which are written as HTML5, with optional end tags and
+    # attribute quotes left out.  See `_html5class`.
+
+    omit = False
+
+    def _open(self, attrs):
+        if attrs:
+            attrs = ''.join(
+                ' {}={}'.format(k.rstrip('_'), _quote(v))
+                for k, v in attrs.items())
+        else:
+            attrs = ''
+        if self.self_closing and not self.children:
+            if self.tag in _void:
+                return '<{}{}>'.format(self.tag, attrs)
+            return '<{}{}/>'.format(self.tag, attrs)
+        return '<{}{}>'.format(self.tag, attrs)
+
+    def _close(self):
+        if self.omit:
+            return ''
+        return super(_html5, self)._close()
+
+    def _copy(self, attrs, children):
+        obj = super(_html5, self)._copy(attrs, children)
+        obj.omit = self.omit
+        return obj
+
+
+def _quote(value):
+    value = '{}'.format(value)
+    if _unquoted.match(value):
+        return value
+    return '"{}"'.format(value)
+
+
+_html5classes = {}
+
+
+def _html5class(cls):
+    html5class = _html5classes.get(cls)
+    if html5class is None:
+        html5class = _html5classes[cls] = type(
+            cls.__name__, (_html5, cls), {})
+    return html5class
@@ -0,0 +1,258 @@
+"""
+Output modes for rendering templates.
+
+The functions here render templates directly to encoded output, rather than to
+a `str` which must then be encoded in a separate pass.
+"""
+import codecs
+import io
+import os
+import zlib
+
+from . import FLUSH, _markup, stream
+
+__all__ = ['stream_bytes', 'render_bytes', 'stream_segments',
+           'send_segments', 'write_segments', 'stream_compressed']
+
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):  # pragma: no cover
+    IOV_MAX = 1024
+if IOV_MAX <= 0:  # pragma: no cover
+    IOV_MAX = 1024
+
+
+class _flushmark(bytes):
+    # The type of `FLUSH_BYTES`, so it can't be confused with empty bytes.
+    pass
+
+
+#: Yielded by `stream_bytes` in place of :data:`kemmering.FLUSH`.
+FLUSH_BYTES = _flushmark(b'')
+
+
+def stream_bytes(template, context, encoding='utf-8'):
+    """
+    Realize a template incrementally as encoded bytes.
+
+    Works like :func:`kemmering.stream`, but yields `bytes` in the given
+    `encoding`.  Static markup is encoded once and the encoded bytes are reused
+    by later renders of the same template, so only the dynamic parts of the
+    template are encoded on each render.  Characters which cannot be
+    represented in `encoding` are written as XML character references.  For
+    encodings which begin with a byte order mark, such as `'utf-16'`, the
+    byte order mark is yielded once, first.  Where a :class:`kemmering.flush`
+    element is streamed, `FLUSH_BYTES`, which is empty, is yielded.
+
+    .. doctest:: api-stream_bytes
+
+       >>> from kemmering import from_context, tag
+       >>> from kemmering.output import stream_bytes
+       >>> template = tag('a')(tag('b')('c'), from_context('d'))
+       >>> list(stream_bytes(template, {'d': u'\\u00e9'}))
+       [b'<a><b>c</b>', b'\\xc3\\xa9', b'</a>']
+    """
+    bom, encode = _encoder(encoding)
+    if bom:
+        yield bom
+    for chunk in stream(template, context):
+        if chunk.__class__ is _markup:
+            yield chunk._bytes(encoding, encode)
+        elif chunk is FLUSH:
+            yield FLUSH_BYTES
+        else:
+            yield encode(chunk)
+
+
+def _encoder(encoding):
+    # Returns the byte order mark for `encoding`, if it has one, and a
+    # function which encodes a chunk of output after it.  Each chunk is
+    # encoded completely, leaving the encoder in its initial state, so the
+    # encoded chunks can be cached and reused in any order.
+    encode = codecs.getincrementalencoder(encoding)('xmlcharrefreplace').encode
+    bom = encode('', True)
+    return bom, lambda chunk: encode(chunk, True)
+
+
+def render_bytes(template, context, encoding='utf-8', out=None):
+    """
+    Realize a template as encoded bytes.
+
+    `template`, `context` and `encoding` are as for `stream_bytes`.  If `out`
+    is given, it should be a writable binary file-like object, such as an
+    `io.BytesIO`, and the output is written to it, and where a
+    :class:`kemmering.flush` element is rendered, `out` is flushed, if it has
+    a `flush` method.  Otherwise, the output is returned as `bytes`.
+
+    .. doctest:: api-render_bytes
+
+       >>> from kemmering import from_context, tag
+       >>> from kemmering.output import render_bytes
+       >>> template = tag('a')(from_context('b'))
+       >>> render_bytes(template, {'b': u'\\u00e9'})
+       b'<a>\\xc3\\xa9</a>'
+       >>> render_bytes(template, {'b': u'\\u00e9\\u20ac'}, 'latin-1')
+       b'<a>\\xe9&#8364;</a>'
+    """
+    buf = io.BytesIO() if out is None else out
+    write = buf.write
+    flush = getattr(out, 'flush', None)
+    for chunk in stream_bytes(template, context, encoding):
+        if chunk is FLUSH_BYTES:
+            if flush is not None:
+                flush()
+        else:
+            write(chunk)
+    if out is None:
+        return buf.getvalue()
+
+
+def stream_segments(template, context, encoding='utf-8', limit=IOV_MAX):
+    """
+    Realize a template incrementally as batches of encoded segments.
+
+    Yields lists of `bytes` segments suitable for passing to `os.writev` or
+    `socket.sendmsg`.  No list has more than `limit` segments, which defaults
+    to the platform limit, `IOV_MAX`.  Static markup is passed along as the
+    same `bytes` objects that are cached with the template, so sending a
+    mostly static page involves very little copying.  `template`, `context`
+    and `encoding` are as for `stream_bytes`.  Where a
+    :class:`kemmering.flush` element is streamed, the batch so far is yielded,
+    even if it isn't full.
+
+    .. doctest:: api-stream_segments
+
+       >>> from kemmering import from_context, tag
+       >>> from kemmering.output import stream_segments
+       >>> template = tag('a')(tag('b')('c'), from_context('d'))
+       >>> list(stream_segments(template, {'d': 'e'}, limit=2))
+       [[b'<a><b>c</b>', b'e'], [b'</a>']]
+    """
+    batch = []
+    append = batch.append
+    for chunk in stream_bytes(template, context, encoding):
+        if chunk:
+            append(chunk)
+            if len(batch) >= limit:
+                yield batch
+                batch = []
+                append = batch.append
+        elif chunk is FLUSH_BYTES and batch:
+            yield batch
+            batch = []
+            append = batch.append
+    if batch:
+        yield batch
+
+
+def send_segments(sock, template, context, encoding='utf-8', limit=IOV_MAX):
+    """
+    Render a template to a socket using `socket.sendmsg`.
+
+    Sends the batches produced by `stream_segments`, retrying partial sends
+    until all of the output has been sent.  Returns the number of bytes sent.
+    """
+    return _send_all(sock.sendmsg, stream_segments(
+        template, context, encoding, limit))
+
+
+def write_segments(fd, template, context, encoding='utf-8', limit=IOV_MAX):
+    """
+    Render a template to a file descriptor using `os.writev`.
+
+    Writes the batches produced by `stream_segments`, retrying partial writes
+    until all of the output has been written.  Returns the number of bytes
+    written.
+    """
+    return _send_all(lambda buffers: os.writev(fd, buffers), stream_segments(
+        template, context, encoding, limit))
+
+
+_wbits = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def stream_compressed(template, context, encoding='utf-8', method='gzip',
+                      level=6, flush_after=('head',)):
+    """
+    Realize a template incrementally as compressed bytes.
+
+    The output of `stream_bytes` is compressed as it is produced, and the
+    compressed data is yielded as soon as the compressor has any, so the whole
+    page is never held in memory either as a `str` or as uncompressed bytes.
+    `method` is `'gzip'` or `'deflate'`, for the HTTP `Content-Encoding` of
+    the same name, and `level` is the `zlib` compression level.
+
+    The compressor normally holds on to output until it has enough to
+    compress well.  At the end tag of each element named in `flush_after`,
+    all of the output so far is flushed, so that it can be sent to the client
+    right away.  By default, this is done after the `head` element, so a
+    browser can start fetching the stylesheets and scripts it links to while
+    the rest of the page is rendered.  The compressor is also flushed where a
+    :class:`kemmering.flush` element is streamed.  `template`, `context` and
+    `encoding` are as for `stream_bytes`.
+
+    .. doctest:: api-stream_compressed
+
+       >>> import zlib
+       >>> from kemmering import from_context, tag
+       >>> from kemmering.output import stream_compressed
+       >>> template = tag('html')(
+       ...     tag('head')(tag('title')('Hello')),
+       ...     tag('body')(from_context('body')))
+       >>> chunks = list(stream_compressed(template, {'body': 'World'}))
+       >>> zlib.decompress(b''.join(chunks), 16 + zlib.MAX_WBITS)
+       b'<html><head><title>Hello</title></head><body>World</body></html>'
+       >>> zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(chunks[0])
+       b'<html><head><title>Hello</title></head>'
+    """
+    try:
+        wbits = _wbits[method]
+    except KeyError:
+        raise ValueError('Unknown compression method: {}'.format(method))
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    compress = compressor.compress
+    # An end tag is always serialized whole, within a single chunk, and is
+    # encoded, like the chunk, without a byte order mark.
+    encode = _encoder(encoding)[1]
+    markers = [encode(u'</{}>'.format(name)) for name in flush_after]
+    for chunk in stream_bytes(template, context, encoding):
+        if chunk is FLUSH_BYTES:
+            yield compressor.flush(zlib.Z_SYNC_FLUSH)
+            continue
+        end = max([chunk.rfind(marker) + len(marker) for marker in markers
+                   if marker in chunk] or [0])
+        if end:
+            data = compress(chunk[:end]) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            chunk = chunk[end:]
+            if chunk:
+                data += compress(chunk)
+        else:
+            data = compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _send_all(send, batches):
+    total = 0
+    for batch in batches:
+        while batch:
+            sent = send(batch)
+            total += sent
+            batch = _advance(batch, sent)
+    return total
+
+
+def _advance(segments, sent):
+    # Drop the first `sent` bytes from a list of segments.
+    for i, segment in enumerate(segments):
+        size = len(segment)
+        if sent < size:
+            rest = segments[i + 1:]
+            rest.insert(0, memoryview(segment)[sent:])
+            return rest
+        sent -= size
+    return []
@@ -0,0 +1,219 @@
+"""
+Streaming XML writer.
+
+For documents which are written out one element at a time, and never exist as
+a tree of `tag` objects.
+"""
+import codecs
+from xml.sax.saxutils import escape
+
+from . import FLUSH, _render, _unbound, cdata, stream, tag
+
+__all__ = ['writer']
+
+
+class writer(object):
+    """
+    Writes XML to a file-like object one element at a time.
+
+    `out` is a file-like object with a `write` method.  If `encoding` is
+    given, `out` should be opened in binary mode and output is written to it
+    encoded, with characters which cannot be represented in `encoding` written
+    as XML character references.  Otherwise, output is written to `out` as
+    strings.
+
+    Output is buffered: nothing is written to `out` until at least
+    `buffer_size` characters have been written to the writer, or `flush` or
+    `close` is called.  Used as a context manager, the writer is closed on
+    exit.  Closing the writer doesn't close `out`.
+
+    Elements are serialized in the same way as `tag` objects: tag names with a
+    trailing forward slash are self-closing, text is escaped, and attribute
+    names have trailing underscores removed.
+
+    .. doctest:: api-writer
+
+       >>> import io
+       >>> from kemmering import from_context, tag
+       >>> from kemmering.html import pretty
+       >>> from kemmering.writer import writer
+       >>> out = io.StringIO()
+       >>> with writer(out) as w:
+       ...     with w.tag('feed'):
+       ...         for i in range(2):
+       ...             with w.tag('entry', id=str(i)):
+       ...                 w.element('title', 'Fish & Chips')
+       ...                 w.element('br/')
+       ...         w.snippet(tag('footer')(from_context('year')),
+       ...                   {'year': '2017'})
+       >>> print(pretty(out.getvalue()))
+       <feed>
+         <entry id="0">
+           <title>Fish &amp; Chips</title>
+           <br/>
+         </entry>
+         <entry id="1">
+           <title>Fish &amp; Chips</title>
+           <br/>
+         </entry>
+         <footer>2017</footer>
+       </feed>
+       <BLANKLINE>
+    """
+
+    def __init__(self, out, encoding=None, buffer_size=65536):
+        self.out = out
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._size = 0
+        self._pending = None
+        if encoding is not None:
+            # One encoder for the whole document, so a byte order mark is
+            # written only once, however many times the writer is flushed.
+            self._encode = codecs.getincrementalencoder(encoding)(
+                'xmlcharrefreplace').encode
+
+    def tag(self, tag, **attrs):
+        """
+        Write an element whose children are written in the body of a `with`
+        statement.
+
+        `tag` and `attrs` are as for :class:`kemmering.tag`.  The start tag is
+        written on entering the `with` statement and the end tag on leaving
+        it.  A self-closing tag which has no children written for it is
+        written as a single, self-closing tag.
+        """
+        return _element(self, _tag(tag, attrs))
+
+    def element(self, tag, *children, **attrs):
+        """
+        Write a complete element.
+
+        `tag` and `attrs` are as for :class:`kemmering.tag`, and `children` are
+        written as if by `snippet`.
+        """
+        node = _tag(tag, attrs)
+        if node.self_closing and not children:
+            self._write(node._open(node.attrs))
+            return
+        node.self_closing = False
+        self._write(node._open(node.attrs))
+        for child in children:
+            self.snippet(child)
+        self._write(node._close())
+
+    def text(self, text):
+        """
+        Write text, which is escaped.
+        """
+        self._write(escape(text))
+
+    def cdata(self, text):
+        """
+        Write a CDATA section.
+        """
+        for chunk in cdata(text)._stream():
+            self._write(chunk)
+
+    def snippet(self, snippet, context=None):
+        """
+        Write a snippet, such as a `tag`, a bound template or a string.  If
+        `context` is given, `snippet` is a template, which is realized with
+        `context` as it is written, as by :func:`kemmering.stream`.  Where a
+        :class:`kemmering.flush` element is written, the writer is flushed, and
+        so is `out`, if it has a `flush` method.
+        """
+        if context is None:
+            chunks = _render(snippet, _unbound)
+        else:
+            chunks = stream(snippet, context)
+        for chunk in chunks:
+            if chunk is FLUSH:
+                self._flush()
+            else:
+                self._write(chunk)
+
+    def flush(self):
+        """
+        Write any buffered output to `out`.
+        """
+        if self._buffer:
+            data = ''.join(self._buffer)
+            if self.encoding is not None:
+                data = self._encode(data, True)
+            self.out.write(data)
+            self._buffer = []
+            self._size = 0
+
+    def close(self):
+        """
+        Write any buffered output to `out`.  An element which has been
+        started, but not finished, is not finished.
+        """
+        self._open()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open(self):
+        # Writes the start tag of a self-closing element which turns out to
+        # have children.
+        node = self._pending
+        if node is not None:
+            self._pending = None
+            node.self_closing = False
+            self._write(node._open(node.attrs))
+
+    def _flush(self):
+        self.flush()
+        flush = getattr(self.out, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def _write(self, s):
+        if self._pending is not None:
+            self._open()
+        self._buffer.append(s)
+        self._size += len(s)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+
+class _element(object):
+    # The context manager returned by `writer.tag`.
+
+    def __init__(self, writer, node):
+        self.writer = writer
+        self.node = node
+
+    def __enter__(self):
+        writer = self.writer
+        node = self.node
+        if node.self_closing:
+            if writer._pending is not None:
+                writer._open()
+            writer._pending = node
+        else:
+            writer._write(node._open(node.attrs))
+        return writer
+
+    def __exit__(self, exc_type, exc, tb):
+        writer = self.writer
+        node = self.node
+        if writer._pending is node:
+            writer._pending = None
+            writer._write(node._open(node.attrs))
+        else:
+            writer._write(node._close())
+
+
+def _tag(name, attrs):
+    # A childless tag, used to serialize start and end tags.
+    node = tag(name)
+    node.attrs = {k: v for k, v in attrs.items() if v is not None}
+    return node
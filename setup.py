@@ -52,5 +52,10 @@ setup(
     extras_require={
         'testing': testing_extras,
         'docs': docs_extras,
-    }
+    },
+    entry_points={
+        'console_scripts': [
+            'kemmering-analyze = kemmering.analyze:main',
+        ],
+    },
 )
@@ -0,0 +1,147 @@
+import socket
+import threading
+
+import pytest
+
+asyncio = pytest.importorskip('asyncio')
+if not hasattr(asyncio, 'ensure_future'):  # pragma: no cover
+    pytest.skip('requires Python 3.5', allow_module_level=True)
+
+
+def _template():
+    from kemmering import from_context, loop, tag
+    return tag('ul')(loop('i', 'items', tag('li')(from_context('i'))))
+
+
+def _run(loop, awaitable):
+    return loop.run_until_complete(asyncio.ensure_future(awaitable, loop=loop))
+
+
+def _collect(loop, chunks):
+    collected = []
+    while True:
+        try:
+            collected.append(_run(loop, chunks.__anext__()))
+        except StopAsyncIteration:  # nopep8
+            return collected
+
+
+@pytest.fixture
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def test_stream(event_loop):
+    from kemmering import render
+    from kemmering import aio
+
+    context = {'items': [str(i) for i in range(10)]}
+    chunks = aio.stream(_template(), context, every=3)
+    assert chunks.__aiter__() is chunks
+    assert ''.join(_collect(event_loop, chunks)) == render(
+        _template(), context)
+
+
+def test_stream_yields_to_event_loop():
+    from kemmering import aio
+
+    context = {'items': [str(i) for i in range(10)]}
+    stream = aio.stream(_template(), context, every=4, interval=60)
+    paused = []
+    while True:
+        try:
+            waiting = stream.__anext__()
+        except StopAsyncIteration:  # nopep8
+            break
+        try:
+            assert next(waiting) is None
+        except StopIteration:
+            paused.append(False)
+        else:
+            paused.append(True)
+            with pytest.raises(StopIteration):
+                next(waiting)
+    # Control is returned to the event loop after every 4th chunk.
+    assert len(paused) == 32
+    assert [i for i, p in enumerate(paused) if p] == list(range(3, 32, 4))
+
+
+def test_stream_interval(event_loop):
+    from kemmering import aio
+
+    stream = aio.stream(_template(), {'items': ['a']}, every=100, interval=0)
+    waiting = stream.__anext__()
+    assert waiting.__await__() is waiting
+    assert next(waiting) is None
+    with pytest.raises(StopIteration):
+        waiting.send(None)
+
+
+class _Writer(object):
+    # Records what is written, and when `drain` is awaited.
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def drain(self):
+        self.written.append(None)
+        return asyncio.sleep(0)
+
+
+def test_write(event_loop):
+    from kemmering import aio
+    from kemmering.output import render_bytes
+
+    context = {'items': [str(i) for i in range(3)]}
+    writer = _Writer()
+    total = _run(event_loop, aio.write(writer, _template(), context, every=3))
+    expected = render_bytes(_template(), context)
+    assert total == len(expected)
+    assert b''.join(b for b in writer.written if b) == expected
+    assert [i for i, b in enumerate(writer.written) if b is None] == [3, 7, 11]
+
+
+def test_write_flush(event_loop):
+    from kemmering import flush, tag
+    from kemmering import aio
+
+    writer = _Writer()
+    template = tag('a')('b', flush(), 'c')
+    _run(event_loop, aio.write(writer, template, {}, interval=60))
+    assert writer.written == [b'<a>b', b'', None, b'c</a>']
+
+
+def test_write_backpressure(event_loop):
+    from kemmering import aio
+    from kemmering.output import render_bytes
+
+    context = {'items': [str(i) * 1000 for i in range(1000)]}
+    expected = render_bytes(_template(), context)
+    a, b = socket.socketpair()
+    received = []
+
+    def read():
+        while True:
+            data = b.recv(65536)
+            if not data:
+                break
+            received.append(data)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        _, writer = _run(event_loop, asyncio.open_connection(sock=a))
+        writer.transport.set_write_buffer_limits(high=4096)
+        assert _run(event_loop, aio.write(
+            writer, _template(), context)) == len(expected)
+        writer.close()
+        _run(event_loop, writer.wait_closed())
+    finally:
+        reader.join()
+        b.close()
+    assert b''.join(received) == expected
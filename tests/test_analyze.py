@@ -0,0 +1,106 @@
+import sys
+import types
+
+import pytest
+
+
+def _template():
+    from kemmering import cond, defer, format_context, from_context, loop, tag
+    from kemmering import switch
+
+    return tag('html')(
+        tag('head')(tag('title')('Fish & Chips')),
+        tag('body', class_=from_context('class'))(
+            tag('table')(loop('row', 'rows', tag('tr')(
+                loop('cell', 'row', tag('td')(from_context('cell')))))),
+            cond('footer', tag('footer')('bye')),
+            switch('status', {'ok': 'OK', 'error': tag('b')('!')}),
+            defer(lambda context: 'x'),
+            format_context('{a}'),
+        ),
+    )
+
+
+def test_analyze():
+    from kemmering.analyze import analyze
+
+    report = analyze(_template())
+    assert report.nodes == 21
+    assert report.tags == 9
+    assert report.depth == 5
+    assert report.loop_depth == 2
+    assert report.deferred == {
+        'cond': 1, 'defer': 1, 'format_context': 1, 'from_context': 2,
+        'loop': 2, 'switch': 1}
+    assert report.static_nodes == 8
+    assert report.static_node_ratio == 8.0 / 21
+    static = ('<html>', '<head><title>Fish &amp; Chips</title></head>',
+              '</body>', '<table>', '</table>', '<tr>', '</tr>', '<td>',
+              '</td>', '<footer>bye</footer>', 'OK', '<b>!</b>', '</html>')
+    assert report.static_size == sum(len(s) for s in static)
+    assert report.dynamic_slots == 4
+    assert report.static_ratio == float(report.static_size) / (
+        report.static_size + 4 * report.slot_size)
+    assert len(report.warnings) == 1
+    assert 'loops are nested 2 deep' in report.warnings[0]
+
+
+def test_analyze_static():
+    from kemmering import notag, tag
+    from kemmering.analyze import analyze
+
+    report = analyze(notag(tag('a')(u'é', tag('b')), notag('c')))
+    assert report.nodes == 6
+    assert report.tags == 2
+    assert report.depth == 2
+    assert report.static_ratio == report.static_node_ratio == 1.0
+    assert report.static_size == len('<a>\xc3\xa9<b></b></a>c')
+    assert report.dynamic_slots == 0
+    assert str(report).endswith('deferred:      none')
+    assert analyze(notag()).static_ratio == 1.0
+
+
+def test_analyze_static_output():
+    from kemmering import from_context, tag
+    from kemmering.analyze import analyze
+
+    report = analyze(tag('div')('x' * 1000, from_context('a'),
+                                from_context('b'), from_context('c')))
+    assert report.static_node_ratio < 0.5
+    assert report.static_ratio > 0.9
+    assert 'static output: 91% (estimated)' in str(report)
+
+
+def test_main(capsys):
+    from kemmering.analyze import analyze, main
+
+    module = types.ModuleType('kemmering_analyze_test')
+    module.templates = types.ModuleType('templates')
+    module.templates.page = _template()
+    sys.modules[module.__name__] = module
+    try:
+        assert main(['kemmering_analyze_test:templates.page']) == 0
+        out = capsys.readouterr().out
+        assert out == str(analyze(_template())) + '\n'
+        assert 'warning: loops are nested 2 deep' in out
+        assert main(['kemmering_analyze_test:templates.page'] * 2) == 0
+        out = capsys.readouterr().out
+        assert out.startswith('kemmering_analyze_test:templates.page:\n')
+        assert '\n\nkemmering_analyze_test:templates.page:\n' in out
+    finally:
+        del sys.modules[module.__name__]
+
+
+def test_main_usage(capsys):
+    from kemmering.analyze import main
+
+    assert main([]) == 2
+    assert capsys.readouterr().err.startswith('usage:')
+    old = sys.argv
+    sys.argv = ['kemmering-analyze']
+    try:
+        assert main() == 2
+    finally:
+        sys.argv = old
+    with pytest.raises(ImportError):
+        main(['kemmering_no_such_module:page'])
@@ -0,0 +1,190 @@
+import pytest
+
+
+def _template():
+    from kemmering import (
+        cond, format_context, from_context, in_context, loop, memo, switch,
+        tag)
+
+    def user(context):
+        return context['user']['name']
+
+    return tag('html', lang=from_context('lang'))(
+        tag('h1')(format_context('{title} {user[name]}')),
+        cond('admin', tag('b')('admin')),
+        switch('status', {'ok': 'OK'}, from_context('fallback', '')),
+        tag('ul')(loop(('i', 'item'), 'items', tag('li')(
+            from_context('i'), in_context(['item', 'name']),
+            in_context(['site', 'name'])))),
+        memo(user, ['user']),
+    )
+
+
+def _context(**changes):
+    context = {
+        'lang': 'en', 'title': 'Hi', 'user': {'name': 'fred'},
+        'admin': False, 'status': 'ok', 'items': [('1', {'name': 'a'})],
+        'site': {'name': 'x'}, 'unused': object()}
+    context.update(changes)
+    return context
+
+
+def test_etag():
+    from kemmering.etag import etag
+
+    template = _template()
+    tag = etag(template, _context())
+    assert tag.startswith('"') and tag.endswith('"') and len(tag) == 42
+    assert etag(template, _context()) == tag
+    assert etag(_template(), _context(unused=1)) == tag
+    assert etag(template, _context(user={'name': 'fred'})) == tag
+    for changes in (
+            {'lang': 'fr'}, {'title': 'Ho'}, {'user': {'name': 'barney'}},
+            {'admin': True}, {'admin': 1}, {'status': 'error'},
+            {'fallback': 'x'}, {'items': [('1', {'name': 'b'})]},
+            {'items': [('1', {'name': 'a'})] * 2}, {'site': {}},
+            {'site': {'name': 'y'}}):
+        assert etag(template, _context(**changes)) != tag, changes
+    assert etag(template, _context(), version='2') != tag
+
+
+def test_etag_template_changed():
+    from kemmering import from_context, tag
+    from kemmering.etag import etag
+
+    template = tag('p')(from_context('a'))
+    before = etag(template, {'a': 'b', 'c': 'd'})
+    template(from_context('c'))
+    assert etag(template, {'a': 'b', 'c': 'd'}) != before
+    assert etag(template, {'a': 'b', 'c': 'e'}) != etag(
+        template, {'a': 'b', 'c': 'd'})
+
+
+def test_etag_nested_template_changed():
+    from kemmering import cond, from_context, tag
+    from kemmering.etag import etag
+
+    template = tag('div')(cond('a', tag('p')('x'), tag('p')('y')))
+    context = {'a': True}
+    before = etag(template, context)
+    template.children[0].yes('z')
+    assert etag(template, context) != before
+    before = etag(template, context)
+    template.children[0].no = from_context('b')
+    assert etag(template, context) != before
+
+
+def test_etag_arguments():
+    import json
+    from kemmering import from_context, in_context
+    from kemmering.etag import etag
+    from kemmering.html import json_script, tablerows
+
+    def different(a, b, context={'c': [[1.5]], 'd': 1}):
+        assert etag(a, context) != etag(b, context)
+
+    different(tablerows('c', formats=['{:.2f}']), tablerows('c'))
+    different(tablerows('c', attrs=[{'class_': 'x'}]), tablerows('c'))
+    different(tablerows('c', formats=[lambda v: 'a']),
+              tablerows('c', formats=[lambda v: 'b']))
+    different(tablerows([[1]]), tablerows([[2]]))
+    different(json_script(from_context('d'), id='x'),
+              json_script(from_context('d'), id='y'))
+    different(json_script(from_context('d')), json_script(
+        from_context('d'), encoder=json.JSONEncoder(indent=2)))
+    different(json_script([1]), json_script([2]))
+    different(from_context('x', 'a'), from_context('x', 'b'))
+    different(in_context(['x', 'y'], 'a'), in_context(['x', 'y'], 'b'))
+    assert etag(json_script(from_context('d'), encoder=json.JSONEncoder(
+        indent=2)), {'d': 1}) == etag(json_script(
+            from_context('d'), encoder=json.JSONEncoder(indent=2)), {'d': 1})
+
+
+def test_etag_values():
+    from kemmering import from_context
+    from kemmering.etag import etag
+
+    template = from_context('a')
+    values = [
+        None, 1, '1', b'1', u'é', True, 1.5, [1, 2], [2, 1],
+        {'a': 1}, {'a': 2}, {1, 2}, frozenset([3])]
+    tags = set(etag(template, {'a': value}) for value in values)
+    assert len(tags) == len(values)
+    assert etag(template, {'a': {'x': 1, 'y': 2}}) == etag(
+        template, {'a': {'y': 2, 'x': 1}})
+    assert etag(template, {'a': set(['x', 'y', 'z'])}) == etag(
+        template, {'a': set(['z', 'y', 'x'])})
+    assert etag(template, {}) != etag(template, {'a': None})
+
+
+def test_etag_lazy():
+    from kemmering import from_context, lazy
+    from kemmering.etag import etag
+
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return 'b'
+
+    template = from_context('a')
+    assert etag(template, {'a': lazy(fetch)}) == etag(template, {'a': 'b'})
+    assert calls == [1]
+
+
+def test_etag_opaque():
+    from kemmering import cond, defer, loop, switch, tag
+    from kemmering.etag import etag
+
+    def f(context):
+        return context['a']
+
+    assert etag(tag('p')(defer(f)), {'a': 1}) is None
+    assert etag(cond(f, 'x'), {'a': 1}) is None
+    assert etag(switch(f, {}), {'a': 1}) is None
+    assert etag(loop('i', f, 'x'), {'a': 1}) is None
+    template = tag('p')(defer(f, cache_key=lambda context: context['a']))
+    assert etag(template, {'a': 1}) == etag(template, {'a': 1, 'b': 2})
+    assert etag(template, {'a': 1}) != etag(template, {'a': 2})
+
+
+def test_etag_other_nodes():
+    from kemmering import cdata, flush, from_context, switch, tag
+    from kemmering.etag import etag
+    from kemmering.html import (
+        collected_styles, json_script, shared_style, tablerows)
+    from kemmering.metrics import named
+
+    template = named('x', tablerows('columns'))
+    assert etag(template, {'columns': [[1]]}) != etag(
+        template, {'columns': [[2]]})
+    template = json_script(from_context('data'))
+    assert etag(template, {'data': [1]}) != etag(template, {'data': [2]})
+    assert etag(switch('a', {'b': 'c'}), {'a': 'b'}) != etag(
+        switch('a', {'b': 'd'}), {'a': 'b'})
+    assert etag(tag('p')('a', flush()), {}) is not None
+    assert etag(tag('p')(collected_styles(), shared_style(
+        ('a', {'b': 'c'}))), {}) is not None
+    assert etag('abc', {}) == etag('abc', {'a': 1})
+    assert etag('abc', {}) != etag('abd', {})
+    assert etag(cdata('a'), {}) != etag(cdata('b'), {})
+
+
+def test_hashing():
+    from kemmering import stream
+    from kemmering.etag import hashing
+    from kemmering.output import stream_bytes
+
+    template = _template()
+    context = _context()
+    chunks = hashing(stream(template, context))
+    with pytest.raises(ValueError):
+        chunks.etag
+    text = ''.join(chunks)
+    assert '<li>1ax</li>' in text
+    encoded = hashing(stream_bytes(template, context))
+    assert b''.join(encoded) == text.encode('utf-8')
+    assert encoded.etag == chunks.etag
+    other = hashing(stream(template, _context(title='Ho')))
+    list(other)
+    assert other.etag != chunks.etag
@@ -1,3 +1,5 @@
+import pytest
+
 
 def test_style():
     from kemmering.html import style
@@ -21,6 +23,17 @@ def test_doc():
     )
 
 
+def test_render_doc():
+    from kemmering import bind, from_context, render
+    from kemmering.html import body, doc, head, html, style, title
+    template = doc(html()(
+        head()(title()(from_context('title')), style(('a', {'b': 'c'}))),
+        body()('foo')))
+    context = {'title': 'bar'}
+    assert render(template, context) == str(bind(template, context))
+    assert render(template, context).startswith('<!DOCTYPE html>\n\n<html>')
+
+
 def test_pretty():
     from kemmering.html import doc, html, head, pretty, title
     assert pretty(doc(html()(head()(title()('foo'))))) == (
@@ -33,6 +46,285 @@ def test_pretty():
     )
 
 
+def test_factory_matches_tag():
+    from kemmering import bind, from_context, tag
+    from kemmering.html import br, td
+    assert type(td()) is tag
+    assert repr(td(class_='x')('y')) == repr(tag('td', class_='x')('y'))
+    assert repr(br()) == repr(tag('br/'))
+    assert br().self_closing
+    assert not td().self_closing
+    template = td(id=from_context('id'))(from_context('value'))
+    assert str(bind(template, {'id': 'a', 'value': 'b'})) == (
+        '<td id="a">b</td>')
+
+
+def test_factory_omits_none_attributes():
+    from kemmering.html import td
+    assert td(class_=None, id='a').attrs == {'id': 'a'}
+    assert str(td(class_=None)('x')) == '<td>x</td>'
+
+
+def test_factory_instances_are_independent():
+    from kemmering.html import td
+    a, b = td(), td()
+    a('x')
+    assert str(a) == '<td>x</td>'
+    assert str(b) == '<td></td>'
+    assert a.attrs is not b.attrs
+
+
+def _table_loops():
+    # The equivalent of `tablerows` built from tags and loops.
+    from kemmering import defer, loop
+    from kemmering.html import td, tr
+
+    def cells(context):
+        return zip(context['row'], context['formats'], context['attrs'])
+
+    def cell(context):
+        value, format, attrs = context['cell']
+        return td(**attrs)(format(value))
+
+    return loop('row', lambda c: zip(*c['columns']), tr(class_='r')(
+        loop('cell', cells, defer(cell))))
+
+
+def test_tablerows():
+    from kemmering import bind, render, stream
+    from kemmering.html import table, tablerows
+
+    columns = [['a', 'b<', 'c'], [1, 2, 3], [0.5, 1.25, 2.0]]
+    template = table()(tablerows(
+        'columns', formats=[None, None, '{:.1f}'],
+        attrs=[{'class_': 'name'}, None, {'class_': 'n', 'id': None}],
+        row_attrs={'class_': 'r'}, batch=2))
+    loops = table()(_table_loops())
+    context = {
+        'columns': columns,
+        'formats': [str, str, '{:.1f}'.format],
+        'attrs': [{'class_': 'name'}, {}, {'class_': 'n'}]}
+    expected = render(loops, context)
+    assert expected.startswith(
+        '<table><tr class="r"><td class="name">a</td><td>1</td>'
+        '<td class="n">0.5</td></tr><tr class="r"><td class="name">b&lt;</td>')
+    assert render(template, context) == expected
+    assert str(bind(template, context)) == expected
+    chunks = list(stream(template, context))
+    assert len(chunks) == 4
+    assert chunks[1].count('<tr') == 2
+    assert chunks[2].count('<tr') == 1
+
+
+def test_tablerows_columns():
+    import array
+    from kemmering import bind
+    from kemmering.html import tablerows
+
+    template = tablerows(lambda c: [array.array('d', [1.5, 2.0]), 'ab'])
+    assert repr(template) == 'tablerows(<lambda>)'
+    assert str(bind(template, {})) == (
+        '<tr><td>1.5</td><td>a</td></tr><tr><td>2.0</td><td>b</td></tr>')
+    assert str(tablerows([])) == ''
+    assert repr(tablerows([])) == 'tablerows(...)'
+    assert repr(tablerows('a')) == "tablerows('a')"
+
+
+def test_tablerows_numpy():
+    np = pytest.importorskip('numpy')
+    from kemmering.html import tablerows
+
+    assert str(tablerows([np.arange(2), np.array([0.5, 1.0])])) == (
+        '<tr><td>0</td><td>0.5</td></tr><tr><td>1</td><td>1.0</td></tr>')
+
+
+def test_tablerows_errors():
+    from kemmering import bind
+    from kemmering.html import tablerows
+
+    with pytest.raises(ValueError):
+        str(tablerows('columns'))
+    with pytest.raises(KeyError):
+        bind(tablerows('columns'), {})
+    with pytest.raises(ValueError):
+        str(tablerows([[1, 2], [1]]))
+    with pytest.raises(ValueError):
+        str(tablerows([['a', 'b'], [1, 2], [3, 4]], formats=['{}']))
+    with pytest.raises(ValueError):
+        str(tablerows([['a', 'b']], attrs=[None, None]))
+
+
+def test_tablerows_budget():
+    from kemmering import BudgetExceeded, render
+    from kemmering.html import table, tablerows
+
+    formatted = []
+
+    def format(value):
+        formatted.append(value)
+        return str(value)
+
+    template = table()(tablerows([range(200000)], formats=[format]))
+    with pytest.raises(BudgetExceeded) as e:
+        render(template, {}, max_size=100)
+    assert e.value.path == ['table']
+    assert len(formatted) < 10000
+
+
+def test_json_script():
+    import json
+    from kemmering import render, stream
+    from kemmering.html import body, json_script
+
+    data = {'a': ['</script><!--', '&amp;', u'\u2028\u2029\u00e9'], 'b': 1}
+    template = body()(json_script(data, id='s'))
+    html = render(template, {})
+    assert html.startswith('<body><script id="s" type="application/json">')
+    assert html.endswith('</script></body>')
+    assert html.count('<') == 4
+    assert '&' not in html
+    assert u'\u2028' not in html and u'\u2029' not in html
+    start = html.index('>', 6) + 1
+    assert json.loads(html[start:-len('</script></body>')]) == data
+    assert html == str(body()(json_script(data, id='s')))
+
+    template = json_script(list(range(1000)), batch=100, type=None)
+    chunks = list(stream(template, {}))
+    assert chunks[0] == '<script>'
+    assert len(chunks) > 10
+    assert json.loads(''.join(chunks[1:-1])) == list(range(1000))
+
+
+def test_json_script_context():
+    import json
+    from kemmering import bind, from_context
+    from kemmering.html import json_script
+
+    template = json_script(from_context('data'), encoder=json.JSONEncoder(
+        separators=(',', ':'), sort_keys=True))
+    assert repr(template) == "json_script(from_context('data'))"
+    bound = bind(template, {'data': {'b': 1, 'a': '<'}})
+    assert str(bound) == (
+        '<script type="application/json">{"a":"\\u003c","b":1}</script>')
+    with pytest.raises(ValueError):
+        str(template)
+
+
+def test_json_script_budget():
+    import json
+    from kemmering import BudgetExceeded, render
+    from kemmering.html import body, json_script
+
+    encoded = []
+
+    class Encoder(json.JSONEncoder):
+
+        def iterencode(self, o):
+            for chunk in super(Encoder, self).iterencode(o):
+                encoded.append(chunk)
+                yield chunk
+
+    template = body()(json_script(list(range(200000)), encoder=Encoder()))
+    with pytest.raises(BudgetExceeded) as e:
+        render(template, {}, max_size=100)
+    assert e.value.path == ['body']
+    assert len(encoded) < 10000
+
+
+def _styled_template(minify=False):
+    from kemmering import from_context, loop
+    from kemmering.html import (
+        body, collected_styles, div, head, html, shared_style, span, title)
+    card = div(class_='card')(
+        shared_style(('.card', {'padding': '1em'}),
+                     ('.card p', {'margin': '0'})),
+        span(class_='badge')(
+            shared_style(('.badge', {'color': 'red'}),
+                         ('.card', {'padding': '2em'}))),
+        from_context('i'))
+    return html()(
+        head()(title()('t'), collected_styles(minify=minify)),
+        body()(loop('i', 'cards', card)))
+
+
+def test_collected_styles():
+    from kemmering import bind, render
+    from kemmering.output import render_bytes
+
+    cards = '<div class="card"><span class="badge"></span>{}</div>'
+    expected = (
+        '<html><head><title>t</title>'
+        '<style>.card{padding:1em}.card p{margin:0}.badge{color:red}</style>'
+        '</head><body>' + cards.format('a') + cards.format('b') +
+        '</body></html>')
+    template = _styled_template(minify=True)
+    context = {'cards': ['a', 'b']}
+    assert render(template, context) == expected
+    assert render(template, context) == expected
+    assert str(bind(template, context)) == expected
+    assert render_bytes(template, context) == expected.encode('ascii')
+    assert render(template, {'cards': []}) == (
+        '<html><head><title>t</title></head><body></body></html>')
+    assert render(_styled_template(), {'cards': ['a']}) == (
+        '<html><head><title>t</title>\n'
+        '<style>\n'
+        '  .card {\n    padding: 1em;\n  }\n'
+        '  .card p {\n    margin: 0;\n  }\n'
+        '  .badge {\n    color: red;\n  }\n'
+        '</style>\n'
+        '</head><body>' + cards.format('a') + '</body></html>')
+
+
+def test_collected_styles_streaming():
+    from kemmering import defer, stream
+    from kemmering.html import body, collected_styles, head, html
+    from kemmering.html import shared_style
+
+    calls = []
+
+    def content(context):
+        calls.append(1)
+        return shared_style(('a', {'b': 'c'}))
+
+    template = html()(
+        head()(collected_styles(minify=True)), body()(defer(content)))
+    chunks = stream(template, {})
+    assert next(chunks) + next(chunks) == '<html><head>'
+    assert calls == []
+    assert next(chunks) == '<style>a{b:c}</style>'
+    assert calls == [1]
+    assert ''.join(chunks) == '</head><body></body></html>'
+
+
+def test_shared_style_inline():
+    from kemmering import from_context, loop, render
+    from kemmering.html import collected_styles, div, shared_style
+
+    item = div()(shared_style(('a', {'b': 'c'})), from_context('i'))
+    template = div()(loop('i', 'items', item))
+    assert render(template, {'items': ['1', '2']}) == (
+        '<div><div>\n<style>\n  a {\n    b: c;\n  }\n</style>\n1</div>'
+        '<div>2</div></div>')
+    template = div()(item, collected_styles(minify=True),
+                     shared_style(('a', {'b': 'c'}), ('d', {'e': 'f'})))
+    assert render(template, {'i': '1'}) == (
+        '<div><div>\n<style>\n  a {\n    b: c;\n  }\n</style>\n1</div>'
+        '<style>d{e:f}</style></div>')
+    assert str(item.children[0]) == (
+        '\n<style>\n  a {\n    b: c;\n  }\n</style>\n')
+    assert repr(item.children[0]) == "shared_style(('a', {'b': 'c'}))"
+
+
+def test_collected_styles_unbound():
+    from kemmering.html import collected_styles
+    template = collected_styles()
+    assert repr(template) == 'collected_styles()'
+    with pytest.raises(ValueError):
+        next(template._stream())
+    with pytest.raises(ValueError):
+        template._bind({})
+
+
 def test_a():
     from kemmering.html import a
     assert str(a(href='foo/bar')('Howdy!')) == '<a href="foo/bar">Howdy!</a>'
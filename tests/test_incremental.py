@@ -0,0 +1,166 @@
+def _counter(calls, name, f):
+    from kemmering import defer
+
+    def deferred(context):
+        calls.append(name)
+        return f(context)
+    deferred.__name__ = name
+    return defer(deferred)
+
+
+def test_incremental():
+    from kemmering import bind, cond, format_context, from_context, loop, tag
+    from kemmering.html import doc
+    from kemmering.incremental import incremental
+
+    calls = []
+    template = doc(tag('html')(
+        tag('head')(tag('title')(
+            _counter(calls, 'title', lambda c: c['title']))),
+        tag('body', class_=_counter(calls, 'class', lambda c: c['theme']))(
+            tag('ul')(loop('item', 'items', tag('li')(from_context('item')))),
+            cond('admin', tag('a', href='/admin')('Admin')),
+            format_context('{user} has {n} items'),
+        ),
+    ))
+    page = incremental(template)
+    context = {'title': 'Hello', 'theme': 'dark', 'items': ['a', 'b'],
+               'admin': False, 'user': 'fred', 'n': 2}
+
+    def check(context):
+        assert page.render(context) == str(bind(template, context))
+
+    check(context)
+    assert calls == ['title', 'class', 'title', 'class']
+
+    del calls[:]
+    page.render(dict(context))
+    assert calls == []
+
+    page.render(dict(context, title='Goodbye'))
+    assert calls == ['title']
+
+    del calls[:]
+    check(dict(context, title='Goodbye', admin=True, items=['c']))
+    assert calls == ['title', 'class']
+
+    del calls[:]
+    check(dict(context, title='Goodbye', admin=True, items=['c'], n=3))
+    assert calls == ['title', 'class']
+
+
+def test_incremental_recomputes_only_changed_slots():
+    from kemmering import tag
+    from kemmering.incremental import incremental
+
+    calls = []
+    page = incremental(tag('div')(*(
+        tag('p')(_counter(calls, str(i), lambda c, i=i: c[str(i)]))
+        for i in range(10))))
+    context = {str(i): 'v{}'.format(i) for i in range(10)}
+    page.render(context)
+    del calls[:]
+    context = dict(context)
+    context['3'] = 'changed'
+    assert page.render(context) == '<div>{}</div>'.format(''.join(
+        '<p>{}</p>'.format(context[str(i)]) for i in range(10)))
+    assert calls == ['3']
+
+
+def test_incremental_loop():
+    from kemmering import from_context, loop, tag
+    from kemmering.incremental import incremental
+
+    calls = []
+    page = incremental(tag('ul')(loop('i', 'items', tag('li')(
+        from_context('i'), _counter(calls, 'row', lambda c: c['i'])))))
+    context = {'items': ['a', 'b', 'c'], 'other': 1}
+    assert page.render(context) == (
+        '<ul><li>aa</li><li>bb</li><li>cc</li></ul>')
+    assert calls == ['row'] * 3
+    del calls[:]
+    page.render(dict(context, other=2))
+    assert calls == []
+    page.render(dict(context, items=['d']))
+    assert calls == ['row']
+
+
+def test_incremental_reads_whole_context():
+    from kemmering.incremental import incremental
+
+    calls = []
+    page = incremental(_counter(calls, 'all', lambda c: ','.join(sorted(c))))
+    assert page.render({'a': 1}) == 'a'
+    assert page.render({'a': 1}) == 'a'
+    assert page.render({'a': 1, 'b': 2}) == 'a,b'
+    assert calls == ['all', 'all', 'all']
+
+
+def test_incremental_missing_keys():
+    from kemmering import from_context, tag
+    from kemmering.incremental import incremental
+
+    page = incremental(tag('p')(from_context('a', 'default')))
+    assert page.render({}) == '<p>default</p>'
+    assert page.render({'b': 'c'}) == '<p>default</p>'
+    assert page.render({'a': 'b'}) == '<p>b</p>'
+    assert page.render({}) == '<p>default</p>'
+
+
+def test_incremental_template_modified():
+    from kemmering import from_context, tag
+    from kemmering.incremental import incremental
+
+    p = tag('p')(from_context('a'))
+    page = incremental(tag('div')(p))
+    assert page.render({'a': 'b'}) == '<div><p>b</p></div>'
+    p(tag('br/'))
+    assert page.render({'a': 'b'}) == '<div><p>b<br/></p></div>'
+
+
+def test_incremental_reset():
+    from kemmering.incremental import incremental
+
+    calls = []
+    page = incremental(_counter(calls, 'a', lambda c: c['a']))
+    page.render({'a': 'b'})
+    page.render({'a': 'b'})
+    page.reset()
+    assert list(page.stream({'a': 'b'})) == ['b']
+    assert calls == ['a', 'a']
+
+
+def test_incremental_tracks_membership():
+    from kemmering import defer, tag
+    from kemmering.incremental import incremental
+
+    page = incremental(tag('p')(
+        defer(lambda c: 'yes' if 'a' in c else 'no'),
+        defer(lambda c: list(c.values())[0] if c.items() else '')))
+    assert page.render({'b': 'c'}) == '<p>noc</p>'
+    assert page.render({'a': 'c'}) == '<p>yesc</p>'
+
+
+def test_incremental_shared_style():
+    from kemmering import cond, from_context, loop, render, tag
+    from kemmering.html import collected_styles, head, shared_style
+    from kemmering.incremental import incremental
+
+    card = tag('div')(shared_style(('.card', {'padding': '1em'})),
+                      from_context('i'))
+    template = tag('html')(
+        head()(collected_styles(minify=True)),
+        tag('body')(loop('i', 'cards', card)),
+        cond('footer', tag('p')(shared_style(('p', {'margin': '0'})))))
+    page = incremental(template)
+    for context in ({'cards': ['a'], 'footer': True},
+                    {'cards': ['a'], 'footer': True},
+                    {'cards': [], 'footer': True},
+                    {'cards': ['a', 'b'], 'footer': False}):
+        assert page.render(context) == render(template, context)
+    assert '.card{padding:1em}' in page.render(context)
+
+    inline = incremental(tag('body')(loop('i', 'cards', card), card))
+    for context in ({'cards': ['a'], 'i': 'b'}, {'cards': [], 'i': 'b'}):
+        assert inline.render(context) == render(inline.template, context)
+    assert '<style>' in inline.render(context)
@@ -326,6 +326,43 @@ def test_cond_deferred_children():
     assert STR(bound) == '<doc><p>Hi there.</p></doc>'
 
 
+def test_switch():
+    from kemmering import bind, from_context, render, switch, tag
+
+    template = tag('p')(switch('status', {
+        'ok': tag('b')('OK'),
+        'error': tag('i')(from_context('message')),
+    }))
+    assert REPR(template) == (
+        "tag('p')(switch('status', ['error', 'ok']))")
+    assert STR(bind(template, {'status': 'ok'})) == '<p><b>OK</b></p>'
+    assert STR(bind(template, {'status': 'error', 'message': 'Oops'})) == (
+        '<p><i>Oops</i></p>')
+    assert STR(bind(template, {'status': 'pending'})) == '<p></p>'
+    assert STR(bind(template, {})) == '<p></p>'
+    assert render(template, {'status': 'error', 'message': 'Oops'}) == (
+        '<p><i>Oops</i></p>')
+
+
+def test_switch_function_default():
+    from kemmering import bind, switch, tag
+
+    def parity(context):
+        return context['n'] % 2
+
+    template = tag('p')(switch(parity, [(0, 'even')], 'odd'))
+    assert REPR(template) == "tag('p')(switch(parity, [0], 'odd'))"
+    assert STR(bind(template, {'n': 2})) == '<p>even</p>'
+    assert STR(bind(template, {'n': 3})) == '<p>odd</p>'
+
+
+def test_switch_unhashable():
+    from kemmering import bind, switch
+
+    with pytest.raises(TypeError):
+        bind(switch('a', {}), {'a': []})
+
+
 def test_loop():
     from kemmering import bind, from_context, loop, tag
 
@@ -437,3 +474,846 @@ def test_loop_unpack_not_enough():
         STR(doc)
     with pytest.raises(ValueError):
         bind(doc, {'foo': 'bar'})
+
+
+def test_render():
+    from kemmering import bind, cond, from_context, loop, render, tag
+
+    def is_even(context):
+        return context['i'] % 2 == 0
+
+    doc = tag('doc', foo=from_context('foo'), bar=from_context('bar', None))(
+        tag('ul', class_='animals')(
+            loop(('i', 'foo'), 'animals',
+                 tag('li', class_=cond(is_even, 'even', 'odd'))(
+                     from_context('foo')))),
+        tag('br/'),
+        'foo is ', from_context('foo'),
+    )
+    context = {'animals': list(enumerate(['kitty', 'puppy & bunny'])),
+               'foo': 'bar'}
+    expected = STR(bind(doc, context))
+    assert render(doc, context) == expected
+    assert render(doc, context) == expected
+
+
+def test_render_text():
+    from kemmering import render
+    assert render('a & b', {}) == 'a &amp; b'
+
+
+def test_render_defer_key_error():
+    from kemmering import from_context, render, tag
+    with pytest.raises(KeyError):
+        render(tag('a')(from_context('b')), {})
+
+
+def test_stream_is_lazy():
+    from kemmering import defer, loop, stream, tag
+
+    calls = []
+
+    @defer
+    def deferred(context):
+        calls.append(context['x'])
+        return str(context['x'])
+
+    doc = tag('doc')(tag('a')('static'), loop('x', 'xs', deferred))
+    chunks = stream(doc, {'xs': [1, 2]})
+    assert next(chunks) == '<doc><a>static</a>'
+    assert calls == []
+    assert next(chunks) == '1'
+    assert calls == [1]
+    assert list(chunks) == ['2', '</doc>']
+
+
+def test_stream_static_chunks_reused():
+    from kemmering import from_context, stream, tag
+    doc = tag('doc')(tag('a')('static'), from_context('x'), tag('b/'))
+    first = list(stream(doc, {'x': 'y'}))
+    second = list(stream(doc, {'x': 'z'}))
+    assert first == ['<doc><a>static</a>', 'y', '<b/></doc>']
+    assert second == ['<doc><a>static</a>', 'z', '<b/></doc>']
+    assert first[0] is second[0]
+    assert first[2] is second[2]
+
+
+def test_stream_template_modified():
+    from kemmering import from_context, render, tag
+    a = tag('a')('b')
+    doc = tag('doc')(tag('p')(a), from_context('x'))
+    assert render(doc, {'x': 'y'}) == '<doc><p><a>b</a></p>y</doc>'
+    a('c')
+    assert render(doc, {'x': 'y'}) == '<doc><p><a>bc</a></p>y</doc>'
+    a(from_context('x'))
+    assert render(doc, {'x': 'y'}) == '<doc><p><a>bcy</a></p>y</doc>'
+
+
+def test_stream_shared_subtree_modified():
+    from kemmering import from_context, render, tag
+    a = tag('a')('x')
+    p1 = tag('p')(a, from_context('z'))
+    p2 = tag('q')(a)
+    assert render(p1, {'z': '1'}) == '<p><a>x</a>1</p>'
+    assert render(p2, {}) == '<q><a>x</a></q>'
+    a('y')
+    assert render(p1, {'z': '1'}) == '<p><a>xy</a>1</p>'
+    assert render(p2, {}) == '<q><a>xy</a></q>'
+
+
+def test_stream_attrs_modified():
+    from kemmering import from_context, render, tag
+    a = tag('a', href='b')('c')
+    doc = tag('doc')(tag('p')(a), from_context('x'))
+    assert render(doc, {'x': 'y'}) == '<doc><p><a href="b">c</a></p>y</doc>'
+    a.attrs['href'] = 'd'
+    assert render(doc, {'x': 'y'}) == '<doc><p><a href="d">c</a></p>y</doc>'
+    del a.attrs['href']
+    assert render(doc, {'x': 'y'}) == '<doc><p><a>c</a></p>y</doc>'
+    a.attrs.update(id='e')
+    assert render(doc, {'x': 'y'}) == '<doc><p><a id="e">c</a></p>y</doc>'
+    doc.attrs['id'] = 'f'
+    assert render(doc, {'x': 'y'}) == (
+        '<doc id="f"><p><a id="e">c</a></p>y</doc>')
+
+
+def test_stream_unbound_defer():
+    from kemmering import defer, loop, tag
+    with pytest.raises(ValueError):
+        list(defer(lambda context: 'a')._stream())
+    with pytest.raises(ValueError):
+        STR(tag('a')(loop('b', 'c', 'd')))
+
+
+def test_loop_stream():
+    from kemmering import bind, from_context, loop, tag
+
+    produced = []
+
+    def animals(context):
+        for animal in ('kitty', 'puppy', 'bunny'):
+            produced.append(animal)
+            yield animal
+
+    doc = tag('doc')(tag('ul')(
+        loop('foo', animals, tag('li')(from_context('foo')), stream=True)))
+    bound = bind(doc, {})
+    assert produced == []
+    assert REPR(bound) == "tag('doc')(tag('ul')(loop('foo', animals)))"
+    chunks = bound._stream()
+    assert ''.join(next(chunks) for i in range(3)) == '<doc><ul><li>'
+    assert produced == ['kitty']
+    assert ''.join(chunks) == (
+        'kitty</li><li>puppy</li><li>bunny</li></ul></doc>')
+    assert produced == ['kitty', 'puppy', 'bunny']
+    assert STR(bound) == (
+        '<doc><ul><li>kitty</li><li>puppy</li><li>bunny</li></ul></doc>')
+
+
+def test_loop_stream_render():
+    from kemmering import bind, from_context, loop, render, tag
+
+    doc = tag('ul')(
+        loop('foo', 'animals', tag('li')(from_context('foo')), stream=True))
+    context = {'animals': ['kitty', 'puppy']}
+    assert render(bind(doc, context), {}) == (
+        '<ul><li>kitty</li><li>puppy</li></ul>')
+    assert render(doc, context) == '<ul><li>kitty</li><li>puppy</li></ul>'
+
+
+def test_stream_loop_memory():
+    import gc
+    import weakref
+    from kemmering import defer, loop, stream, tag
+
+    class Row(object):
+        pass
+
+    refs = []
+
+    def rows(context):
+        for i in range(1000):
+            row = Row()
+            refs.append(weakref.ref(row))
+            yield row
+
+    template = tag('table')(loop('row', rows, tag('tr')(
+        defer(lambda context: str(len(refs))))))
+    for i, chunk in enumerate(stream(template, {})):
+        if i == 2000:
+            gc.collect()
+            assert sum(ref() is not None for ref in refs) <= 2
+    assert len(refs) == 1000
+
+
+def test_bind_lazy():
+    from kemmering import bind, defer, from_context, loop, tag
+
+    calls = []
+
+    def deferred(name):
+        def f(context):
+            calls.append(name)
+            return context[name]
+        f.__name__ = name
+        return defer(f)
+
+    doc = tag('doc', id=deferred('id'))(
+        tag('p', class_=deferred('cls'))(deferred('p')),
+        tag('ul')(loop('x', 'xs', tag('li')(from_context('x')))),
+        'foo',
+    )
+    context = {'id': 'a', 'cls': 'b', 'p': 'c', 'xs': ['d', 'e']}
+    bound = bind(doc, context, lazy=True)
+    assert isinstance(bound, tag)
+    assert bound.tag == 'doc'
+    assert calls == []
+
+    p = bound.children[0]
+    assert calls == []
+    assert p.attrs == {'class_': 'b'}
+    assert calls == ['cls']
+    assert p.children == ('c',)
+    assert calls == ['cls', 'p']
+    assert bound.children[0] is p
+    assert p.children is p.children
+    assert calls == ['cls', 'p']
+
+    assert STR(bound) == STR(bind(doc, context))
+    assert calls.count('p') == 2
+
+
+def test_bind_lazy_copy():
+    from kemmering import bind, from_context, render, tag
+    from kemmering.html import doc, html
+
+    template = doc(html(lang=from_context('lang'))(tag('br/')))
+    bound = bind(template, {'lang': 'en'}, lazy=True)
+    assert isinstance(bound, doc)
+    assert STR(bound) == '<!DOCTYPE html>\n\n<html lang="en"><br/></html>'
+    assert bound.children[0].children[0].self_closing
+    assert render(bound, {}) == STR(bound)
+    copy = bind(bound, {})
+    assert type(copy) is doc
+    assert STR(copy) == STR(bound)
+    bound(tag('p/'))
+    assert STR(bound) == (
+        '<!DOCTYPE html>\n\n<html lang="en"><br/></html><p/>')
+    assert REPR(bound.children[0]) == "tag('html', lang='en')(tag('br/'))"
+
+
+def test_bind_lazy_not_tag():
+    from kemmering import bind, from_context
+    assert bind(from_context('a'), {'a': 'b'}, lazy=True) == 'b'
+    assert bind('a', {}, lazy=True) == 'a'
+
+
+def test_text_children_not_wrapped():
+    from kemmering import cdata, tag, text
+    child = u'kith & kin'
+    a = tag('a')(child, text('b & c'), cdata('d & e'))
+    assert a.children[0] is child
+    assert type(a.children[1]) is text
+    assert a.children[1].parent is a
+    assert type(a.children[2]) is cdata
+    assert STR(a) == ('<a>kith &amp; kin'
+                      'b &amp; c<![CDATA[d & e]]></a>')
+    assert REPR(a) == "tag('a')('kith & kin', 'b & c', cdata('d & e'))"
+
+
+def test_text_children_str_subclass():
+    from kemmering import tag, text
+
+    class Name(STR):
+        pass
+
+    a = tag('a')(Name('b & c'))
+    assert type(a.children[0]) is text
+    assert STR(a) == '<a>b &amp; c</a>'
+
+
+def test_freeze():
+    from kemmering import cdata, freeze, tag
+    a = freeze(tag('a', b='c')(tag('d/'), 'e', cdata('f')))
+    assert STR(a) == '<a b="c"><d/>e<![CDATA[f]]></a>'
+    assert REPR(a) == "tag('a', b='c')(tag('d/'), 'e', cdata('f'))"
+    assert freeze(a) is a
+    assert freeze(tag('a', b='c')(tag('d/'), 'e', cdata('f'))) is a
+    assert a == freeze(tag('a', b='c')(tag('d/'), 'e', cdata('f')))
+    assert a != freeze(tag('a', b='c')(tag('d/'), 'e', 'f'))
+    assert a != freeze(tag('a', b='d')(tag('d/'), 'e', cdata('f')))
+    assert len({a, freeze(tag('a', b='c')(tag('d/'), 'e', cdata('f')))}) == 1
+
+
+def test_freeze_shares_subtrees():
+    from kemmering import freeze, tag
+    from kemmering.html import br, i, td
+    icon = i(class_='icon')
+    rows = [freeze(td()(i(class_='icon'), br(), str(n))) for n in range(3)]
+    assert rows[0].children[0] is rows[1].children[0] is rows[2].children[0]
+    assert rows[0].children[1] is rows[1].children[1]
+    assert rows[0] is not rows[1]
+    assert freeze(icon) is rows[0].children[0]
+    assert freeze(tag('i', class_='icon')) is rows[0].children[0]
+
+
+def test_freeze_immutable():
+    from kemmering import freeze, tag
+    a = freeze(tag('a', b='c'))
+    with pytest.raises(TypeError):
+        a('d')
+    if not PY2:
+        with pytest.raises(TypeError):
+            a.attrs['b'] = 'd'
+
+
+def test_freeze_unfrozen_compare_by_identity():
+    from kemmering import freeze, tag
+    a = tag('a')
+    assert a == a
+    assert a != tag('a')
+    assert freeze(a) != a
+    assert a != freeze(a)
+    assert len({a, tag('a')}) == 2
+
+
+def test_freeze_template():
+    from kemmering import bind, freeze, from_context, loop, render, tag
+    from kemmering.html import doc
+    template = freeze(doc(tag('ul', id=from_context('id'))(
+        loop('x', 'xs', tag('li')(from_context('x'))))))
+    assert type(template) is doc
+    context = {'id': 'a', 'xs': ['b', 'c']}
+    expected = ('<!DOCTYPE html>\n\n'
+                '<ul id="a"><li>b</li><li>c</li></ul>')
+    assert render(template, context) == expected
+    bound = bind(template, context)
+    assert STR(bound) == expected
+    bound(tag('d/'))
+    assert STR(bound) == expected + '<d/>'
+
+
+def test_freeze_lazy_view():
+    from kemmering import bind, freeze, from_context, tag
+    view = bind(tag('a')(from_context('b')), {'b': 'c'}, lazy=True)
+    frozen = freeze(view)
+    assert type(frozen) is tag
+    assert STR(frozen) == '<a>c</a>'
+
+
+def test_freeze_interned_weakly():
+    import gc
+    from kemmering import _interned, freeze, tag
+    a = freeze(tag('unique-a')(tag('unique-b')))
+    size = len(_interned)
+    del a
+    gc.collect()
+    assert len(_interned) == size - 2
+
+
+def test_freeze_render_threads():
+    import threading
+    from kemmering import freeze, from_context, render, tag
+    template = freeze(tag('ul')(tag('li')('static'), from_context('x')))
+    results = []
+
+    def worker(n):
+        for i in range(100):
+            results.append(render(template, {'x': str(n)}) == (
+                '<ul><li>static</li>{}</ul>'.format(n)))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 800
+    assert all(results)
+
+
+def _memo_counter(calls, keys=()):
+    from kemmering import memo
+
+    def user(context):
+        calls.append(context.get('user_id'))
+        return 'user{}'.format(context.get('user_id'))
+    return memo(user, keys)
+
+
+def test_memo():
+    from kemmering import bind, from_context, loop, render, stream, tag
+
+    calls = []
+    user = _memo_counter(calls, ['user_id'])
+    template = tag('doc')(
+        tag('header')(user),
+        tag('ul')(loop('i', 'items', tag('li')(from_context('i'), user))),
+        tag('footer')(user),
+    )
+    context = {'user_id': 1, 'items': ['a', 'b']}
+    expected = ('<doc><header>user1</header><ul><li>auser1</li>'
+                '<li>buser1</li></ul><footer>user1</footer></doc>')
+    assert STR(bind(template, context)) == expected
+    assert calls == [1]
+    assert render(template, context) == expected
+    assert calls == [1, 1]
+    assert ''.join(stream(template, context)) == expected
+    assert calls == [1, 1, 1]
+
+
+def test_memo_keys():
+    from kemmering import bind, loop, tag
+
+    calls = []
+    user = _memo_counter(calls, ['user_id'])
+    template = tag('ul')(loop('user_id', 'ids', tag('li')(user, user)))
+    assert STR(bind(template, {'ids': [1, 2, 1]})) == (
+        '<ul><li>user1user1</li><li>user2user2</li><li>user1user1</li></ul>')
+    assert calls == [1, 2]
+
+
+def test_memo_key_names():
+    from kemmering import memo, render, tag
+
+    calls = []
+
+    def f(context):
+        calls.append(1)
+        return context['a'] + context['b']
+
+    template = tag('p')(memo(f, ['a']), '|', memo(f, ['b']))
+    assert render(template, {'a': '1', 'b': '1'}) == '<p>11|11</p>'
+    assert calls == [1, 1]
+
+
+def test_memo_unhashable():
+    from kemmering import bind, tag
+
+    calls = []
+    user = _memo_counter(calls, ['user_id'])
+    assert STR(bind(tag('p')(user, user), {'user_id': [1]})) == (
+        '<p>user[1]user[1]</p>')
+    assert calls == [[1], [1]]
+
+
+def test_memo_no_scope():
+    calls = []
+    user = _memo_counter(calls)
+    assert user._bind({'user_id': 1}) == 'user1'
+    assert user._bind({'user_id': 1}) == 'user1'
+    assert calls == [1, 1]
+
+
+def test_memo_interleaved_streams():
+    from kemmering import stream, tag
+
+    calls = []
+    user = _memo_counter(calls, ['user_id'])
+    template = tag('p')(user, tag('br/'), user)
+    a = stream(template, {'user_id': 1})
+    b = stream(template, {'user_id': 1})
+    assert next(a) == '<p>'
+    assert next(b) == '<p>'
+    assert ''.join(a) == 'user1<br/>user1</p>'
+    assert ''.join(b) == 'user1<br/>user1</p>'
+    assert calls == [1, 1]
+
+
+def test_memo_streamed_loop():
+    from kemmering import bind, loop, tag
+
+    calls = []
+    user = _memo_counter(calls, ['user_id'])
+    template = tag('p')(user, loop('i', 'items', user, stream=True))
+    bound = bind(template, {'user_id': 1, 'items': [1, 2]})
+    assert calls == [1]
+    assert STR(bound) == '<p>user1user1user1</p>'
+    assert calls == [1]
+
+
+def test_memo_lazy_view():
+    from kemmering import bind, tag
+
+    calls = []
+    user = _memo_counter(calls, ['user_id'])
+    template = tag('p', title=user)(tag('b')(user))
+    bound = bind(template, {'user_id': 1}, lazy=True)
+    assert STR(bound) == '<p title="user1"><b>user1</b></p>'
+    assert calls == [1]
+
+
+def _lazy_counter(calls, name, value):
+    from kemmering import lazy
+
+    def fetch():
+        calls.append(name)
+        return value
+    return lazy(fetch)
+
+
+def test_lazy():
+    from kemmering import (
+        bind, cond, format_context, from_context, in_context, loop, render,
+        stream, tag)
+
+    template = tag('doc')(
+        cond('show', tag('p')(from_context('a'), format_context('{a}{b}'))),
+        in_context(['c', 'd']),
+        loop('i', 'items', tag('li')(from_context('i'), from_context('a'))),
+    )
+    expected = ('<doc><p>AAB</p>D<li>1A</li><li>2A</li></doc>')
+    for realize in (
+            lambda context: STR(bind(template, context)),
+            lambda context: render(template, context),
+            lambda context: ''.join(stream(template, context))):
+        calls = []
+        context = {
+            'show': _lazy_counter(calls, 'show', True),
+            'a': _lazy_counter(calls, 'a', 'A'),
+            'b': _lazy_counter(calls, 'b', 'B'),
+            'c': _lazy_counter(calls, 'c', {
+                'd': _lazy_counter(calls, 'd', 'D')}),
+            'items': _lazy_counter(calls, 'items', ['1', '2']),
+        }
+        assert realize(context) == expected
+        assert calls == ['show', 'a', 'b', 'c', 'd', 'items']
+
+
+def test_lazy_not_used():
+    from kemmering import bind, cond, from_context, tag
+
+    calls = []
+    template = tag('p')(cond('show', from_context('a')))
+    context = {'show': False, 'a': _lazy_counter(calls, 'a', 'A')}
+    assert STR(bind(template, context)) == '<p></p>'
+    assert calls == []
+
+
+def test_lazy_each_render():
+    from kemmering import from_context, render, tag
+
+    calls = []
+    template = tag('p')(from_context('a'))
+    context = {'a': _lazy_counter(calls, 'a', 'A')}
+    assert render(template, context) == '<p>A</p>'
+    assert render(template, context) == '<p>A</p>'
+    assert calls == ['a', 'a']
+
+
+def test_lazy_streamed_loop():
+    from kemmering import bind, from_context, loop, tag
+
+    calls = []
+    template = tag('p')(
+        from_context('a'), loop('i', 'items', from_context('a'), stream=True))
+    bound = bind(template, {
+        'a': _lazy_counter(calls, 'a', 'A'),
+        'items': _lazy_counter(calls, 'items', [1, 2])})
+    assert calls == ['a']
+    assert STR(bound) == '<p>AAA</p>'
+    assert calls == ['a', 'items']
+
+
+def test_lazy_missing():
+    from kemmering import bind, format_context, loop, tag
+
+    with pytest.raises(KeyError):
+        bind(format_context('{a}'), {})
+    with pytest.raises(KeyError):
+        bind(loop('i', 'items', tag('br/')), {})
+
+
+def test_lazy_in_defer():
+    from kemmering import bind, defer, lazy
+
+    def f(context):
+        return context['a']() + context['a']()
+
+    calls = []
+    context = {'a': _lazy_counter(calls, 'a', 'A')}
+    assert bind(defer(f), context) == 'AA'
+    assert calls == ['a']
+    assert context['a']() == 'A'
+    assert calls == ['a', 'a']
+    assert REPR(lazy(f)) == 'lazy(f)'
+
+
+def test_attribute_context():
+    import collections
+    from kemmering import (
+        bind, cond, format_context, from_context, in_context, loop, render,
+        tag)
+
+    Row = collections.namedtuple('Row', ('name', 'admin'))
+
+    class Page(object):
+        __slots__ = ('title', 'rows')
+
+        def __init__(self, title, rows):
+            self.title = title
+            self.rows = rows
+
+    template = tag('doc')(
+        tag('h1')(from_context('title'), from_context('missing', '!')),
+        loop('row', 'rows', tag('p')(
+            in_context(['row', 'name']),
+            cond(lambda c: c.row.admin, '*'),
+            format_context(' {title}'))),
+    )
+    page = Page('T', [Row('a', True), Row('b', False)])
+    expected = '<doc><h1>T!</h1><p>a* T</p><p>b T</p></doc>'
+    assert STR(bind(template, page)) == expected
+    assert render(template, page) == expected
+
+
+def test_attribute_context_missing():
+    from kemmering import bind, format_context, from_context
+
+    with pytest.raises(KeyError):
+        bind(from_context('a'), object())
+    with pytest.raises(KeyError):
+        bind(format_context('{a}'), object())
+
+
+def test_attribute_context_with_get():
+    from kemmering import bind, from_context, tag
+
+    class Model(object):
+        name = 'Fred'
+
+        def get(self):
+            return self
+
+    assert STR(bind(tag('a')(from_context('name')), Model())) == (
+        '<a>Fred</a>')
+
+
+def test_chained_context():
+    from kemmering import bind, defer, loop, notag
+
+    class Context(object):
+        a = 'A'
+
+    def f(context):
+        return context['i'] + context.a + context.get('b', 'B')
+
+    bound = bind(loop('i', lambda c: ['1', '2'], defer(f)), Context())
+    assert STR(bound) == '1AB2AB'
+    bound = bind(loop('i', lambda c: ['1'], loop(
+        'j', lambda c: ['2'], defer(lambda c: c.i + c.j + c.a))), Context())
+    assert STR(bound) == '12A'
+
+    def missing_item(context):
+        return context['b']
+
+    def missing_attr(context):
+        return context.b
+
+    with pytest.raises(KeyError):
+        bind(loop('i', lambda c: ['1'], defer(missing_item)), Context())
+    with pytest.raises(AttributeError):
+        bind(loop('i', lambda c: ['1'], defer(missing_attr)), Context())
+    assert isinstance(bind(loop('i', lambda c: [], 'x'), Context()), notag)
+
+    chained = loop('i', 'x', 'x')._subcontext(Context(), '1')
+    assert not hasattr(chained, '__deepcopy__')
+
+
+def test_register_accessor():
+    from kemmering import bind, from_context, loop, register_accessor
+
+    class Record(object):
+        def __init__(self, **fields):
+            self.fields = fields
+
+    class SubRecord(Record):
+        pass
+
+    register_accessor(Record, lambda r, k, d: r.fields.get(k, d))
+    try:
+        template = loop('i', 'items', from_context('i'))
+        assert STR(bind(template, SubRecord(items=['a', 'b']))) == 'ab'
+    finally:
+        from kemmering import _accessors, _resolved
+        del _accessors[Record]
+        _resolved.clear()
+
+
+def _budget_template():
+    from kemmering import defer, from_context, loop, tag
+
+    def slow(context):
+        import time
+        time.sleep(context.get('delay', 0))
+        return context['i']
+
+    return tag('html')(tag('body')(
+        tag('h1')(from_context('title')),
+        tag('ul')(loop('i', 'items', tag('li')(defer(slow)))),
+    ))
+
+
+def test_render_max_size():
+    from kemmering import BudgetExceeded, render, stream
+
+    template = _budget_template()
+    context = {'title': 'x', 'items': [str(i) for i in range(100)]}
+    assert render(template, context, max_size=10000) == render(
+        template, context)
+    with pytest.raises(BudgetExceeded) as e:
+        render(template, context, max_size=100)
+    assert e.value.path == ['html', 'body', 'ul']
+    assert STR(e.value) == (
+        'Output is larger than 100 characters at html/body/ul')
+    chunks = stream(template, context, max_size=100)
+    with pytest.raises(BudgetExceeded):
+        for chunk in chunks:
+            pass
+
+
+def test_render_max_size_end():
+    from kemmering import BudgetExceeded, render, tag
+
+    with pytest.raises(BudgetExceeded) as e:
+        render(tag('p')('x' * 100), {}, max_size=10)
+    assert e.value.path == []
+    assert STR(e.value) == 'Output is larger than 10 characters'
+
+
+def test_render_timeout():
+    from kemmering import BudgetExceeded, bind, render
+
+    template = _budget_template()
+    context = {'title': 'x', 'items': [str(i) for i in range(100)],
+               'delay': 0.01}
+    with pytest.raises(BudgetExceeded) as e:
+        render(template, context, timeout=0.05)
+    assert e.value.path == ['html', 'body', 'ul']
+    assert STR(e.value).startswith('Took longer than 0.05 seconds at ')
+    with pytest.raises(BudgetExceeded) as e:
+        bind(template, context, timeout=0.05)
+    assert e.value.path == ['html', 'body', 'ul']
+    context['items'] = ['a']
+    assert render(template, context, timeout=10) == STR(
+        bind(template, context, timeout=10))
+
+
+def test_bind_timeout_streamed_loop():
+    from kemmering import BudgetExceeded, bind, loop, tag
+
+    template = tag('ul')(loop('i', 'items', tag('li'), stream=True))
+    bound = bind(template, {'items': range(1000)}, timeout=0)
+    with pytest.raises(BudgetExceeded) as e:
+        STR(bound)
+    assert e.value.path == []
+
+
+def test_flush():
+    from kemmering import FLUSH, bind, defer, flush, from_context, render
+    from kemmering import stream, tag
+
+    calls = []
+
+    def body(context):
+        calls.append(1)
+        return 'b'
+
+    template = tag('html')(tag('head')('a'), flush(), tag('body')(
+        from_context('x'), tag('p')(defer(body))))
+    chunks = stream(template, {'x': 'y'})
+    assert next(chunks) == '<html><head>a</head>'
+    assert next(chunks) is FLUSH
+    assert calls == []
+    assert list(chunks) == ['<body>', 'y', '<p>', 'b', '</p>', '</body>',
+                            '</html>']
+    assert calls == [1]
+    expected = '<html><head>a</head><body>y<p>b</p></body></html>'
+    assert render(template, {'x': 'y'}) == expected
+    bound = bind(template, {'x': 'y'})
+    assert STR(bound) == expected
+    assert FLUSH in list(stream(bound, {}))
+    assert repr(flush()) == 'flush()'
+
+    view = bind(tag('div')(tag('head')('a'), flush(), from_context('x')),
+                {'x': 'y'}, lazy=True)
+    assert FLUSH in list(stream(tag('html')(view), {}))
+    view = bind(tag('div')(from_context('x')), {'x': 'y'}, lazy=True)
+    assert list(stream(tag('html')(view), {})) == [
+        '<html><div>y</div></html>']
+
+
+def _select_template():
+    from kemmering import cond, defer, from_context, loop, tag
+
+    def boom(context):
+        raise AssertionError('realized outside of the selection')
+
+    return tag('html')(
+        tag('head')(tag('title')(defer(boom))),
+        tag('body', class_='page')(
+            tag('div', id='nav', class_='box')(defer(boom)),
+            tag('div', id='cart', class_='box wide')(
+                tag('ul')(loop('i', 'items', tag('li')(from_context('i'))))),
+            tag('p', id=from_context('x'))('a'),
+            cond('x', tag('div', id='hidden')),
+        ))
+
+
+def test_select():
+    from kemmering import find, render, stream
+
+    template = _select_template()
+    context = {'items': ['a', 'b']}
+    cart = ('<div id="cart" class="box wide">'
+            '<ul><li>a</li><li>b</li></ul></div>')
+    assert render(template, context, select='#cart') == cart
+    assert ''.join(stream(template, context, select='#cart')) == cart
+    assert render(template, context, select='ul') == (
+        '<ul><li>a</li><li>b</li></ul>')
+    assert render(template, context, select='.wide') == cart
+    assert render(template, context, select='div.box.wide') == cart
+    assert render(template, context, select='div#cart.box') == cart
+    assert find(template, 'div') is template.children[1].children[0]
+    assert find(template, '.page') is template.children[1]
+    assert find(template, 'html') is template
+    for selector in ('#nope', 'span', '.nope', 'ul#cart', '#cart.nope',
+                     '#nav.wide', '#hidden'):
+        with pytest.raises(KeyError):
+            find(template, selector)
+    for selector in ('', 'div > p', '#', 'a[b]', '*'):
+        with pytest.raises(ValueError):
+            find(template, selector)
+
+
+def test_select_index_invalidated():
+    from kemmering import find, freeze, render, tag
+
+    template = _select_template()
+    body = template.children[1]
+    assert find(template, 'div') is body.children[0]
+    assert '_index' in template.__dict__
+    with pytest.raises(KeyError):
+        find(template, '#new')
+    body.children[1].children[0](tag('b', id='new')('x'))
+    assert '_index' not in template.__dict__
+    assert render(template, {}, select='#new') == '<b id="new">x</b>'
+    frozen = freeze(tag('a')(tag('b', id='c')('d')))
+    assert render(frozen, {}, select='#c') == '<b id="c">d</b>'
+    assert find(frozen.children[0], 'b') is frozen.children[0]
+
+
+def test_select_index_shared_subtree():
+    from kemmering import find, tag
+
+    div = tag('div')
+    t1 = tag('body')(div)
+    t2 = tag('body')(div)
+    assert find(t1, 'div') is div
+    assert find(t2, 'div') is div
+    div(tag('b', id='new'))
+    assert find(t1, '#new') is div.children[0]
+    assert find(t2, '#new') is div.children[0]
+    div.attrs['id'] = 'd'
+    assert find(t1, '#d') is div
+    div.children[0].attrs['class_'] = 'c'
+    assert find(t2, '.c') is div.children[0]
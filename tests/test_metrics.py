@@ -0,0 +1,120 @@
+import pytest
+
+
+@pytest.fixture
+def sink():
+    from kemmering import metrics
+    sink = metrics.enable()
+    yield sink
+    metrics.disable()
+
+
+def _template():
+    from kemmering import from_context, loop, tag
+    from kemmering.metrics import named
+
+    item = named('item', tag('li')(from_context('i')))
+    return named('list', tag('ul')(loop('i', 'items', item)))
+
+
+def test_named_disabled():
+    from kemmering import bind, render, tag
+    from kemmering.metrics import named
+
+    template = _template()
+    context = {'items': ['a', 'b']}
+    assert render(template, context) == '<ul><li>a</li><li>b</li></ul>'
+    assert str(bind(template, context)) == '<ul><li>a</li><li>b</li></ul>'
+    assert repr(named('a', tag('b'))) == "named('a', tag('b'))"
+    assert str(tag('a')(named('b', tag('c')))) == '<a><c></c></a>'
+
+
+def test_named_stream(sink):
+    from kemmering import render, stream
+
+    template = _template()
+    context = {'items': ['a', 'b']}
+    assert render(template, context) == '<ul><li>a</li><li>b</li></ul>'
+    assert ''.join(stream(template, context)) == (
+        '<ul><li>a</li><li>b</li></ul>')
+    assert sink.count('list', 'stream') == 2
+    assert sink.count('item', 'stream') == 4
+    assert sink.size('list', 'stream') == 58
+    assert sink.size('item', 'stream') == 40
+    assert sink.errors('list', 'stream') == 0
+    assert sink.count('list', 'bind') == 0
+
+
+def test_named_bind(sink):
+    from kemmering import bind
+
+    template = _template()
+    assert str(bind(template, {'items': ['a', 'b']})) == (
+        '<ul><li>a</li><li>b</li></ul>')
+    assert sink.count('list', 'bind') == 1
+    assert sink.count('item', 'bind') == 2
+    assert sink.size('list', 'bind') == 0
+
+
+def test_named_errors(sink):
+    from kemmering import bind, render
+
+    template = _template()
+    with pytest.raises(KeyError):
+        render(template, {})
+    with pytest.raises(KeyError):
+        bind(template, {})
+    assert sink.errors('list', 'stream') == 1
+    assert sink.errors('list', 'bind') == 1
+    assert sink.errors('item', 'bind') == 0
+
+
+def test_registry_dump():
+    from kemmering.metrics import registry
+
+    sink = registry(buckets=(1.0, 0.1))
+    sink.observe('a"b', 'stream', 0.05, 10, False)
+    sink.observe('a"b', 'stream', 0.5, 5, True)
+    sink.observe('a"b', 'stream', 5.0, 5, False)
+    sink.observe('c', 'bind', 0.05, None, False)
+    assert sink.dump() == '\n'.join((
+        '# HELP kemmering_renders_total '
+        'Number of times a named template was realized.',
+        '# TYPE kemmering_renders_total counter',
+        'kemmering_renders_total{template="a\\"b",mode="stream"} 3',
+        'kemmering_renders_total{template="c",mode="bind"} 1',
+        '# HELP kemmering_render_errors_total '
+        'Number of times realizing a named template raised an exception.',
+        '# TYPE kemmering_render_errors_total counter',
+        'kemmering_render_errors_total{template="a\\"b",mode="stream"} 1',
+        'kemmering_render_errors_total{template="c",mode="bind"} 0',
+        '# HELP kemmering_render_output_characters_total '
+        'Characters of output produced by a named template.',
+        '# TYPE kemmering_render_output_characters_total counter',
+        'kemmering_render_output_characters_total'
+        '{template="a\\"b",mode="stream"} 20',
+        'kemmering_render_output_characters_total'
+        '{template="c",mode="bind"} 0',
+        '# HELP kemmering_render_seconds '
+        'Time spent realizing a named template.',
+        '# TYPE kemmering_render_seconds histogram',
+        'kemmering_render_seconds_bucket'
+        '{template="a\\"b",mode="stream",le="0.1"} 1',
+        'kemmering_render_seconds_bucket'
+        '{template="a\\"b",mode="stream",le="1.0"} 2',
+        'kemmering_render_seconds_bucket'
+        '{template="a\\"b",mode="stream",le="+Inf"} 3',
+        'kemmering_render_seconds_sum{template="a\\"b",mode="stream"} 5.55',
+        'kemmering_render_seconds_count{template="a\\"b",mode="stream"} 3',
+        'kemmering_render_seconds_bucket'
+        '{template="c",mode="bind",le="0.1"} 1',
+        'kemmering_render_seconds_bucket'
+        '{template="c",mode="bind",le="1.0"} 1',
+        'kemmering_render_seconds_bucket'
+        '{template="c",mode="bind",le="+Inf"} 1',
+        'kemmering_render_seconds_sum{template="c",mode="bind"} 0.05',
+        'kemmering_render_seconds_count{template="c",mode="bind"} 1',
+    )) + '\n'
+    assert sink.count('d', 'bind') == 0
+    assert sink.errors('d', 'bind') == 0
+    assert sink.size('d', 'bind') == 0
@@ -0,0 +1,153 @@
+import pytest
+
+
+def _page():
+    from kemmering import cdata, cond, from_context, loop, switch
+    from kemmering.html import (
+        body, br, div, doc, head, html, li, p, pre, script, style, table,
+        tbody, td, textarea, title, tr, ul)
+    return doc(html()(
+        head()(
+            title()('  The   title  '),
+            style(('a', {'color': 'red', 'margin': '0'}))),
+        body()(
+            div(class_='a b', id='main')(
+                p()('First\n    paragraph'),
+                p()('Second', br()),
+                pre()('  keep\n    this  '),
+                textarea(name='t')('  and\n  this'),
+                script()('var  a = "  b  ";'),
+                cdata('  x  ')),
+            ul()(loop('i', 'items', li()('\n  ', from_context('i'), '\n'))),
+            table()(tbody()(loop('row', 'rows', tr()(
+                loop('cell', 'row', td()(from_context('cell'))))))),
+            cond('footer', p()('  bye  '), p()('  later  ')),
+            switch('status', {'ok': div()('  ok  ')}),
+        )))
+
+
+def _context():
+    return {'items': ['  one  two  ', 'three'],
+            'rows': [['1', '2'], ['3', '4']],
+            'footer': True, 'status': 'ok'}
+
+
+def test_minify():
+    from kemmering import bind, render
+    from kemmering.minify import minify
+
+    template = _page()
+    minified = minify(template)
+    expected = (
+        '<!DOCTYPE html>\n\n'
+        '<html><head><title> The title </title>'
+        '<style>a{color:red;margin:0}</style></head>'
+        '<body><div class="a b" id="main">'
+        '<p>First paragraph</p><p>Second<br/></p>'
+        '<pre>  keep\n    this  </pre>'
+        '<textarea name="t">  and\n  this</textarea>'
+        '<script>var  a = "  b  ";</script>'
+        '<![CDATA[  x  ]]></div>'
+        '<ul><li>  one two  </li><li> three </li></ul>'
+        '<table><tbody><tr><td>1</td><td>2</td></tr>'
+        '<tr><td>3</td><td>4</td></tr></tbody></table>'
+        '<p> bye </p><div> ok </div></body></html>')
+    assert render(minified, _context()) == expected
+    assert str(bind(minified, _context())) == expected
+    assert render(template, _context()) != expected
+    assert len(render(template, _context())) > len(expected)
+
+
+def test_minify_html5():
+    from kemmering import bind, render
+    from kemmering.minify import minify
+
+    minified = minify(_page(), html5=True)
+    expected = (
+        '<!DOCTYPE html>\n\n'
+        '<html><head><title> The title </title>'
+        '<style>a{color:red;margin:0}</style>'
+        '<body><div class="a b" id=main>'
+        '<p>First paragraph<p>Second<br>'
+        '<pre>  keep\n    this  </pre>'
+        '<textarea name=t>  and\n  this</textarea>'
+        '<script>var  a = "  b  ";</script>'
+        '<![CDATA[  x  ]]></div>'
+        '<ul><li>  one two  <li> three </ul>'
+        '<table><tbody><tr><td>1<td>2<tr><td>3<td>4</table>'
+        '<p> bye <div> ok </div></html>')
+    assert render(minified, _context()) == expected
+    assert str(bind(minified, _context())) == expected
+
+
+def test_minify_end_tags():
+    from kemmering import cond, from_context, render, tag
+    from kemmering.html import a, body, dd, dl, dt, head, html, li, p, ul
+    from kemmering.minify import minify
+
+    def check(template, expected, context={}):
+        assert render(minify(template, html5=True), context) == expected
+
+    check(html()(head(), body()), '<html><head><body></html>')
+    check(html()(head(), ' ', body()), '<html><head></head> <body></html>')
+    check(tag('html')(p()('a')), '<html><p>a</html>')
+    check(p()('a'), '<p>a</p>')
+    check(a()(p()('b')), '<a><p>b</p></a>')
+    check(ul()(li()('a'), 'b'), '<ul><li>a</li>b</ul>')
+    check(ul()(li()('a'), from_context('b')), '<ul><li>a</li>c</ul>',
+          {'b': 'c'})
+    check(ul()(li()('a'), cond('b', li()('c'))), '<ul><li>a</ul>')
+    check(ul()(li()('a'), cond('b', li()('c'))), '<ul><li>a<li>c</ul>',
+          {'b': True})
+    check(ul()(li()('a'), cond('b', 'c')), '<ul><li>a</li></ul>')
+    check(dl()(dt()('a'), dd()('b'), dt()('c')),
+          '<dl><dt>a<dd>b<dt>c</dt></dl>')
+    check(tag('div')(tag('hr/', id=''), tag('x/')),
+          '<div><hr id=""><x/></div>')
+
+
+def test_minify_deferred():
+    from kemmering import defer, memo, render
+    from kemmering.html import div, li, p, ul
+    from kemmering.minify import minify
+
+    def items(context):
+        return ul()(li()('  a  '), li()(p()('b')))
+
+    template = minify(div()(defer(items), memo(lambda c: ' x  y ')),
+                      html5=True)
+    assert render(template, {}) == '<div><ul><li> a <li><p>b</ul> x y </div>'
+    assert repr(template.children[0]) == 'minify(defer(items))'
+    with pytest.raises(ValueError):
+        list(template.children[0]._stream())
+
+
+def test_minify_shared_style():
+    from kemmering import loop, render
+    from kemmering.html import div, shared_style
+    from kemmering.minify import minify
+
+    card = div()(shared_style(('.card', {'padding': '1em'})))
+    template = minify(div()(loop('i', 'cards', card)))
+    assert render(template, {'cards': range(2)}) == (
+        '<div><div><style>.card{padding:1em}</style></div><div></div></div>')
+    assert str(template.children[0].template.children[0]) == (
+        '<style>.card{padding:1em}</style>')
+    assert render(card, {}) == (
+        '<div>\n<style>\n  .card {\n    padding: 1em;\n  }\n</style>\n'
+        '</div>')
+
+
+def test_minify_leaves_template():
+    from kemmering import render, tag
+    from kemmering.html import div, pre
+    from kemmering.metrics import named
+    from kemmering.minify import minify
+
+    inner = pre()(tag('b')(' a  b '))
+    template = named('x', div()(inner, '  c  '))
+    minified = minify(template)
+    assert render(minified, {}) == '<div><pre><b> a  b </b></pre> c </div>'
+    assert render(template, {}) == (
+        '<div><pre><b> a  b </b></pre>  c  </div>')
+    assert inner.children[0].parent is inner
@@ -0,0 +1,250 @@
+import io
+
+
+def _template():
+    from kemmering import cond, from_context, loop, tag
+    return tag('doc', id=from_context('id'))(
+        tag('head')(tag('title')('Fish & Chips')),
+        tag('ul')(loop('item', 'items', tag('li')(from_context('item')))),
+        cond('footer', tag('footer')('bye')),
+    )
+
+
+def test_render_bytes():
+    from kemmering import bind
+    from kemmering.output import render_bytes
+    template = _template()
+    context = {'id': 'x', 'items': [u'α', 'b<c'], 'footer': True}
+    expected = u'{}'.format(bind(template, context)).encode('utf-8')
+    assert render_bytes(template, context) == expected
+    assert render_bytes(template, context) == expected
+
+
+def test_render_bytes_encoding():
+    from kemmering.output import render_bytes
+    template = _template()
+    context = {'id': 'x', 'items': [u'éα']}
+    assert render_bytes(template, context, 'latin-1') == (
+        b'<doc id="x"><head><title>Fish &amp; Chips</title></head>'
+        b'<ul><li>\xe9&#945;</li></ul></doc>')
+
+
+def test_render_bytes_bom():
+    from kemmering import render
+    from kemmering.output import render_bytes, stream_bytes
+    template = _template()
+    context = {'id': 'x', 'items': [u'\u00e9\u20ac', 'b'], 'footer': True}
+    expected = render(template, context)
+    for encoding in ('utf-16', 'utf-32', 'utf-8-sig'):
+        for i in range(2):
+            data = render_bytes(template, context, encoding)
+            assert data.decode(encoding) == expected
+            assert data.startswith(u''.encode(encoding))
+    chunks = list(stream_bytes(template, context, 'utf-16'))
+    assert chunks[0] == u''.encode('utf-16')
+    assert b''.join(chunks).decode('utf-16') == expected
+    context['items'] = [u'\u3042', 'b']
+    data = render_bytes(template, context, 'iso-2022-jp')
+    assert data.decode('iso-2022-jp') == render(template, context)
+
+
+def test_render_bytes_out():
+    from kemmering.output import render_bytes
+    out = io.BytesIO()
+    assert render_bytes(_template(), {'id': 'x', 'items': []}, out=out) is (
+        None)
+    assert out.getvalue() == (
+        b'<doc id="x"><head><title>Fish &amp; Chips</title></head>'
+        b'<ul></ul></doc>')
+
+
+def test_stream_bytes_reuses_static_chunks():
+    from kemmering.output import stream_bytes
+    template = _template()
+    context = {'id': 'x', 'items': ['a', 'b']}
+    first = list(stream_bytes(template, context))
+    second = list(stream_bytes(template, context))
+    assert first == second
+    head = b'<head><title>Fish &amp; Chips</title></head>'
+    assert first[1] == head
+    assert first[1] is second[1]
+
+
+def test_stream_bytes_static_template():
+    from kemmering import tag
+    from kemmering.output import stream_bytes
+    template = tag('a')(tag('b/'), 'c')
+    assert list(stream_bytes(template, {})) == [b'<a><b/>c</a>']
+
+
+def test_stream_segments():
+    from kemmering.output import stream_bytes, stream_segments
+    template = _template()
+    context = {'id': 'x', 'items': [str(i) for i in range(10)]}
+    chunks = [chunk for chunk in stream_bytes(template, context) if chunk]
+    batches = list(stream_segments(template, context, limit=4))
+    assert all(0 < len(batch) <= 4 for batch in batches)
+    assert [chunk for batch in batches for chunk in batch] == chunks
+    static = list(stream_segments(template, context))[0][1]
+    assert static is list(stream_segments(template, context))[0][1]
+
+
+def test_send_segments():
+    import socket
+    from kemmering.output import render_bytes, send_segments
+    template = _template()
+    context = {'id': 'x', 'items': [str(i) for i in range(100)]}
+    expected = render_bytes(template, context)
+    a, b = socket.socketpair()
+    try:
+        assert send_segments(a, template, context, limit=8) == len(expected)
+        a.close()
+        received = []
+        while True:
+            data = b.recv(4096)
+            if not data:
+                break
+            received.append(data)
+        assert b''.join(received) == expected
+    finally:
+        a.close()
+        b.close()
+
+
+def test_send_segments_partial():
+    from kemmering.output import render_bytes, send_segments
+
+    class Socket(object):
+        def __init__(self):
+            self.data = []
+
+        def sendmsg(self, buffers):
+            data = b''.join(bytes(buf) for buf in buffers)[:3]
+            self.data.append(data)
+            return len(data)
+
+    template = _template()
+    context = {'id': 'x', 'items': ['a', 'b']}
+    sock = Socket()
+    expected = render_bytes(template, context)
+    assert send_segments(sock, template, context) == len(expected)
+    assert b''.join(sock.data) == expected
+    assert max(map(len, sock.data)) == 3
+
+
+def test_write_segments():
+    import os
+    from kemmering.output import render_bytes, write_segments
+    template = _template()
+    context = {'id': 'x', 'items': ['a', 'b']}
+    expected = render_bytes(template, context)
+    r, w = os.pipe()
+    try:
+        assert write_segments(w, template, context) == len(expected)
+        assert os.read(r, 65536) == expected
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+def test_stream_compressed():
+    import zlib
+    from kemmering.output import render_bytes, stream_compressed
+    template = _template()
+    context = {'id': 'x', 'items': [u'α'] * 100, 'footer': True}
+    expected = render_bytes(template, context)
+    chunks = list(stream_compressed(template, context))
+    assert all(chunks[:-1])
+    assert zlib.decompress(b''.join(chunks), 16 + zlib.MAX_WBITS) == expected
+    decompress = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+    assert [decompress(chunk) for chunk in chunks[:2]] == [
+        b'', b'<doc id="x"><head><title>Fish &amp; Chips</title></head>']
+    chunks = list(stream_compressed(template, context, method='deflate',
+                                    level=9))
+    assert zlib.decompress(b''.join(chunks)) == expected
+
+
+def test_stream_compressed_flush_after():
+    import zlib
+    from kemmering.output import stream_compressed
+    template = _template()
+    context = {'id': 'x', 'items': ['a', 'b']}
+    chunks = list(stream_compressed(template, context, method='deflate',
+                                    flush_after=('li',)))
+    decompress = zlib.decompressobj().decompress
+    assert [decompress(chunk) for chunk in chunks] == [
+        b'', b'<doc id="x"><head><title>Fish &amp; Chips</title></head>'
+        b'<ul><li>a</li>', b'<li>b</li>', b'</ul></doc>']
+    chunks = list(stream_compressed(template, context, flush_after=()))
+    assert len(chunks) == 2
+
+
+def test_stream_compressed_flush_after_bom():
+    import zlib
+    from kemmering.output import stream_compressed
+    template = _template()
+    context = {'id': 'x', 'items': ['a', 'b']}
+    chunks = list(stream_compressed(template, context, encoding='utf-16',
+                                    method='deflate', flush_after=('li',)))
+    decompress = zlib.decompressobj().decompress
+    decoded = [decompress(chunk) for chunk in chunks]
+    assert decoded[2:] == [u'<li>b</li>'.encode('utf-16-le'),
+                           u'</ul></doc>'.encode('utf-16-le')]
+    assert b''.join(decoded).decode('utf-16') == (
+        u'<doc id="x"><head><title>Fish &amp; Chips</title></head>'
+        u'<ul><li>a</li><li>b</li></ul></doc>')
+
+
+def test_stream_compressed_bad_method():
+    import pytest
+    from kemmering.output import stream_compressed
+    with pytest.raises(ValueError):
+        list(stream_compressed(_template(), {}, method='brotli'))
+
+
+def _flush_template():
+    from kemmering import flush, from_context, tag
+    return tag('html')(tag('head')('a'), flush(), tag('body')(
+        from_context('b'), flush(), 'c'))
+
+
+def test_stream_bytes_flush():
+    from kemmering.output import FLUSH_BYTES, stream_bytes
+    chunks = list(stream_bytes(_flush_template(), {'b': 'd'}))
+    assert chunks == [b'<html><head>a</head>', b'', b'<body>', b'd', b'',
+                      b'c</body>', b'</html>']
+    assert chunks[1] is FLUSH_BYTES
+    assert chunks[4] is FLUSH_BYTES
+
+
+def test_render_bytes_flush():
+    from kemmering.output import render_bytes
+
+    class Out(io.BytesIO):
+        def flush(self):
+            flushed.append(self.getvalue())
+
+    flushed = []
+    out = Out()
+    render_bytes(_flush_template(), {'b': 'd'}, out=out)
+    assert flushed == [
+        b'<html><head>a</head>', b'<html><head>a</head><body>d']
+    assert render_bytes(_flush_template(), {'b': 'd'}) == (
+        b'<html><head>a</head><body>dc</body></html>')
+
+
+def test_stream_segments_flush():
+    from kemmering.output import stream_segments
+    assert list(stream_segments(_flush_template(), {'b': 'd'})) == [
+        [b'<html><head>a</head>'], [b'<body>', b'd'],
+        [b'c</body>', b'</html>']]
+
+
+def test_stream_compressed_flush():
+    import zlib
+    from kemmering.output import stream_compressed
+    chunks = list(stream_compressed(_flush_template(), {'b': 'd'},
+                                    method='deflate', flush_after=()))
+    decompress = zlib.decompressobj().decompress
+    assert [decompress(chunk) for chunk in chunks] == [
+        b'', b'<html><head>a</head>', b'<body>d', b'c</body></html>']
@@ -0,0 +1,117 @@
+import io
+
+import pytest
+
+
+def test_writer():
+    from kemmering import bind, cdata, from_context, tag
+    from kemmering.writer import writer
+
+    template = tag('doc', id=from_context('id'))(
+        tag('p', class_='x')('Fish & Chips', tag('br/')),
+        tag('empty/'),
+        cdata('a<b'),
+    )
+    context = {'id': 'a'}
+    out = io.StringIO()
+    with writer(out) as w:
+        with w.tag('doc', id='a'):
+            w.element('p', 'Fish & Chips', tag('br/'), class_='x')
+            with w.tag('empty/'):
+                pass
+            w.cdata('a<b')
+    assert out.getvalue() == u'{}'.format(bind(template, context))
+
+    out = io.StringIO()
+    with writer(out) as w:
+        w.snippet(template, context)
+    assert out.getvalue() == u'{}'.format(bind(template, context))
+
+
+def test_writer_self_closing_with_children():
+    from kemmering.writer import writer
+
+    out = io.StringIO()
+    with writer(out) as w:
+        with w.tag('a/', b=None, c_='d') as inner:
+            assert inner is w
+            with w.tag('e/'):
+                w.text('f<')
+        w.element('g/', 'h')
+        w.element('i/', j='k')
+    assert out.getvalue() == '<a c="d"><e>f&lt;</e></a><g>h</g><i j="k"/>'
+
+
+def test_writer_buffering():
+    from kemmering.writer import writer
+
+    out = io.StringIO()
+    w = writer(out, buffer_size=10)
+    w.text('abc')
+    assert out.getvalue() == ''
+    w.element('def', 'ghi')
+    assert out.getvalue() == 'abc<def>ghi'
+    w.text('j')
+    w.flush()
+    assert out.getvalue() == 'abc<def>ghi</def>j'
+    w.flush()
+    assert out.getvalue() == 'abc<def>ghi</def>j'
+
+
+def test_writer_close_pending():
+    from kemmering.writer import writer
+
+    out = io.StringIO()
+    w = writer(out)
+    w.tag('a/').__enter__()
+    w.close()
+    assert out.getvalue() == '<a>'
+
+
+def test_writer_encoding():
+    from kemmering.writer import writer
+
+    out = io.BytesIO()
+    with writer(out, 'latin-1') as w:
+        w.element('a', u'é€')
+    assert out.getvalue() == b'<a>\xe9&#8364;</a>'
+
+
+def test_writer_encoding_bom():
+    from kemmering.writer import writer
+
+    out = io.BytesIO()
+    with writer(out, 'utf-16', buffer_size=4) as w:
+        w.text('abcdef')
+        w.text('ghij')
+        w.flush()
+        w.text(u'\u03b1')
+    assert out.getvalue().decode('utf-16') == u'abcdefghij\u03b1'
+
+
+def test_writer_exception():
+    from kemmering.writer import writer
+
+    out = io.StringIO()
+    with pytest.raises(ValueError):
+        with writer(out) as w:
+            with w.tag('a'):
+                raise ValueError
+    assert out.getvalue() == '<a></a>'
+
+
+def test_writer_flush_marker():
+    from kemmering import flush, from_context, tag
+    from kemmering.writer import writer
+
+    class Out(io.StringIO):
+        def flush(self):
+            flushed.append(self.getvalue())
+
+    flushed = []
+    out = Out()
+    w = writer(out)
+    w.snippet(tag('a')('b', flush(), from_context('c')), {'c': 'd'})
+    assert flushed == ['<a>b']
+    w.snippet(flush())
+    assert flushed == ['<a>b', '<a>bd</a>']